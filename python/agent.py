@@ -1,15 +1,17 @@
+import asyncio
 import subprocess
 import datetime
 import threading
 import typing
-import socket
 import time
 import json
+import numbers
 from dataclasses import dataclass
-from abc import ABC, abstractmethod
 import traceback
-from contextlib import contextmanager
-from func_timeout import func_timeout, FunctionTimedOut
+from execution import DeadlineExecutor, DeadlineExceeded
+from transport import MessageReader, connect
+from game_data import SnapshotData, RecordPool, Subscription, Command, MoveCommand, ShootCommand, PlanCommand, InvalidCommand, Strategy, strategy_step, setup_strategy
+from codec import JSON_PROTOCOL, SHARED_MEMORY_PROTOCOL, make_codec
 
 JAR_FILE = 'challenge.jar'
 
@@ -19,80 +21,77 @@ BLUE_TEAM = 0
 RED_USERNAME = 'player_1'
 RED_TEAM = 1
 
+# Printed by the server once the agents can connect, followed by its address
+SERVER_READY_PREFIX = 'AI server ready on '
 
-def challenge_thread_work(jvm_path: str, file: str = f'{str(datetime.datetime.now())}.hackathon',
- game_time: float = 60.0, ai_time: float = 150.0, commands_per_second: int = 4, port: int = 2049):
-	current_datetime = datetime.datetime.now()
-	process_result = subprocess.run([jvm_path, '-jar', '--illegal-access=warn', JAR_FILE, '-m', 'windowless',
-	 '-f', file, '-t', str(game_time), '-a', str(ai_time), '-c', str(commands_per_second), '-p', str(port)])
-	print(f'Challenge process finished, returned code: {process_result.returncode}')
+class ServerReadiness:
+	'''Set by challenge_thread_work once the server listens, along with the port it bound (the server binds a
+	free port when asked for the port 0). Also set when the server exits before listening, without address:
+	listening then tells that the agents have no server to connect to.'''
 
+	def __init__(self):
+		self._event = threading.Event()
+		self.address = None
+		self.port = None
 
-@dataclass
-class PlayerData:
-	'''Structure containing the position (x, y, z), speed (dx, dy, dz), health (float), 
-	team (integer) and score (float, in seconds) of a player.'''
-	position: typing.Tuple[float, float, float]
-	speed: typing.Tuple[float, float, float]
-	health: float
-	team: int
-	score: float
+	def set(self, address: str = None):
+		# The address is "port <port>" or "socket <path>"
+		if address is not None:
+			self.address = address
+			if address.startswith('port '):
+				self.port = int(address[len('port '):])
+		self._event.set()
 
-@dataclass
-class ProjectileData:
-	'''Structure containing the position (x, y, z) and speed (dx, dy, dz) of a projectile.'''
-	position: typing.Tuple[float, float, float]
-	speed: typing.Tuple[float, float]
+	@property
+	def listening(self) -> bool:
+		return self.address is not None
 
-@dataclass
-class SnapshotData:
-	'''Structure containing the PlayerData of the controlled player and the other players,
-	as well as the ProjectileData of all projectiles'''
-	controlled_player: PlayerData
-	other_players: typing.List[PlayerData]
-	projectiles: typing.List[ProjectileData]
-
-
-@dataclass
-class Command(ABC, json.JSONEncoder):
-	'''Base class for all the commands'''
-	command_type: str
+	def wait(self, timeout: float = None) -> bool:
+		return self._event.wait(timeout)
 
-@dataclass
-class MoveCommand(Command):
-	'''Asks the player to move. The direction will be normalized inside the game server 
-	so there is no need to have a norm higher than 1 ;)
-	Giving a move direction with a norm equal to 0 will put the character on IDLE state.
-	'''
-	move_direction: typing.Tuple[float, float, float]
-	
-	def __init__(self, move_direction):
-		self.command_type = 'MOVE'
-		self.move_direction = move_direction
 
-@dataclass
-class ShootCommand(Command):
-	'''
-	Asks the player where to shoot. The angle needs to be given in degrees and are directed
-	counterclockwise between 0 and 360 deg.
-	'''
-	shoot_angle: float
+# Budget of the setup of a strategy, in seconds, not counted in the ai_time
+DEFAULT_SETUP_TIME = 10.0
 
-	def __init__(self, shoot_angle):
-		self.command_type = 'SHOOT'
-		self.shoot_angle = shoot_angle
 
+def challenge_arguments(jvm_path: str, file: str, game_time: float = 60.0, ai_time: float = 150.0, commands_per_second: int = 4,
+ port: int = 2049, socket_path: str = None, tick_deadline: float = None, jvm_options: typing.List[str] = None) -> typing.List[str]:
+	'''Command line of the server in windowless mode, the JVM options are given before the jar (see jvm_startup).'''
+	arguments = [jvm_path] + list(jvm_options or []) + ['-jar', '--illegal-access=warn', JAR_FILE, '-m', 'windowless',
+	 '-f', file, '-t', str(game_time), '-a', str(ai_time), '-c', str(commands_per_second), '-p', str(port)]
+	if socket_path is not None:
+		# The agents connect through a unix domain socket instead of the TCP port
+		arguments += ['-s', socket_path]
+	if tick_deadline is not None:
+		# Real-time mode, the game does not wait longer than the deadline (in milliseconds) for the commands
+		arguments += ['-d', str(tick_deadline)]
+	return arguments
 
-@dataclass
-class InvalidCommand(Command):
-	'''
-	Invalid command as a crash test for the server
-	'''
-	whatever_value : str
 
-	def __init__(self, value):
-		self.command_type = 'INVALID'
-		self.whatever_value = value
+def challenge_thread_work(jvm_path: str, file: str = f'{str(datetime.datetime.now())}.hackathon',
+ game_time: float = 60.0, ai_time: float = 150.0, commands_per_second: int = 4, port: int = 2049, socket_path: str = None,
+ tick_deadline: float = None, ready: ServerReadiness = None, jvm_options: typing.List[str] = None):
+	'''Runs the server until the end of the game, its output is printed as it comes. The ready object is set
+	once the server listens for the agents, the port 0 lets the server bind a free port.'''
+	arguments = challenge_arguments(jvm_path, file, game_time, ai_time, commands_per_second, port, socket_path, tick_deadline, jvm_options)
+	try:
+		process = subprocess.Popen(arguments, stdout=subprocess.PIPE, universal_newlines=True)
+	except OSError as exc:
+		# A JVM that cannot be started sets the ready object as well, the round is then aborted
+		print(f'Could not start the challenge process: {exc}')
+		if ready is not None:
+			ready.set()
+		return
+	try:
+		for line in process.stdout:
+			print(line, end='')
+			if ready is not None and line.startswith(SERVER_READY_PREFIX):
+				ready.set(line[len(SERVER_READY_PREFIX):].strip().rstrip('.'))
+		process.wait()
+	finally:
+		if ready is not None:
+			ready.set()
+	print(f'Challenge process finished, returned code: {process.returncode}')
 
 
 @dataclass
@@ -105,19 +104,116 @@ class AgentResult:
 	error_message: str
 	blame: str
 
+
+class _LatestMessage:
+	'''Most recent message received by the pipelined loop of an agent. A snapshot replaces the snapshot
+	that was not taken yet, the messages ending the game are never replaced.'''
+
+	def __init__(self):
+		self._condition = threading.Condition()
+		self._message = None
+		self._final = False
+		self.skipped_snapshots = 0
+
+	def put(self, message: typing.Tuple[str, typing.Any], final: bool = False):
+		with self._condition:
+			if self._final:
+				return
+			if self._message is not None and not final:
+				self.skipped_snapshots += 1
+			self._message = message
+			self._final = final
+			self._condition.notify()
+
+	def take(self) -> typing.Tuple[str, typing.Any]:
+		with self._condition:
+			while self._message is None:
+				self._condition.wait()
+			message = self._message
+			if not self._final:
+				self._message = None
+			return message
+
+
+class _CommandRequest:
+	'''Command asked to the AI of an agent, shared by the threaded, async and session agents. The block asking
+	the command sets up the strategy first when setup_pending, then gives the command and the time the AI took
+	to answer, deducted from the remaining time of the agent. The command is checked, and a timeout or an
+	exception inside the block gives an InvalidCommand instead, which aborts the game.'''
+
+	def __init__(self, agent: 'AIAgent'):
+		self._agent = agent
+		self.command = None
+
+	def setup_pending(self) -> bool:
+		'''Whether the strategy has to be set up before its first step, the setup is only attempted once.
+		It has its own budget, it is not counted in the remaining time of the AI.'''
+		pending = self._agent._setup_pending
+		self._agent._setup_pending = False
+		return pending
+
+	def set_up(self):
+		self._agent._strategy_set_up = True
+
+	def answer(self, command: Command, elapsed_seconds: float):
+		self._agent._remaining_time -= elapsed_seconds
+		self._agent._check_command(command)
+		self.command = command
+
+	def __enter__(self) -> '_CommandRequest':
+		return self
+
+	def __exit__(self, exc_type, exc, exc_traceback) -> bool:
+		if exc_type is None:
+			return False
+		if issubclass(exc_type, (DeadlineExceeded, asyncio.TimeoutError)):
+			self.command = self._agent._timeout_command()
+		elif issubclass(exc_type, Exception):
+			self.command = self._agent._error_command(exc)
+		else:
+			return False
+		return True
+
+
 class AIAgent:
 
-	def __init__(self, username : str, team: int, ai: typing.Callable[[], str], data: typing.Dict = None, ai_time: float = 150.0, address: str = '127.0.0.1', port: int = 2049):
+	def __init__(self, username : str, team: int, ai: typing.Union[typing.Callable[[], str], Strategy], data: typing.Dict = None, ai_time: float = 150.0, address: str = '127.0.0.1', port: int = 2049,
+	  protocol: str = JSON_PROTOCOL, pooled_records: bool = False, socket_path: str = None, subscription: Subscription = None,
+	  pipelined: bool = False, setup_time: float = DEFAULT_SETUP_TIME):
 		self.username = username
 		self.team = team
+		if isinstance(ai, Strategy):
+			# The strategy is run by strategy_step as the data of the agent, its state lives in its attributes
+			if data is not None:
+				raise ValueError('A strategy keeps its state in its attributes, it cannot be given data.')
+			ai, data = strategy_step, ai
 		self.ai = ai
 		self._remaining_time = ai_time
 		self._port = port
 		self._address = address
+		self._socket_path = socket_path
 		self._socket = None
+		self._reader = None
 		self._thread = None
+		self._executor = DeadlineExecutor(f'{username}-ai')
+		self._protocol = protocol
+		# Subset of the snapshots sent by the server, everything is sent by default
+		self._subscription = subscription
+		# The records given to the AI are reused two snapshots later when pooled, see RecordPool
+		self._record_pool = RecordPool() if pooled_records else None
+		self._codec = make_codec(JSON_PROTOCOL, pool=self._record_pool)
+		# Receives the messages while the AI computes and answers the most recent snapshot, see _play_pipelined
+		self._pipelined = pipelined
+		if pipelined and pooled_records:
+			raise ValueError('The pooled records are recycled by the receiving thread, they cannot be used by a pipelined agent.')
+		if pipelined and protocol == SHARED_MEMORY_PROTOCOL:
+			raise ValueError('The shared memory slots are rewritten by the server while the AI computes, they cannot be used by a pipelined agent.')
 
 		self._data = data
+		# The strategy is set up with the first snapshot, before its first step
+		self._setup_time = setup_time
+		self._setup_pending = isinstance(data, Strategy)
+		self._strategy_set_up = False
 
 		self.results = None
 		self.aborted = False
@@ -125,11 +221,32 @@ class AIAgent:
 		self.abort_blame = None
 
 	def _connect(self):
-		self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		self._socket.connect((self._address, self._port))
+		self._socket = connect(self._address, self._port, self._socket_path)
+		self._reader = MessageReader(self._socket)
 		# Sends the username and the team
 		self._send_message(self.username)
-		self._send_message(str(self.team))
+		self._send_message(self._handshake_line())
+		if self._negotiates():
+			self._accept_handshake(self._reader.read_line())
+
+	def _negotiates(self) -> bool:
+		'''Whether the agent sends a handshake document, the server then answers with the accepted protocol.'''
+		return self._protocol != JSON_PROTOCOL or self._subscription is not None
+
+	def _handshake_line(self) -> str:
+		'''Legacy agents only send their team, the agents asking for another protocol or for a subset of the
+		snapshots send a handshake document.'''
+		if not self._negotiates():
+			return str(self.team)
+		handshake = {'team': self.team, 'protocol': self._protocol}
+		if self._subscription is not None:
+			handshake['subscription'] = self._subscription.to_dict()
+		return json.dumps(handshake)
+
+	def _accept_handshake(self, answer: bytes):
+		# The server answers with the protocol it accepted
+		answer = json.loads(answer)
+		self._codec = make_codec(answer['protocol'], pool=self._record_pool, **answer.get('options') or {})
 
 	def _send_message(self, message: str):
 		# Checking if there is a \n at the end of the string
@@ -138,77 +255,96 @@ class AIAgent:
 		self._socket.sendall(message.encode('UTF-8'))
 
 
-	def _receive_message(self) -> typing.Dict:
-		message = self._socket.recv(1024).decode('UTF-8')
-		parsed_message = json.loads(message)
-		return parsed_message
+	def _receive_message(self) -> typing.Tuple[str, typing.Any]:
+		return self._codec.read_message(self._reader)
 
 	@staticmethod
-	def _parse_player_data(player_data: typing.Dict) -> PlayerData:
-		player_position = (float(player_data['pos']['x']), 
-									  float(player_data['pos']['y']),
-									  float(player_data['pos']['z']))
-		player_speed = (float(player_data['speed']['x']),
-								   float(player_data['speed']['y']),
-								   float(player_data['speed']['z']))
-		player_health = float(player_data['health'])
-		player_team = int(player_data['team'])
-		player_score = float(player_data['score'])
-		return PlayerData(player_position, player_speed, player_health, player_team, player_score)
+	def _check_values(command: Command):
+		# The move directions are three numbers and the shoot angles a number (NumPy arrays and scalars included)
+		if type(command) is MoveCommand:
+			try:
+				direction = tuple(command.move_direction)
+			except TypeError:
+				direction = ()
+			if len(direction) != 3 or not all(isinstance(value, numbers.Real) for value in direction):
+				raise Exception(f'Invalid move direction returned by ai, expected 3 numbers: {command.move_direction!r}')
+		elif type(command) is ShootCommand:
+			if not isinstance(command.shoot_angle, numbers.Real):
+				raise Exception(f'Invalid shoot angle returned by ai, expected a number: {command.shoot_angle!r}')
 
 	@staticmethod
-	def _parse_projectile_data(projectile_data: typing.Dict) -> ProjectileData:
-		projectile_position = (float(projectile_data['pos']['x']),
-							   float(projectile_data['pos']['y']),
-							   float(projectile_data['pos']['z']))
-		projectile_speed =    (float(projectile_data['speed']['x']),
-							   float(projectile_data['speed']['y']),
-							   float(projectile_data['speed']['z']))
-		return ProjectileData(projectile_position, projectile_speed)
-
-	def _send_command(self, snapshot: typing.Dict):
-		# Parses the message
-		controlled_player_data = snapshot['controlledPlayer']
-		controlled_player = self._parse_player_data(controlled_player_data)
-		other_players_data = snapshot['otherPlayers']
-		
-		other_players = []
-		for player_data in other_players_data:
-			other_players.append(self._parse_player_data(player_data))
-
-		projectiles = []
-		projectiles_data = snapshot['projectiles']
-		for projectile_data in projectiles_data:
-			projectiles.append(self._parse_projectile_data(projectile_data))
-
-		snapshot = SnapshotData(controlled_player, other_players, projectiles)
+	def _check_command(command: Command):
+		if (type(command) not in [ShootCommand, MoveCommand, PlanCommand, InvalidCommand]):
+			raise Exception(f'Invalid command type returned by ai: {type(command)}')
+		if type(command) is PlanCommand:
+			if len(command.steps) == 0:
+				raise Exception('Empty plan returned by ai.')
+			for ticks, step_command in command.steps:
+				if type(ticks) is not int or ticks < 1:
+					raise Exception(f'Invalid number of ticks in plan step: {ticks}')
+				if type(step_command) not in [ShootCommand, MoveCommand]:
+					raise Exception(f'Invalid command type in plan step: {type(step_command)}')
+				AIAgent._check_values(step_command)
+		else:
+			AIAgent._check_values(command)
 
-		# Asks for the command to the AI
+	@staticmethod
+	def _timeout_command() -> Command:
+		print(f'Agent timed out inside AI function. Sending an invalid command to abort the game.')
+		return InvalidCommand(f'Agent timed out during AI function.')
+
+	@staticmethod
+	def _error_command(exc: Exception) -> Command:
+		# In case there is problem inside the function coded by the participants
+		print(f'Exception during the AI function:\n\t{exc}\nSending an invalid command to abort the game.')
+		traceback.print_exc()
+		return InvalidCommand(f'Exception during the ai function:\n{exc}')
+
+	def _call_ai(self, snapshot: SnapshotData) -> Command:
+		return self._executor.call(self._remaining_time, self.ai, (snapshot, self._data))
+
+	def _setup_strategy(self, snapshot: SnapshotData):
+		self._executor.call(self._setup_time, setup_strategy, (snapshot, self._data))
+
+	def _teardown_strategy(self):
+		if not self._strategy_set_up:
+			return
 		try:
-			begin = datetime.datetime.now()
-			
-			command = func_timeout(self._remaining_time, self.ai, args=(snapshot, self._data))
-			
-			end = datetime.datetime.now()
-			elapsed_seconds = (end - begin).total_seconds()
-			self._remaining_time -= elapsed_seconds
-
-			if (type(command) not in [ShootCommand, MoveCommand, InvalidCommand]):
-				raise Exception(f'Invalid command type returned by ai: {type(command)}')
-				
-		except FunctionTimedOut as exc:
-			print(f'Agent timed out inside AI function. Sending an invalid command to abort the game.')
-			command = InvalidCommand(f'Agent timed out during AI function.')
+			self._data.teardown()
 		except Exception as exc:
-			# In case there is problem inside the function coded by the participants
-			print(f'Exception during the AI function:\n\t{exc}\nSending an invalid command to abort the game.')
+			print(f'Exception during the teardown of the strategy:\n\t{exc}')
 			traceback.print_exc()
-			command = InvalidCommand(f'Exception during the ai function:\n{exc}')
+
+	def _ask_command(self, snapshot: SnapshotData) -> Command:
+		# Asks for the command to the AI
+		with _CommandRequest(self) as request:
+			if request.setup_pending():
+				self._setup_strategy(snapshot)
+				request.set_up()
+
+			begin = time.perf_counter()
+			command = self._call_ai(snapshot)
+			request.answer(command, time.perf_counter() - begin)
+		return request.command
+
+	def _encode_command(self, command: Command, snapshot: typing.Any = None) -> bytes:
+		try:
+			return self._codec.encode_command(command, snapshot)
+		except Exception as exc:
+			# A command the checks let through but the codec cannot encode aborts the game, not the agent
+			print(f'Could not encode the command returned by the AI:\n\t{exc}\nSending an invalid command to abort the game.')
+			return self._codec.encode_command(InvalidCommand(f'Could not encode the command returned by the ai:\n{exc}'))
+
+	def _send_command(self, snapshot: SnapshotData):
+		command = self._ask_command(snapshot)
 
 		# Sends the command to the server
-		serialized_command = json.dumps(command.__dict__)
+		self._socket.sendall(self._encode_command(command, snapshot))
 
-		self._send_message(serialized_command)
+	@property
+	def data(self) -> typing.Dict:
+		'''Data of the agent, as left by the AI function (the strategy, when the agent plays one).'''
+		return self._data
 
 	def _parse_results(self, score_results: typing.Dict) -> AgentResult:
 		for result in score_results:
@@ -227,19 +363,77 @@ class AIAgent:
 	def join(self):
 		self._thread.join()
 
+	def _close_connection(self):
+		# Closing the connection acknowledges the last message, the server waits for it before closing its end
+		if self._socket is not None:
+			self._socket.close()
+
 	def _work(self):
-		self._connect()
+		try:
+			self._connect()
+			self._play()
+		finally:
+			self._close_connection()
+			self._codec.close()
+			self._executor.shutdown()
+			self._teardown_strategy()
+
+	def _on_connection_lost(self, exc: ConnectionError):
+		print(f'Connection lost with the server: {exc}')
+		self.results = self._parse_abortion(str(exc), 'server')
+
+	def _handle_message(self, header: str, message: typing.Any) -> bool:
+		'''Handles a message of the server, returns whether the game is over.'''
+		if header == 'ASK_COMMAND':
+			self._send_command(message)
+		elif header == 'GAME_FINISHED':
+			self.results = self._parse_results(message)
+			return True
+		elif header == 'ABORT':
+			self.results = self._parse_abortion(message['error'], message['blame'])
+			return True
+		return False
+
+	def _play(self):
+		if self._pipelined:
+			self._play_pipelined()
+			return
 		should_stop = False
 		while not should_stop:
-			message = self._receive_message()
-
-			if message['header'] == 'ASK_COMMAND':
-				# TODO remove
-				self._send_command(message['snapshot'])
-			elif message['header'] == 'GAME_FINISHED':
-				self.results = self._parse_results(message['score'])
-				should_stop = True
-			elif message['header'] == 'ABORT':
-				self.results = self._parse_abortion(message['error'], message['blame'])
-				should_stop = True
-
+			try:
+				header, message = self._receive_message()
+			except ConnectionError as exc:
+				self._on_connection_lost(exc)
+				break
+
+			should_stop = self._handle_message(header, message)
+
+	def _receive_forever(self, latest: _LatestMessage):
+		while True:
+			try:
+				header, message = self._receive_message()
+			except ConnectionError as exc:
+				latest.put(('CONNECTION_LOST', exc), final=True)
+				return
+			if header != 'ASK_COMMAND':
+				latest.put((header, message), final=True)
+				return
+			latest.put((header, message))
+
+	def _play_pipelined(self):
+		'''Loop of the agents playing against a server in real-time mode, which keeps sending snapshots without
+		waiting for the commands. The messages are received by another thread while the AI computes, and the AI
+		is always given the most recent snapshot: the snapshots received in the meantime are skipped.'''
+		latest = _LatestMessage()
+		receiver = threading.Thread(target=self._receive_forever, args=(latest,), name=f'{self.username}-receiver', daemon=True)
+		receiver.start()
+		should_stop = False
+		while not should_stop:
+			header, message = latest.take()
+			if header == 'CONNECTION_LOST':
+				self._on_connection_lost(message)
+				break
+			should_stop = self._handle_message(header, message)
+		receiver.join()
+		if latest.skipped_snapshots > 0:
+			print(f'Agent {self.username} skipped {latest.skipped_snapshots} snapshots received while its AI was computing.')
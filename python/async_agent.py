@@ -0,0 +1,113 @@
+import asyncio
+import time
+import typing
+from agent import AIAgent, _CommandRequest
+from transport import AsyncMessageReader, open_connection
+from game_data import SnapshotData, Command, setup_strategy
+
+# Largest line accepted by the stream reader (snapshots with many projectiles are long lines)
+STREAM_LIMIT = 2 ** 22
+
+
+class AsyncAIAgent(AIAgent):
+	'''AIAgent driven by an asyncio event loop instead of a dedicated thread.
+
+	The connection handshake and the messages are the same as the AIAgent. The socket is handled
+	by asyncio streams, so a single event loop can play many agents at once, and the AI function
+	still runs on the persistent worker thread of the agent, awaited with the same deadline.
+	'''
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		if self._pipelined:
+			raise ValueError('AsyncAIAgent does not support the pipelined loop.')
+		self._stream_reader = None
+		self._writer = None
+
+	async def _connect_async(self):
+		self._stream_reader, self._writer = await open_connection(self._address, self._port, self._socket_path, limit=STREAM_LIMIT)
+		self._reader = AsyncMessageReader(self._stream_reader)
+		# Sends the username and the team
+		self._writer.write(f'{self.username}\n{self._handshake_line()}\n'.encode('UTF-8'))
+		await self._writer.drain()
+		if self._negotiates():
+			self._accept_handshake(await self._reader.read_line())
+
+	async def _receive_message_async(self) -> typing.Tuple[str, typing.Any]:
+		if self._codec.length_prefixed:
+			return self._codec.decode_message(await self._reader.read_frame())
+		return self._codec.decode_message(await self._reader.read_line())
+
+	async def _run_async(self, timeout: float, function: typing.Callable, args: typing.Tuple) -> typing.Any:
+		future = self._executor.submit(function, args)
+		try:
+			return await asyncio.wait_for(asyncio.wrap_future(future), max(timeout, 0.0))
+		except asyncio.TimeoutError:
+			self._executor.interrupt()
+			raise
+
+	async def _setup_strategy_async(self, snapshot: SnapshotData):
+		await self._run_async(self._setup_time, setup_strategy, (snapshot, self._data))
+
+	async def _ask_command_async(self, snapshot: SnapshotData) -> Command:
+		# Asks for the command to the AI, without blocking the event loop
+		with _CommandRequest(self) as request:
+			if request.setup_pending():
+				await self._setup_strategy_async(snapshot)
+				request.set_up()
+
+			begin = time.perf_counter()
+			command = await self._run_async(self._remaining_time, self.ai, (snapshot, self._data))
+			request.answer(command, time.perf_counter() - begin)
+		return request.command
+
+	async def _send_command_async(self, snapshot: SnapshotData):
+		command = await self._ask_command_async(snapshot)
+
+		# Sends the command to the server
+		self._writer.write(self._encode_command(command, snapshot))
+		await self._writer.drain()
+
+	async def play(self):
+		'''Connects to the server and plays the game until it is finished or aborted.'''
+		try:
+			await self._connect_async()
+			await self._play_async()
+		finally:
+			self._executor.shutdown()
+			if self._writer is not None:
+				self._writer.close()
+			self._codec.close()
+			self._teardown_strategy()
+
+	async def _play_async(self):
+		should_stop = False
+		while not should_stop:
+			try:
+				header, message = await self._receive_message_async()
+			except ConnectionError as exc:
+				print(f'Connection lost with the server: {exc}')
+				self.results = self._parse_abortion(str(exc), 'server')
+				break
+
+			if header == 'ASK_COMMAND':
+				await self._send_command_async(message)
+			elif header == 'GAME_FINISHED':
+				self.results = self._parse_results(message)
+				should_stop = True
+			elif header == 'ABORT':
+				self.results = self._parse_abortion(message['error'], message['blame'])
+				should_stop = True
+
+	def start(self):
+		raise TypeError('AsyncAIAgent is driven by an event loop, await play() or use run_agents().')
+
+
+async def play_agents(agents: typing.Iterable[AsyncAIAgent]):
+	'''Plays all the agents concurrently on the running event loop.'''
+	await asyncio.gather(*(agent.play() for agent in agents))
+
+
+def run_agents(agents: typing.Iterable[AsyncAIAgent]):
+	'''Plays all the agents concurrently on a new event loop, and returns once every game is over.'''
+	asyncio.run(play_agents(agents))
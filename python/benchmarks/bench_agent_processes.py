@@ -0,0 +1,67 @@
+'''Benchmark of two CPU-bound agents playing against each other.
+
+Each agent calls its AI function from its own thread, as GameSimulation does. With the DeadlineExecutor,
+the AI functions of both agents run inside the round process and serialize on the GIL, so each one is
+charged for the time the other one holds it. With the ProcessExecutor, each AI function runs inside its
+own worker process. The reported time per tick is the time charged to an agent's ai_time budget.
+'''
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from execution import DeadlineExecutor, ProcessExecutor
+from game_data import MoveCommand
+
+NB_TICKS = 50
+AI_TIME = 150.0
+# Iterations of pure python work done by the AI on each tick
+AI_WORK = 200000
+
+
+def busy_ai(gamestate=None, my_data=None):
+	total = 0
+	for i in range(AI_WORK):
+		total += i * i
+	return MoveCommand((0.0, 1.0, 0.0))
+
+
+def play(call, costs: list):
+	begin = time.perf_counter()
+	for _ in range(NB_TICKS):
+		call()
+	costs.append((time.perf_counter() - begin) / NB_TICKS * 1e3)
+
+
+def measure(calls) -> float:
+	'''Plays the agents concurrently and returns the average time charged per tick, in milliseconds.'''
+	costs = []
+	threads = [threading.Thread(target=play, args=(call, costs)) for call in calls]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	return sum(costs) / len(costs)
+
+
+if __name__ == '__main__':
+	thread_executors = [DeadlineExecutor(), DeadlineExecutor()]
+	process_executors = [ProcessExecutor(busy_ai), ProcessExecutor(busy_ai)]
+	for executor in process_executors:
+		executor.start()
+
+	results = [
+		('single agent', measure([busy_ai])),
+		('DeadlineExecutor', measure([lambda executor=executor: executor.call(AI_TIME, busy_ai) for executor in thread_executors])),
+		('ProcessExecutor', measure([lambda executor=executor: executor.call(AI_TIME) for executor in process_executors]))
+	]
+	for executor in thread_executors:
+		executor.shutdown()
+	for executor in process_executors:
+		executor.shutdown()
+
+	print(f'{"implementation":>18} {"ms/tick":>10}')
+	for name, cost in results:
+		print(f'{name:>18} {cost:>10.2f}')
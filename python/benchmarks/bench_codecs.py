@@ -0,0 +1,89 @@
+'''Benchmark of the per-tick decode + encode cost of the agent codecs.
+
+For each snapshot size, measures the time needed to decode an ASK_COMMAND message and to encode
+the command sent back, for every installed JSON backend and for the binary protocol. The "legacy"
+row is the implementation used before the codec layer (json.loads, field by field float
+conversions and json.dumps of the command dictionary).
+
+The "delta" row decodes a delta where only the positions changed, applied to a mirror that already
+contains every entity.
+
+The "+pool" rows reuse the records of a RecordPool instead of allocating them on every tick.
+The snapshots are decoded lazily, so two costs are reported: when the AI only reads the controlled
+player, and when it reads the other players and all the projectiles.
+'''
+import os
+import sys
+import json
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from codec import JsonCodec, BinaryCodec, DeltaCodec, JSON_BACKENDS
+from game_data import PlayerData, ProjectileData, SnapshotData, RecordPool, MoveCommand, ShootCommand
+from snapshots import make_snapshot, encode_binary_snapshot, encode_delta_snapshots, SNAPSHOT_SIZES
+
+NB_ITERATIONS = 2000
+
+
+def _legacy_player(player_data):
+	return PlayerData((float(player_data['pos']['x']), float(player_data['pos']['y']), float(player_data['pos']['z'])),
+		(float(player_data['speed']['x']), float(player_data['speed']['y']), float(player_data['speed']['z'])),
+		float(player_data['health']), int(player_data['team']), float(player_data['score']))
+
+
+def _legacy_projectile(projectile_data):
+	return ProjectileData((float(projectile_data['pos']['x']), float(projectile_data['pos']['y']), float(projectile_data['pos']['z'])),
+		(float(projectile_data['speed']['x']), float(projectile_data['speed']['y']), float(projectile_data['speed']['z'])))
+
+
+def legacy_tick(line: bytes, command):
+	snapshot = json.loads(line)['snapshot']
+	SnapshotData(_legacy_player(snapshot['controlledPlayer']),
+		[_legacy_player(player) for player in snapshot['otherPlayers']],
+		[_legacy_projectile(projectile) for projectile in snapshot['projectiles']])
+	return (json.dumps(command.__dict__) + '\n').encode('UTF-8')
+
+
+def codec_tick(codec, message: bytes, command):
+	codec.decode_message(message)
+	return codec.encode_command(command)
+
+
+def codec_full_tick(codec, message: bytes, command):
+	_, snapshot = codec.decode_message(message)
+	snapshot.other_players
+	snapshot.projectiles
+	return codec.encode_command(command)
+
+
+def measure(function, *args) -> float:
+	'''Returns the average cost of one call, in microseconds.'''
+	return timeit.timeit(lambda: function(*args), number=NB_ITERATIONS) / NB_ITERATIONS * 1e6
+
+
+if __name__ == '__main__':
+	commands = [MoveCommand((1.0, 0.0, 0.0)), ShootCommand(45.0)]
+	print(f'{"projectiles":>12} {"codec":>12} {"us/tick":>10} {"us/tick (full access)":>22}')
+	for size in SNAPSHOT_SIZES:
+		snapshot = make_snapshot(size)
+		# Gson serializes without any whitespace
+		line = json.dumps({'header': 'ASK_COMMAND', 'snapshot': snapshot}, separators=(',', ':')).encode('UTF-8')
+		frame = encode_binary_snapshot(snapshot)
+
+		command = commands[size % 2]
+		legacy_cost = measure(legacy_tick, line, command)
+		rows = [('legacy', legacy_cost, legacy_cost)]
+		codecs = [(backend, JsonCodec(backend), line) for backend in JSON_BACKENDS]
+		codecs.append((f'{JSON_BACKENDS[next(iter(JSON_BACKENDS))].name}+pool', JsonCodec(pool=RecordPool()), line))
+		codecs.append(('binary', BinaryCodec(), frame))
+		codecs.append(('binary+pool', BinaryCodec(pool=RecordPool()), frame))
+		initial_delta, update_delta = encode_delta_snapshots(snapshot)
+		delta_codec = DeltaCodec()
+		delta_codec.decode_message(initial_delta)
+		codecs.append(('delta', delta_codec, update_delta))
+		for name, codec, message in codecs:
+			rows.append((name, measure(codec_tick, codec, message, command), measure(codec_full_tick, codec, message, command)))
+
+		for name, cost, full_cost in rows:
+			print(f'{size:>12} {name:>12} {cost:>10.1f} {full_cost:>22.1f}')
@@ -0,0 +1,44 @@
+'''Benchmark of the per-tick overhead of running the AI function under a deadline.
+
+Compares a direct call, func_timeout (a new thread per call, as the agent used to do) and the
+persistent DeadlineExecutor, for an AI function that returns immediately. The overhead is the
+cost of the deadline machinery only, the AI itself does no work.
+'''
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from func_timeout import func_timeout
+from execution import DeadlineExecutor
+from game_data import MoveCommand
+
+NB_TICKS = 2000
+AI_TIME = 150.0
+
+
+def idle_ai(gamestate, my_data):
+	return MoveCommand((0.0, 1.0, 0.0))
+
+
+def measure(call) -> float:
+	'''Returns the average cost of one tick, in microseconds.'''
+	begin = time.perf_counter()
+	for _ in range(NB_TICKS):
+		call()
+	return (time.perf_counter() - begin) / NB_TICKS * 1e6
+
+
+if __name__ == '__main__':
+	executor = DeadlineExecutor()
+	results = [
+		('direct call', measure(lambda: idle_ai(None, {}))),
+		('func_timeout', measure(lambda: func_timeout(AI_TIME, idle_ai, args=(None, {})))),
+		('DeadlineExecutor', measure(lambda: executor.call(AI_TIME, idle_ai, (None, {}))))
+	]
+	executor.shutdown()
+
+	print(f'{"implementation":>18} {"us/tick":>10}')
+	for name, cost in results:
+		print(f'{name:>18} {cost:>10.1f}')
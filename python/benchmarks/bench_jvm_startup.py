@@ -0,0 +1,63 @@
+'''Benchmark of the startup of the server JVM in windowless mode.
+
+The reported time goes from the spawn of the server process to the moment it prints "Waiting for an agent
+to connect", the part of every match that the agents cannot overlap. The server is started with its default
+options, with the startup options of jvm_startup, and with a class-data-sharing archive recorded beforehand
+by a training game (one archive for each set of options). Run from the python directory, next to
+challenge.jar: python benchmarks/bench_jvm_startup.py [jvm path], the Java runtime is resolved by jre otherwise.
+'''
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import challenge_arguments
+from jvm_startup import STARTUP_JVM_OPTIONS, cds_options, create_cds_archive
+from jre import resolve_java
+
+NB_RUNS = 5
+WAITING_LINE = 'Waiting for an agent to connect'
+
+
+def startup_time(jvm_path: str, save_file: str, jvm_options) -> float:
+	'''Returns the time until the server waits for the agents, in milliseconds.'''
+	begin = time.perf_counter()
+	process = subprocess.Popen(challenge_arguments(jvm_path, save_file, port=0, jvm_options=jvm_options),
+		stdout=subprocess.PIPE, universal_newlines=True)
+	try:
+		for line in process.stdout:
+			if line.startswith(WAITING_LINE):
+				return (time.perf_counter() - begin) * 1e3
+		raise RuntimeError(f'The server exited with code {process.wait()} before waiting for the agents.')
+	finally:
+		process.kill()
+		process.wait()
+
+
+def measure(jvm_path: str, save_file: str, jvm_options) -> float:
+	'''Returns the median startup time of the server, in milliseconds.'''
+	return statistics.median(startup_time(jvm_path, save_file, jvm_options) for _ in range(NB_RUNS))
+
+
+if __name__ == '__main__':
+	jvm_path = sys.argv[1] if len(sys.argv) > 1 else resolve_java()
+	with tempfile.TemporaryDirectory() as directory:
+		save_file = os.path.join(directory, 'startup.hackathon')
+		default_archive = os.path.join(directory, 'default.jsa')
+		startup_archive = os.path.join(directory, 'startup.jsa')
+		create_cds_archive(jvm_path, default_archive)
+		create_cds_archive(jvm_path, startup_archive, jvm_options=STARTUP_JVM_OPTIONS)
+
+		configurations = [
+			('default', []),
+			('startup options', STARTUP_JVM_OPTIONS),
+			('cds archive', cds_options(default_archive)),
+			('cds + startup', STARTUP_JVM_OPTIONS + cds_options(startup_archive)),
+		]
+		print(f'{"configuration":>16} {"ms to wait":>12}')
+		for name, jvm_options in configurations:
+			print(f'{name:>16} {measure(jvm_path, save_file, jvm_options):>12.1f}')
@@ -0,0 +1,53 @@
+'''Micro-benchmark of the newline-framed MessageReader used by the AIAgent.
+
+Measures the number of ASK_COMMAND messages per second that can be framed (and framed + parsed)
+for snapshots containing 0 to 200 projectiles. The messages are pushed through a socket pair
+by a writer thread, in large chunks so that many messages are coalesced inside each segment.
+'''
+import os
+import sys
+import json
+import socket
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transport import MessageReader
+from snapshots import make_ask_command_line, SNAPSHOT_SIZES
+
+NB_MESSAGES = 2000
+
+
+def _writer(connection: socket.socket, payload: bytes):
+	connection.sendall(payload)
+	connection.close()
+
+
+def run(nb_projectiles: int, parse: bool) -> float:
+	line = make_ask_command_line(nb_projectiles)
+	payload = line * NB_MESSAGES
+	reader_socket, writer_socket = socket.socketpair()
+	writer = threading.Thread(target=_writer, args=(writer_socket, payload))
+	reader = MessageReader(reader_socket)
+
+	begin = time.perf_counter()
+	writer.start()
+	for _ in range(NB_MESSAGES):
+		message = reader.read_line()
+		if parse:
+			json.loads(message)
+	elapsed = time.perf_counter() - begin
+
+	writer.join()
+	reader_socket.close()
+	return NB_MESSAGES / elapsed
+
+
+if __name__ == '__main__':
+	print(f'{"projectiles":>12} {"bytes/msg":>10} {"framing msg/s":>15} {"framing+json msg/s":>20}')
+	for size in SNAPSHOT_SIZES:
+		message_size = len(make_ask_command_line(size))
+		framing = run(size, parse=False)
+		parsing = run(size, parse=True)
+		print(f'{size:>12} {message_size:>10} {framing:>15.0f} {parsing:>20.0f}')
@@ -0,0 +1,64 @@
+'''Benchmark of the per-round process overhead of the game simulations.
+
+A round is played by a function importing the modules of the agents and the libraries used by the teams,
+then returning right away: the reported time is what a round costs before its first tick. It is played by
+a new process per round, as GameSimulation does without pool (forked, or spawned as on the platforms
+without fork), and by the warm workers of a RoundPool.
+'''
+import multiprocessing
+import os
+import sys
+import time
+from importlib import import_module
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from round_pool import RoundPool, DEFAULT_PRELOAD
+
+NB_ROUNDS = 10
+
+
+def play_round(queue=None) -> int:
+	for name in DEFAULT_PRELOAD:
+		try:
+			import_module(name)
+		except ImportError:
+			pass
+	if queue is not None:
+		queue.put(os.getpid())
+	return os.getpid()
+
+
+def measure_processes(start_method: str) -> float:
+	'''Returns the average cost of a round played by a new process, in milliseconds.'''
+	context = multiprocessing.get_context(start_method)
+	begin = time.perf_counter()
+	for _ in range(NB_ROUNDS):
+		queue = context.Queue()
+		process = context.Process(target=play_round, args=(queue,))
+		process.start()
+		queue.get()
+		process.join()
+	return (time.perf_counter() - begin) / NB_ROUNDS * 1e3
+
+
+def measure_pool(pool: RoundPool) -> float:
+	'''Returns the average cost of a round played by a warm worker of the pool, in milliseconds.'''
+	begin = time.perf_counter()
+	for _ in range(NB_ROUNDS):
+		pool.submit(play_round).result()
+	return (time.perf_counter() - begin) / NB_ROUNDS * 1e3
+
+
+if __name__ == '__main__':
+	print(f'{"rounds played by":>20} {"ms/round":>10}')
+	for start_method in ['fork', 'spawn']:
+		if start_method in multiprocessing.get_all_start_methods():
+			print(f'{start_method + " per round":>20} {measure_processes(start_method):>10.1f}')
+
+	pool = RoundPool(1)
+	begin = time.perf_counter()
+	pool.start()
+	print(f'{"pool startup":>20} {(time.perf_counter() - begin) * 1e3:>10.1f}')
+	print(f'{"round pool":>20} {measure_pool(pool):>10.1f}')
+	pool.shutdown()
@@ -0,0 +1,75 @@
+'''Benchmark of the batched AI entry point of the team sessions.
+
+A team plays several concurrent matches through one TeamSession. Its AI is a small neural network
+evaluated with NumPy: my_ai evaluates it on a single snapshot, my_ai_batch on the snapshots of all the
+matches waiting for a command. The reported time is the wall time of one tick of every match, from the
+moment they all ask for their command until they all got it.
+'''
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session import TeamSession
+from game_data import MoveCommand
+from snapshots import make_ask_command_line
+
+NB_TICKS = 50
+AI_TIME = 150.0
+MATCH_COUNTS = [1, 4, 16]
+
+_RANDOM = np.random.default_rng(0)
+HIDDEN_WEIGHTS = _RANDOM.normal(size=(6, 256)).astype(np.float32)
+OUTPUT_WEIGHTS = _RANDOM.normal(size=(256, 3)).astype(np.float32)
+
+
+def _features(gamestate) -> np.ndarray:
+	player = gamestate.controlled_player
+	return np.array(player.position + player.speed, dtype=np.float32)
+
+
+def _predict(features: np.ndarray) -> np.ndarray:
+	return np.tanh(np.maximum(features @ HIDDEN_WEIGHTS, 0.0) @ OUTPUT_WEIGHTS)
+
+
+def my_ai(gamestate, my_data):
+	return MoveCommand(tuple(_predict(_features(gamestate)[np.newaxis])[0].tolist()))
+
+
+def my_ai_batch(gamestates, datas):
+	directions = _predict(np.stack([_features(gamestate) for gamestate in gamestates]))
+	return [MoveCommand(tuple(direction)) for direction in directions.tolist()]
+
+
+async def play_ticks(session: TeamSession, nb_matches: int, message: bytes) -> float:
+	match_ids = [f'match-{index}' for index in range(nb_matches)]
+	for match_id in match_ids:
+		await session.open_match(match_id, {})
+	begin = time.perf_counter()
+	for _ in range(NB_TICKS):
+		await asyncio.gather(*(session.ask_command(AI_TIME, match_id, 'json', {}, message) for match_id in match_ids))
+	cost = (time.perf_counter() - begin) / NB_TICKS * 1e3
+	for match_id in match_ids:
+		await session.close_match(match_id)
+	return cost
+
+
+def measure(session: TeamSession, nb_matches: int, message: bytes) -> float:
+	'''Returns the wall time of a tick of all the matches, in milliseconds.'''
+	return session.submit(play_ticks(session, nb_matches, message)).result()
+
+
+if __name__ == '__main__':
+	message = make_ask_command_line(10).rstrip(b'\n')
+	sessions = [('my_ai', TeamSession('bench', my_ai)), ('my_ai_batch', TeamSession('bench', my_ai, ai_batch=my_ai_batch))]
+
+	print(f'{"matches":>8} {"entry point":>12} {"ms/tick":>10}')
+	for nb_matches in MATCH_COUNTS:
+		for name, session in sessions:
+			print(f'{nb_matches:>8} {name:>12} {measure(session, nb_matches, message):>10.2f}')
+	for _, session in sessions:
+		session.shutdown()
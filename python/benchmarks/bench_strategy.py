@@ -0,0 +1,283 @@
+'''Benchmark of the time charged to the AI of a team ported to the Strategy API.
+
+The my_ai function of les_trois_hackataires builds the walls of the map on its first call (the first
+tick is counted in the ai_time of the agent), then checks on every tick whether the walls block the line
+of fire or the trajectory of the projectiles, one wall at a time. Its port computes the walls in setup,
+which is not counted in the ai_time, as arrays of their end points and directions, and checks all the
+walls at once. The game state of the port lives in its attributes instead of the my_data dictionary.
+
+Both AIs play the same sequence of snapshots, the port returns the same commands. The reported times
+are the ones charged to the agent: the first tick, the mean of the other ticks and the whole game.
+'''
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from codec import JsonCodec
+from game_data import Strategy, MoveCommand, ShootCommand
+from snapshots import make_player
+from teams.les_trois_hackataires.my_ai import my_ai
+
+# A game of 60 seconds at 4 commands per second
+NB_TICKS = 240
+NB_GAMES = 20
+
+HALF_LENGTH = 182 / 2
+HALF_WIDTH = 36 / 2
+PLAYER_RADIUS = 75
+
+
+def _block_walls(x: float, y: float, half_x: float, half_y: float):
+	# Top, bottom, left and right sides of a block, as (x1, y1, x2, y2)
+	return [[x - half_x, y + half_y, x + half_x, y + half_y], [x - half_x, y - half_y, x + half_x, y - half_y],
+		[x - half_x, y + half_y, x - half_x, y - half_y], [x + half_x, y + half_y, x + half_x, y - half_y]]
+
+
+def _angle(dx: float, dy: float) -> float:
+	return ((dy > 0) - (dy < 0)) * math.degrees(math.acos(dx / math.hypot(dx, dy)))
+
+
+class HackatairesStrategy(Strategy):
+	'''my_ai of les_trois_hackataires ported to the Strategy API.'''
+
+	def setup(self, initial_snapshot):
+		borders = [[-275, 275, 275, 275], [-275, -275, 275, -275], [-275, 275, -275, -275], [275, 275, 275, -275]]
+		blocks = [(150, 150, HALF_WIDTH, HALF_WIDTH), (-150, -150, HALF_WIDTH, HALF_WIDTH), (-125, 200, HALF_LENGTH, HALF_WIDTH),
+			(-200, 125, HALF_WIDTH, HALF_LENGTH), (200, -125, HALF_WIDTH, HALF_LENGTH), (125, -200, HALF_LENGTH, HALF_WIDTH)]
+		walls = np.array([wall for block in blocks for wall in _block_walls(*block)] + borders, dtype=np.float64)
+		self._wall_x, self._wall_y = walls[:, 0], walls[:, 1]
+		self._wall_dx, self._wall_dy = walls[:, 0] - walls[:, 2], walls[:, 1] - walls[:, 3]
+
+		opponent = initial_snapshot.other_players[0].position
+		self.spawned = False
+		self.direction_init = None
+		self.dodge = False
+		self.opponent_last_position = opponent
+		self.opponent_positions = [opponent]
+		self.player_id = 1 if initial_snapshot.controlled_player.position[0] < 0 else 2
+
+	def _blocked(self, start, end, margin: float) -> bool:
+		'''Whether a wall crosses the segment between start and end (the segment is extended by margin).'''
+		x, y = start[0], start[1]
+		dx, dy = x - end[0], y - end[1]
+		to_wall_x, to_wall_y = x - self._wall_x, y - self._wall_y
+		denominator = dx * self._wall_dy - dy * self._wall_dx
+		# Compares u and t without dividing by the denominator, which is zero for the parallel walls
+		sign = np.sign(denominator)
+		u = (to_wall_x * dy - to_wall_y * dx) * sign
+		t = (to_wall_x * self._wall_dy - to_wall_y * self._wall_dx) * sign
+		scale = np.abs(denominator)
+		low, high = -margin * scale, (1 + margin) * scale
+		return bool(np.any((scale > 0) & (u >= low) & (u <= high) & (t >= low) & (t <= high)))
+
+	@staticmethod
+	def _crosses(start, end, other_start, other_end) -> bool:
+		x1, y1, x2, y2 = start[0], start[1], end[0], end[1]
+		x3, y3, x4, y4 = other_start[0], other_start[1], other_end[0], other_end[1]
+		denominator = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
+		if denominator == 0:
+			return False
+		u = ((x1 - x3) * (y1 - y2) - (y1 - y3) * (x1 - x2)) / denominator
+		t = ((x1 - x3) * (y3 - y4) - (y1 - y3) * (x3 - x4)) / denominator
+		return 0 <= u <= 1 and 0 <= t <= 1
+
+	def _direction_init(self, position, opponent) -> str:
+		angle_opponent = (np.sign(opponent[1]) + 1) * 90 + math.degrees(math.acos(opponent[0] / math.hypot(*opponent)))
+		angle_player = (np.sign(position[1]) + 1) * 90 + math.degrees(math.acos(position[0] / math.hypot(*position)))
+		return 'vert' if (angle_opponent - angle_player) // 180 == 0 else 'horiz'
+
+	def _dodging_opponent(self) -> bool:
+		if len(self.opponent_positions) > 4:
+			self.opponent_positions = self.opponent_positions[1:4]
+		if len(self.opponent_positions) != 4:
+			return False
+		first, second, third, fourth = self.opponent_positions
+		moving = math.hypot(third[0] - fourth[0], third[1] - fourth[1]) >= 1
+		return (math.hypot(first[0] - third[0], first[1] - third[1]) < 7 and
+			math.hypot(second[0] - fourth[0], second[1] - fourth[1]) < 7 and moving)
+
+	def _remember(self, opponent, positions: bool = True):
+		self.opponent_last_position = opponent
+		if positions:
+			self.opponent_positions.append(opponent)
+
+	def _shoot(self, position, opponent, inverse_prediction: float) -> ShootCommand:
+		# Aims where the opponent will be when the rocket arrives
+		distance = math.hypot(opponent[0] - position[0], opponent[1] - position[1])
+		target = opponent
+		last = self.opponent_last_position
+		if opponent != last:
+			factor = inverse_prediction * distance / 120
+			target = (opponent[0] + factor * (opponent[0] - last[0]), opponent[1] + factor * (opponent[1] - last[1]))
+		dx, dy = target[0] - position[0], target[1] - position[1]
+		angle = 0
+		if (dx != 0 or dy != 0) and opponent[1] > -500:
+			angle = _angle(dx, dy)
+		self._remember(opponent)
+		return ShootCommand(angle)
+
+	def _can_shoot(self, position, opponent) -> bool:
+		return not self._blocked(position, opponent, 0.05) and not opponent[1] < -500
+
+	def _dodge_command(self, snapshot, position, opponent):
+		for projectile in snapshot.projectiles:
+			missile = projectile.position
+			d_player_missile = math.hypot(position[0] - missile[0], position[1] - missile[1])
+			d_opponent_missile = math.hypot(opponent[0] - missile[0], opponent[1] - missile[1])
+			if math.hypot(opponent[0] - position[0], opponent[1] - position[1]) <= d_opponent_missile:
+				continue
+			if d_player_missile >= 2.3 * PLAYER_RADIUS:
+				continue
+			speed_x, speed_y = projectile.speed[0], projectile.speed[1]
+			speed = math.hypot(speed_x, speed_y)
+			normal = (speed_y / speed, -speed_x / speed)
+			center_x, center_y = -0.6 * position[0] / math.hypot(position[0], position[1]), -0.6 * position[1] / math.hypot(position[0], position[1])
+
+			dot = ((position[0] - missile[0]) * speed_x + (position[1] - missile[1]) * speed_y) / (d_player_missile * math.hypot(*projectile.speed))
+			if -1 <= dot <= 1 and math.degrees(math.acos(dot)) < 10.0:
+				self.dodge = True
+				self._remember(opponent, positions=False)
+				return MoveCommand((-normal[0] + center_x, -normal[1] + center_y, 0.0))
+
+			if self._blocked(missile, position, 0.0):
+				continue
+			trajectory_end = (missile[0] + 100 * speed_x, missile[1] + 100 * speed_y)
+			for side in (-1, 1):
+				side_end = (position[0] - side * PLAYER_RADIUS * normal[0], position[1] - side * PLAYER_RADIUS * normal[1])
+				if self._crosses(position, side_end, missile, trajectory_end):
+					self.dodge = True
+					self._remember(opponent)
+					return MoveCommand((side * normal[0] + center_x, side * normal[1] + center_y, 0.0))
+		return None
+
+	def step(self, snapshot):
+		opponent = snapshot.other_players[0].position
+		position = snapshot.controlled_player.position
+		if position[1] < -500:
+			self.spawned = False
+		if not self.spawned:
+			self.spawned = True
+			self.direction_init = self._direction_init(position, opponent)
+		inverse_prediction = -0.33 if self._dodging_opponent() else 1
+		desired = (10, -10) if self.player_id == 1 else (-10, 10)
+
+		if self.dodge:
+			# Shoots after dodging
+			self.dodge = False
+			if self._can_shoot(position, opponent):
+				return self._shoot(position, opponent, inverse_prediction)
+
+		command = self._dodge_command(snapshot, position, opponent)
+		if command is not None:
+			return command
+
+		if self._can_shoot(position, opponent):
+			return self._shoot(position, opponent, inverse_prediction)
+
+		# Goes to the desired position, then shoots
+		x_far = abs(position[0] - desired[0]) > 20
+		y_far = abs(position[1] - desired[1]) > 20
+		moves = [(x_far, (-position[0], 0.0, 0.0)), (y_far, (0.0, -position[1], 0.0))]
+		if self.direction_init == 'vert':
+			moves.reverse()
+		for far, direction in moves:
+			if far:
+				self._remember(opponent)
+				return MoveCommand(direction)
+		return self._shoot(position, opponent, inverse_prediction)
+
+
+def _move(entity, speed: float):
+	entity['speed']['x'], entity['speed']['y'] = random.uniform(-speed, speed), random.uniform(-speed, speed)
+	entity['pos']['x'] = min(max(entity['pos']['x'] + entity['speed']['x'] / 4, -275.0), 275.0)
+	entity['pos']['y'] = min(max(entity['pos']['y'] + entity['speed']['y'] / 4, -275.0), 275.0)
+
+
+def make_game(seed: int) -> list:
+	'''Snapshots of a game where the players and the projectiles move a bit on every tick.'''
+	random.seed(seed)
+	codec = JsonCodec()
+	players = [make_player(0), make_player(1)]
+	players[0]['pos']['x'] = -abs(players[0]['pos']['x'])
+	projectiles = []
+	snapshots = []
+	for _ in range(NB_TICKS):
+		for player in players:
+			_move(player, 150.0)
+		if random.random() < 0.3:
+			# A rocket shot by the opponent, roughly toward the player
+			position = players[1]['pos']
+			target = players[0]['pos']
+			direction = (target['x'] - position['x'] + random.uniform(-20.0, 20.0), target['y'] - position['y'] + random.uniform(-20.0, 20.0))
+			norm = math.hypot(*direction) or 1.0
+			projectiles.append({'pos': dict(position), 'speed': {'x': 300.0 * direction[0] / norm, 'y': 300.0 * direction[1] / norm, 'z': 0.0}})
+		for projectile in projectiles:
+			projectile['pos']['x'] += projectile['speed']['x'] / 4
+			projectile['pos']['y'] += projectile['speed']['y'] / 4
+		projectiles = [projectile for projectile in projectiles if abs(projectile['pos']['x']) < 275 and abs(projectile['pos']['y']) < 275]
+		message = {'header': 'ASK_COMMAND', 'snapshot': {'controlledPlayer': players[0], 'otherPlayers': [players[1]], 'projectiles': projectiles}}
+		_, snapshot = codec.decode_message(json.dumps(message).encode('UTF-8'))
+		snapshots.append(snapshot)
+	return snapshots
+
+
+def _same_command(first, second) -> bool:
+	if type(first) is not type(second):
+		return False
+	if type(first) is ShootCommand:
+		return math.isclose(first.shoot_angle, second.shoot_angle, abs_tol=1e-6)
+	return all(math.isclose(a, b, abs_tol=1e-6) for a, b in zip(first.move_direction, second.move_direction))
+
+
+def play_legacy(snapshots: list):
+	my_data = {}
+	times = []
+	commands = []
+	for snapshot in snapshots:
+		begin = time.perf_counter()
+		with contextlib.redirect_stdout(io.StringIO()):
+			commands.append(my_ai(snapshot, my_data))
+		times.append(time.perf_counter() - begin)
+	return 0.0, times, commands
+
+
+def play_strategy(snapshots: list):
+	strategy = HackatairesStrategy()
+	begin = time.perf_counter()
+	strategy.setup(snapshots[0])
+	setup_time = time.perf_counter() - begin
+	times = []
+	commands = []
+	for snapshot in snapshots:
+		begin = time.perf_counter()
+		commands.append(strategy.step(snapshot))
+		times.append(time.perf_counter() - begin)
+	return setup_time, times, commands
+
+
+if __name__ == '__main__':
+	games = [make_game(seed) for seed in range(NB_GAMES)]
+	results = {}
+	for name, play in [('my_ai', play_legacy), ('strategy', play_strategy)]:
+		runs = [play(snapshots) for snapshots in games]
+		results[name] = runs
+	mismatches = sum(not _same_command(first, second)
+		for (_, _, legacy_commands), (_, _, strategy_commands) in zip(results['my_ai'], results['strategy'])
+		for first, second in zip(legacy_commands, strategy_commands))
+	print(f'{NB_GAMES} games of {NB_TICKS} ticks, {mismatches} different commands')
+	print(f'{"ai":>10} {"setup (ms)":>12} {"first tick (ms)":>16} {"us/tick":>10} {"charged/game (ms)":>18}')
+	for name, runs in results.items():
+		setup = sum(setup_time for setup_time, _, _ in runs) / len(runs) * 1e3
+		first = sum(times[0] for _, times, _ in runs) / len(runs) * 1e3
+		per_tick = sum(sum(times[1:]) for _, times, _ in runs) / sum(len(times) - 1 for _, times, _ in runs) * 1e6
+		charged = sum(sum(times) for _, times, _ in runs) / len(runs) * 1e3
+		print(f'{name:>10} {setup:>12.3f} {first:>16.3f} {per_tick:>10.1f} {charged:>18.2f}')
@@ -0,0 +1,74 @@
+'''Benchmark of the per-match initialization of a team.
+
+The team module loads a model in my_data (a large NumPy array standing for the weights of a network) and
+defines the reset hook my_reset, which keeps the model and resets the state of the match. The reported time
+is what a match costs before its first tick: a call to my_data per match, as the scheduler used to do, or
+the opening and closing of a match in the long-lived session of the team, see TeamSession.for_team.
+'''
+import os
+import sys
+import tempfile
+import time
+from importlib import import_module
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session import TeamSession
+
+NB_MATCHES = 10
+
+TEAM_MODULE = '''
+import numpy as np
+from game_data import MoveCommand
+
+
+def my_data():
+	return {'model': np.random.default_rng(0).normal(size=(4000, 1000)), 'ticks': 0}
+
+
+def my_reset(loaded_data):
+	return {'model': loaded_data['model'], 'ticks': 0}
+
+
+def my_ai(gamestate, my_data):
+	return MoveCommand((0.0, 1.0, 0.0))
+'''
+
+
+def measure_my_data(module) -> float:
+	'''Returns the average cost of the data of a match loaded by my_data, in milliseconds.'''
+	begin = time.perf_counter()
+	for _ in range(NB_MATCHES):
+		module.my_data()
+	return (time.perf_counter() - begin) / NB_MATCHES * 1e3
+
+
+async def open_and_close(session: TeamSession):
+	for index in range(NB_MATCHES):
+		await session.open_match(f'match-{index}', None)
+		await session.close_match(f'match-{index}')
+
+
+def measure_session(session: TeamSession) -> float:
+	'''Returns the average cost of the opening and closing of a match in the team session, in milliseconds.'''
+	begin = time.perf_counter()
+	session.submit(open_and_close(session)).result()
+	return (time.perf_counter() - begin) / NB_MATCHES * 1e3
+
+
+if __name__ == '__main__':
+	with tempfile.TemporaryDirectory() as directory:
+		with open(os.path.join(directory, 'bench_team.py'), 'w') as file:
+			file.write(TEAM_MODULE)
+		sys.path.append(directory)
+
+		session = TeamSession.for_team('bench', 'bench_team', directory)
+		begin = time.perf_counter()
+		session.start()
+		startup = (time.perf_counter() - begin) * 1e3
+
+		print(f'{"match data from":>16} {"ms/match":>10}')
+		print(f'{"my_data":>16} {measure_my_data(import_module("bench_team")):>10.1f}')
+		print(f'{"team session":>16} {measure_session(session):>10.1f}')
+		print(f'{"session startup":>16} {startup:>10.1f}')
+		session.shutdown()
@@ -0,0 +1,132 @@
+'''Benchmark of the round-trip latency of the TCP, unix domain socket and shared memory transports.
+
+A server process plays the part of the JVM: it sends a binary snapshot and waits for the command of
+the agent, and measures the time of this round trip as the server does when polling the agents. The
+agent, in this process, reads and decodes the frames with the MessageReader and answers a MOVE command right away,
+so the measure only contains the transport (and the decoding), not the AI.
+
+With the shared memory transport, the server writes the snapshot inside a slot of the mapped file and
+only sends the doorbell through the unix domain socket, the agent decodes the snapshot from the mapping.
+'''
+import os
+import sys
+import mmap
+import multiprocessing
+import socket
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transport import MessageReader, connect, FRAME_HEADER
+from codec import BinaryCodec, SharedMemoryCodec, SNAPSHOT_SLOT_TYPE, SLOT_FRAME
+from game_data import MoveCommand
+from snapshots import make_snapshot, encode_binary_snapshot, SNAPSHOT_SIZES
+
+NB_ROUND_TRIPS = 5000
+NB_SLOTS = 4
+SLOT_SIZE = 65536
+COMMAND_SLOT_SIZE = 64
+
+
+def _serve(server: socket.socket, frame: bytes, results):
+	connection, _ = server.accept()
+	with connection:
+		begin = time.perf_counter()
+		for _ in range(NB_ROUND_TRIPS):
+			connection.sendall(frame)
+			size, = FRAME_HEADER.unpack(connection.recv(FRAME_HEADER.size, socket.MSG_WAITALL))
+			connection.recv(size, socket.MSG_WAITALL)
+		results.put((time.perf_counter() - begin) / NB_ROUND_TRIPS * 1e6)
+	server.close()
+
+
+def _serve_shared_memory(server: socket.socket, body: bytes, shared_path: str, results):
+	with open(shared_path, 'r+b') as file:
+		mapping = mmap.mmap(file.fileno(), NB_SLOTS * (SLOT_SIZE + COMMAND_SLOT_SIZE))
+	connection, _ = server.accept()
+	with connection:
+		begin = time.perf_counter()
+		for tick in range(NB_ROUND_TRIPS):
+			slot = tick % NB_SLOTS
+			mapping[slot * SLOT_SIZE:slot * SLOT_SIZE + len(body)] = body
+			connection.sendall(SLOT_FRAME.pack(SLOT_FRAME.size - FRAME_HEADER.size, SNAPSHOT_SLOT_TYPE, slot))
+			size, = FRAME_HEADER.unpack(connection.recv(FRAME_HEADER.size, socket.MSG_WAITALL))
+			connection.recv(size, socket.MSG_WAITALL)
+		results.put((time.perf_counter() - begin) / NB_ROUND_TRIPS * 1e6)
+	server.close()
+
+
+def _open_server(socket_path: str) -> socket.socket:
+	if socket_path is not None:
+		server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		server.bind(socket_path)
+	else:
+		server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		server.bind(('127.0.0.1', 0))
+	server.listen(1)
+	return server
+
+
+def run(nb_projectiles: int, socket_path: str = None) -> float:
+	'''Returns the average round trip measured by the server, in microseconds.'''
+	body = encode_binary_snapshot(make_snapshot(nb_projectiles))
+	frame = FRAME_HEADER.pack(len(body)) + body
+	server = _open_server(socket_path)
+	port = server.getsockname()[1] if socket_path is None else None
+	results = multiprocessing.Queue()
+	process = multiprocessing.Process(target=_serve, args=(server, frame, results))
+	process.start()
+	server.close()
+
+	codec = BinaryCodec()
+	command = codec.encode_command(MoveCommand((0.0, 1.0, 0.0)))
+	connection = connect('127.0.0.1', port, socket_path)
+	reader = MessageReader(connection)
+	for _ in range(NB_ROUND_TRIPS):
+		codec.decode_message(reader.read_frame())
+		connection.sendall(command)
+	round_trip = results.get()
+	process.join()
+	connection.close()
+	if socket_path is not None:
+		os.unlink(socket_path)
+	return round_trip
+
+
+def run_shared_memory(nb_projectiles: int, socket_path: str) -> float:
+	'''Returns the average round trip measured by the server with the shared memory transport, in microseconds.'''
+	body = encode_binary_snapshot(make_snapshot(nb_projectiles))
+	shared_path = socket_path + '.shm'
+	with open(shared_path, 'wb') as file:
+		file.truncate(NB_SLOTS * (SLOT_SIZE + COMMAND_SLOT_SIZE))
+	server = _open_server(socket_path)
+	results = multiprocessing.Queue()
+	process = multiprocessing.Process(target=_serve_shared_memory, args=(server, body, shared_path, results))
+	process.start()
+	server.close()
+
+	codec = SharedMemoryCodec(shared_path, NB_SLOTS, SLOT_SIZE, COMMAND_SLOT_SIZE)
+	connection = connect(None, None, socket_path)
+	reader = MessageReader(connection)
+	move = MoveCommand((0.0, 1.0, 0.0))
+	for _ in range(NB_ROUND_TRIPS):
+		codec.decode_message(reader.read_frame())
+		connection.sendall(codec.encode_command(move))
+	round_trip = results.get()
+	process.join()
+	connection.close()
+	os.unlink(socket_path)
+	os.unlink(shared_path)
+	return round_trip
+
+
+if __name__ == '__main__':
+	socket_path = os.path.join(tempfile.mkdtemp(), 'challenge.sock')
+	print(f'{"projectiles":>12} {"tcp us":>10} {"unix us":>10} {"shm us":>10}')
+	for nb_projectiles in SNAPSHOT_SIZES:
+		tcp = run(nb_projectiles)
+		unix = run(nb_projectiles, socket_path)
+		shared_memory = run_shared_memory(nb_projectiles, socket_path)
+		print(f'{nb_projectiles:>12} {tcp:>10.1f} {unix:>10.1f} {shared_memory:>10.1f}')
+	os.rmdir(os.path.dirname(socket_path))
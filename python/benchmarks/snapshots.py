@@ -0,0 +1,85 @@
+import json
+import random
+import struct
+import typing
+
+
+def make_player(team: int) -> typing.Dict:
+	return {
+		'pos': {'x': random.uniform(-300.0, 300.0), 'y': random.uniform(-300.0, 300.0), 'z': 0.0},
+		'speed': {'x': random.uniform(-150.0, 150.0), 'y': random.uniform(-150.0, 150.0), 'z': 0.0},
+		'state': 'MOVING',
+		'health': random.uniform(0.0, 100.0),
+		'team': team,
+		'score': random.uniform(0.0, 60.0)
+	}
+
+
+def make_projectile() -> typing.Dict:
+	return {
+		'pos': {'x': random.uniform(-300.0, 300.0), 'y': random.uniform(-300.0, 300.0), 'z': 0.0},
+		'speed': {'x': random.uniform(-300.0, 300.0), 'y': random.uniform(-300.0, 300.0), 'z': 0.0}
+	}
+
+
+def make_snapshot(nb_projectiles: int, nb_other_players: int = 1) -> typing.Dict:
+	'''Builds a snapshot with the same shape as the ones sent by the server.'''
+	return {
+		'controlledPlayer': make_player(0),
+		'otherPlayers': [make_player(1) for _ in range(nb_other_players)],
+		'projectiles': [make_projectile() for _ in range(nb_projectiles)]
+	}
+
+
+def make_ask_command_line(nb_projectiles: int, nb_other_players: int = 1) -> bytes:
+	'''Serializes an ASK_COMMAND message as the server does (the message followed by a blank line).'''
+	message = {'header': 'ASK_COMMAND', 'snapshot': make_snapshot(nb_projectiles, nb_other_players)}
+	return (json.dumps(message) + '\n\n').encode('UTF-8')
+
+
+def _player_record(player: typing.Dict) -> bytes:
+	return struct.pack('<3f3ffifi', player['pos']['x'], player['pos']['y'], player['pos']['z'],
+		player['speed']['x'], player['speed']['y'], player['speed']['z'],
+		player['health'], player['team'], player['score'], 1)
+
+
+def _projectile_record(projectile: typing.Dict) -> bytes:
+	return struct.pack('<3f3f', projectile['pos']['x'], projectile['pos']['y'], projectile['pos']['z'],
+		projectile['speed']['x'], projectile['speed']['y'], projectile['speed']['z'])
+
+
+def encode_binary_snapshot(snapshot: typing.Dict) -> bytes:
+	'''Encodes a snapshot as the body of a binary ASK_COMMAND frame, as the server does.'''
+	return (struct.pack('<III', 1, len(snapshot['otherPlayers']), len(snapshot['projectiles']))
+		+ _player_record(snapshot['controlledPlayer'])
+		+ b''.join(_player_record(player) for player in snapshot['otherPlayers'])
+		+ b''.join(_projectile_record(projectile) for projectile in snapshot['projectiles']))
+
+
+def encode_delta_snapshots(snapshot: typing.Dict) -> typing.Tuple[bytes, bytes]:
+	'''Encodes a snapshot as the bodies of two DELTA_SNAPSHOT frames: the first one adds every entity, the
+	second one only changes the positions of the players and the projectiles, as on a typical tick.'''
+	players = [snapshot['controlledPlayer']] + snapshot['otherPlayers']
+	projectiles = snapshot['projectiles']
+	player_entities = range(len(players))
+	projectile_entities = range(len(players), len(players) + len(projectiles))
+
+	def group(kind: int, mask: int, entities: range, values: bytes) -> bytes:
+		return struct.pack('<III', kind, mask, len(entities)) + struct.pack(f'<{len(entities)}i', *entities) + values
+
+	groups = [group(0, 0b111111, player_entities, b''.join(_player_record(player) for player in players))]
+	if projectiles:
+		groups.append(group(1, 0b11, projectile_entities, b''.join(_projectile_record(projectile) for projectile in projectiles)))
+	initial = struct.pack('<IiII', 5, 0, 0, len(groups)) + b''.join(groups)
+
+	def moved(entity: typing.Dict) -> bytes:
+		return struct.pack('<3f', *(coordinate + 1.0 for coordinate in entity['pos'].values()))
+
+	groups = [group(0, 0b1, player_entities, b''.join(moved(player) for player in players))]
+	if projectiles:
+		groups.append(group(1, 0b1, projectile_entities, b''.join(moved(projectile) for projectile in projectiles)))
+	update = struct.pack('<IiII', 5, 0, 0, len(groups)) + b''.join(groups)
+	return initial, update
+
+
+SNAPSHOT_SIZES = [0, 10, 25, 50, 100, 200]
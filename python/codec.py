@@ -0,0 +1,630 @@
+import functools
+import json
+import math
+import mmap
+import re
+import struct
+import typing
+import numpy as np
+from game_data import PlayerData, ProjectileData, SnapshotData, RecordPool, Command, MoveCommand, ShootCommand, PlanCommand, \
+	PLAYER_DTYPE, PROJECTILE_DTYPE, STATE_INDICES
+from transport import FRAME_HEADER, MessageReader
+
+JSON_PROTOCOL = 'json'
+BINARY_PROTOCOL = 'binary'
+SHARED_MEMORY_PROTOCOL = 'shm'
+DELTA_PROTOCOL = 'delta'
+
+# Message types of the binary protocol (server -> agent)
+ASK_COMMAND_TYPE = 1
+GAME_FINISHED_TYPE = 2
+ABORT_TYPE = 3
+
+MESSAGE_HEADERS = {
+	ASK_COMMAND_TYPE: 'ASK_COMMAND',
+	GAME_FINISHED_TYPE: 'GAME_FINISHED',
+	ABORT_TYPE: 'ABORT'
+}
+
+# Command types of the binary protocol (agent -> server)
+INVALID_COMMAND_TYPE = 0
+MOVE_COMMAND_TYPE = 1
+SHOOT_COMMAND_TYPE = 2
+PLAN_COMMAND_TYPE = 4
+
+# Doorbells of the shared memory protocol, the message or the command is inside the given slot
+SNAPSHOT_SLOT_TYPE = 4
+COMMAND_SLOT_TYPE = 3
+
+# Message type of the delta protocol, only the changes since the previous snapshot are sent (server -> agent)
+DELTA_SNAPSHOT_TYPE = 5
+PLAYER_KIND = 0
+PROJECTILE_KIND = 1
+
+# Message type, number of other players and number of projectiles
+SNAPSHOT_HEADER = struct.Struct('<III')
+# Position (x, y, z), speed (dx, dy, dz), health, team, score and state
+PLAYER_RECORD = struct.Struct('<3f3ffifi')
+# Position (x, y, z) and speed (dx, dy, dz)
+PROJECTILE_RECORD = struct.Struct('<3f3f')
+
+# Header of a JSON message, the quotes inside string values are escaped so they cannot match
+JSON_HEADER_PATTERN = re.compile(rb'"header"\s*:\s*"(\w+)"')
+
+MOVE_COMMAND_FRAME = struct.Struct('<II3f')
+SHOOT_COMMAND_FRAME = struct.Struct('<IIf')
+TYPE_FIELD = struct.Struct('<I')
+
+# Body of the commands written inside the command slots and the plan steps
+MOVE_COMMAND_BODY = struct.Struct('<I3f')
+SHOOT_COMMAND_BODY = struct.Struct('<If')
+# Command type, flags, projectile radius (negative without projectile trigger) and number of steps
+PLAN_COMMAND_BODY = struct.Struct('<IIfI')
+PLAN_INTERRUPT_ON_DAMAGE = 1
+# Size, doorbell type and slot index
+SLOT_FRAME = struct.Struct('<III')
+
+# Message type, controlled player entity, number of removed entities and number of groups of changed entities
+DELTA_HEADER = struct.Struct('<IiII')
+# Kind, change mask and number of entities of a group, the bits of the mask are the fields of the records
+DELTA_GROUP = struct.Struct('<III')
+ENTITY_DTYPE = np.dtype('<i4')
+
+
+class JsonBackend:
+	'''JSON library used by the JsonCodec to parse the messages.'''
+
+	def __init__(self, name: str, loads: typing.Callable[[bytes], typing.Any]):
+		self.name = name
+		self.loads = loads
+
+
+def _load_json_backends() -> typing.Dict[str, JsonBackend]:
+	'''Returns the available JSON backends, from the fastest to the slowest.
+	The standard library is always available and used as fallback.'''
+	backends = {}
+	try:
+		import orjson
+		backends['orjson'] = JsonBackend('orjson', orjson.loads)
+	except ImportError:
+		pass
+	try:
+		import ujson
+		backends['ujson'] = JsonBackend('ujson', ujson.loads)
+	except ImportError:
+		pass
+	backends['stdlib'] = JsonBackend('stdlib', json.loads)
+	return backends
+
+
+JSON_BACKENDS = _load_json_backends()
+DEFAULT_JSON_BACKEND = next(iter(JSON_BACKENDS))
+
+# Pre-templated commands, the values are the only part formatted on each tick
+MOVE_COMMAND_TEMPLATE = '{"command_type": "MOVE", "move_direction": [%s, %s, %s]}\n'
+SHOOT_COMMAND_TEMPLATE = '{"command_type": "SHOOT", "shoot_angle": %s}\n'
+
+
+def _json_float(value) -> str:
+	'''Formats a number as json.dumps does: NaN, Infinity and -Infinity are the spellings the server accepts.'''
+	value = float(value)
+	if value != value:
+		return 'NaN'
+	if value == math.inf:
+		return 'Infinity'
+	if value == -math.inf:
+		return '-Infinity'
+	return repr(value)
+
+# Values of the fields the agent asked the server not to send, see Subscription
+SKIPPED_FIELD_DEFAULTS = {
+	'speed': {'x': 0.0, 'y': 0.0, 'z': 0.0},
+	'state': None,
+	'health': 0.0,
+	'team': -1,
+	'score': 0.0
+}
+
+
+class JsonCodec:
+	'''Codec of the line-based JSON protocol, used by default by the server.
+
+	The fastest installed JSON backend is used (orjson, ujson, then the standard library).
+	The snapshots are then converted by a decoder specialized for their shape, which reads
+	the fields directly, without any generic conversion.
+
+	The fields skipped by the subscription of the agent are missing from the records, they are
+	given the values of SKIPPED_FIELD_DEFAULTS.
+	'''
+
+	name = JSON_PROTOCOL
+	# The messages are delimited by newlines
+	length_prefixed = False
+
+	def __init__(self, json_backend: str = None, pool: RecordPool = None, skip_fields: typing.List[str] = None):
+		backend_name = json_backend if json_backend is not None else DEFAULT_JSON_BACKEND
+		if backend_name not in JSON_BACKENDS:
+			raise ValueError(f'JSON backend not available: {backend_name}')
+		self.backend = JSON_BACKENDS[backend_name]
+		# Options negotiated during the handshake, needed to build the same codec in another process
+		self.options = {'skip_fields': list(skip_fields)} if skip_fields else {}
+		self._skipped_defaults = {field: SKIPPED_FIELD_DEFAULTS[field] for field in skip_fields or ()
+			if field in SKIPPED_FIELD_DEFAULTS}
+		self._loads = self.backend.loads
+		self._pool = pool
+		self._new_player = pool.player if pool is not None else PlayerData
+		self._new_projectile = pool.projectile if pool is not None else ProjectileData
+
+	def _parse_player_data(self, player_data: typing.Dict) -> PlayerData:
+		position = player_data['pos']
+		speed = player_data['speed']
+		return self._new_player((position['x'], position['y'], position['z']),
+						  (speed['x'], speed['y'], speed['z']),
+						  player_data['health'], player_data['team'], player_data['score'])
+
+	def _parse_projectile_data(self, projectile_data: typing.Dict) -> ProjectileData:
+		position = projectile_data['pos']
+		speed = projectile_data['speed']
+		return self._new_projectile((position['x'], position['y'], position['z']),
+							  (speed['x'], speed['y'], speed['z']))
+
+	def _records(self, snapshot: typing.Dict, key: str) -> typing.List[typing.Dict]:
+		if not self._skipped_defaults:
+			return snapshot[key]
+		defaults = self._skipped_defaults
+		return [{**defaults, **record} for record in snapshot[key]]
+
+	def _parse_other_players(self, snapshot: typing.Dict) -> typing.List[PlayerData]:
+		parse_player_data = self._parse_player_data
+		return [parse_player_data(player_data) for player_data in self._records(snapshot, 'otherPlayers')]
+
+	def _parse_projectiles(self, snapshot: typing.Dict) -> typing.List[ProjectileData]:
+		parse_projectile_data = self._parse_projectile_data
+		return [parse_projectile_data(projectile_data) for projectile_data in self._records(snapshot, 'projectiles')]
+
+	def _parse_player_array(self, snapshot: typing.Dict) -> np.ndarray:
+		array = np.array([((player_data['pos']['x'], player_data['pos']['y'], player_data['pos']['z']),
+			(player_data['speed']['x'], player_data['speed']['y'], player_data['speed']['z']),
+			player_data['health'], player_data['team'], player_data['score'], STATE_INDICES.get(player_data.get('state'), -1))
+			for player_data in self._records(snapshot, 'otherPlayers')], dtype=PLAYER_DTYPE)
+		array.setflags(write=False)
+		return array
+
+	def _parse_projectile_array(self, snapshot: typing.Dict) -> np.ndarray:
+		array = np.array([((projectile_data['pos']['x'], projectile_data['pos']['y'], projectile_data['pos']['z']),
+			(projectile_data['speed']['x'], projectile_data['speed']['y'], projectile_data['speed']['z']))
+			for projectile_data in self._records(snapshot, 'projectiles')], dtype=PROJECTILE_DTYPE)
+		array.setflags(write=False)
+		return array
+
+	def parse_snapshot(self, snapshot: typing.Dict) -> SnapshotData:
+		'''Only the controlled player is converted right away, the rest is converted on first access.'''
+		if self._pool is not None:
+			self._pool.recycle()
+		controlled_player_data = snapshot['controlledPlayer']
+		if self._skipped_defaults:
+			controlled_player_data = {**self._skipped_defaults, **controlled_player_data}
+		controlled_player = self._parse_player_data(controlled_player_data)
+		return SnapshotData.lazy(controlled_player,
+			functools.partial(self._parse_other_players, snapshot),
+			functools.partial(self._parse_projectiles, snapshot),
+			functools.partial(self._parse_player_array, snapshot),
+			functools.partial(self._parse_projectile_array, snapshot))
+
+	def decode_message(self, line: bytes) -> typing.Tuple[str, typing.Any]:
+		'''Decodes a message and returns its header along with its content: a SnapshotData for
+		ASK_COMMAND, the list of score results for GAME_FINISHED and the abort message for ABORT.'''
+		message = self._loads(line)
+		header = message['header']
+		if header == 'ASK_COMMAND':
+			return header, self.parse_snapshot(message['snapshot'])
+		elif header == 'GAME_FINISHED':
+			return header, message['score']
+		return header, message
+
+	def read_raw_message(self, reader: MessageReader) -> bytes:
+		return reader.read_line()
+
+	def message_header(self, line: bytes) -> str:
+		'''Returns the header of a message without decoding it.'''
+		match = JSON_HEADER_PATTERN.search(line)
+		if match is None:
+			raise ValueError('Message without header.')
+		return match.group(1).decode('UTF-8')
+
+	def read_message(self, reader: MessageReader) -> typing.Tuple[str, typing.Any]:
+		return self.decode_message(reader.read_line())
+
+	def encode_command(self, command: Command, snapshot: typing.Union[SnapshotData, bytes] = None) -> bytes:
+		'''Encodes the command answering the snapshot, only the shared memory protocol needs the snapshot.'''
+		if type(command) is MoveCommand:
+			x, y, z = command.move_direction
+			return (MOVE_COMMAND_TEMPLATE % (_json_float(x), _json_float(y), _json_float(z))).encode('UTF-8')
+		elif type(command) is ShootCommand:
+			return (SHOOT_COMMAND_TEMPLATE % _json_float(command.shoot_angle)).encode('UTF-8')
+		elif type(command) is PlanCommand:
+			return (json.dumps(self._plan_document(command)) + '\n').encode('UTF-8')
+		return (json.dumps(command.__dict__) + '\n').encode('UTF-8')
+
+	def close(self):
+		'''Releases the resources of the codec once the game is over.'''
+
+	@staticmethod
+	def _plan_document(command: PlanCommand) -> typing.Dict:
+		document = {
+			'command_type': command.command_type,
+			'steps': [{'ticks': ticks, 'command': JsonCodec._step_document(step_command)} for ticks, step_command in command.steps],
+			'interrupt_on_damage': bool(command.interrupt_on_damage)
+		}
+		if command.projectile_radius is not None:
+			document['projectile_radius'] = float(command.projectile_radius)
+		return document
+
+	@staticmethod
+	def _step_document(command: Command) -> typing.Dict:
+		# The values are converted like the single commands, NumPy arrays and scalars included
+		if type(command) is MoveCommand:
+			return {'command_type': command.command_type, 'move_direction': [float(value) for value in command.move_direction]}
+		return {'command_type': command.command_type, 'shoot_angle': float(command.shoot_angle)}
+
+
+class BinaryCodec:
+	'''Codec of the compact binary protocol, negotiated during the connection handshake.
+
+	Every message is a length-prefixed frame (little-endian uint32 size, then the body). The body
+	of an ASK_COMMAND message is made of the snapshot header followed by fixed-layout records:
+	the controlled player, the other players and then the projectiles. GAME_FINISHED and ABORT
+	messages are rare, their body is the message type followed by the JSON document of the message.
+	Commands are sent back as frames containing the command type and its values.
+	'''
+
+	name = BINARY_PROTOCOL
+	# The messages are length-prefixed frames
+	length_prefixed = True
+
+	def __init__(self, pool: RecordPool = None):
+		self.options = {}
+		self._pool = pool
+		self._new_player = pool.player if pool is not None else PlayerData
+		self._new_projectile = pool.projectile if pool is not None else ProjectileData
+
+	def _parse_player_record(self, record: typing.Tuple) -> PlayerData:
+		return self._new_player(record[0:3], record[3:6], record[6], record[7], record[8])
+
+	def _parse_projectile_record(self, record: typing.Tuple) -> ProjectileData:
+		return self._new_projectile(record[0:3], record[3:6])
+
+	def _parse_other_players(self, body: bytes, begin: int, end: int) -> typing.List[PlayerData]:
+		parse_player_record = self._parse_player_record
+		with memoryview(body) as view:
+			return [parse_player_record(record) for record in PLAYER_RECORD.iter_unpack(view[begin:end])]
+
+	def _parse_projectiles(self, body: bytes, begin: int, end: int) -> typing.List[ProjectileData]:
+		parse_projectile_record = self._parse_projectile_record
+		with memoryview(body) as view:
+			return [parse_projectile_record(record) for record in PROJECTILE_RECORD.iter_unpack(view[begin:end])]
+
+	def parse_snapshot(self, body: bytes, start: int = 0) -> SnapshotData:
+		'''Only the controlled player is unpacked right away, the other records are unpacked on first access.
+		The snapshot starts at the given offset of the body.'''
+		if self._pool is not None:
+			self._pool.recycle()
+		_, nb_other_players, nb_projectiles = SNAPSHOT_HEADER.unpack_from(body, start)
+		offset = start + SNAPSHOT_HEADER.size
+		controlled_player = self._parse_player_record(PLAYER_RECORD.unpack_from(body, offset))
+		offset += PLAYER_RECORD.size
+
+		players_end = offset + nb_other_players * PLAYER_RECORD.size
+		projectiles_end = players_end + nb_projectiles * PROJECTILE_RECORD.size
+		return SnapshotData.lazy(controlled_player,
+			functools.partial(self._parse_other_players, body, offset, players_end),
+			functools.partial(self._parse_projectiles, body, players_end, projectiles_end),
+			functools.partial(np.frombuffer, body, PLAYER_DTYPE, nb_other_players, offset),
+			functools.partial(np.frombuffer, body, PROJECTILE_DTYPE, nb_projectiles, players_end))
+
+	def decode_message(self, body: bytes) -> typing.Tuple[str, typing.Any]:
+		message_type, = TYPE_FIELD.unpack_from(body)
+		header = MESSAGE_HEADERS.get(message_type)
+		if header is None:
+			raise ValueError(f'Unknown binary message type: {message_type}')
+		if message_type == ASK_COMMAND_TYPE:
+			return header, self.parse_snapshot(body)
+
+		message = json.loads(body[TYPE_FIELD.size:])
+		if message_type == GAME_FINISHED_TYPE:
+			return header, message['score']
+		return header, message
+
+	def read_raw_message(self, reader: MessageReader) -> bytes:
+		return reader.read_frame()
+
+	def message_header(self, body: bytes) -> str:
+		'''Returns the header of a message without decoding it.'''
+		message_type, = TYPE_FIELD.unpack_from(body)
+		header = MESSAGE_HEADERS.get(message_type)
+		if header is None:
+			raise ValueError(f'Unknown binary message type: {message_type}')
+		return header
+
+	def read_message(self, reader: MessageReader) -> typing.Tuple[str, typing.Any]:
+		return self.decode_message(reader.read_frame())
+
+	def encode_command(self, command: Command, snapshot: typing.Union[SnapshotData, bytes] = None) -> bytes:
+		'''Encodes the command answering the snapshot, only the shared memory protocol needs the snapshot.'''
+		if type(command) is MoveCommand:
+			x, y, z = command.move_direction
+			return MOVE_COMMAND_FRAME.pack(MOVE_COMMAND_FRAME.size - FRAME_HEADER.size, MOVE_COMMAND_TYPE, x, y, z)
+		elif type(command) is ShootCommand:
+			return SHOOT_COMMAND_FRAME.pack(SHOOT_COMMAND_FRAME.size - FRAME_HEADER.size, SHOOT_COMMAND_TYPE, command.shoot_angle)
+		elif type(command) is PlanCommand:
+			body = self._plan_body(command)
+			return FRAME_HEADER.pack(len(body)) + body
+		# Invalid commands only carry a message, the server aborts the game upon receiving them
+		value = str(command.__dict__).encode('UTF-8')
+		return FRAME_HEADER.pack(TYPE_FIELD.size + len(value)) + TYPE_FIELD.pack(INVALID_COMMAND_TYPE) + value
+
+	def close(self):
+		'''Releases the resources of the codec once the game is over.'''
+
+	@staticmethod
+	def _plan_body(command: PlanCommand) -> bytes:
+		flags = PLAN_INTERRUPT_ON_DAMAGE if command.interrupt_on_damage else 0
+		radius = command.projectile_radius if command.projectile_radius is not None else -1.0
+		parts = [PLAN_COMMAND_BODY.pack(PLAN_COMMAND_TYPE, flags, radius, len(command.steps))]
+		for ticks, step_command in command.steps:
+			parts.append(TYPE_FIELD.pack(ticks))
+			if type(step_command) is MoveCommand:
+				x, y, z = step_command.move_direction
+				parts.append(MOVE_COMMAND_BODY.pack(MOVE_COMMAND_TYPE, x, y, z))
+			else:
+				parts.append(SHOOT_COMMAND_BODY.pack(SHOOT_COMMAND_TYPE, step_command.shoot_angle))
+		return b''.join(parts)
+
+
+class SharedMemoryCodec(BinaryCodec):
+	'''Codec of the shared memory protocol, for the agents running on the same host as the server.
+
+	The server maps a file containing a ring of snapshot slots followed by a ring of command slots, and
+	sends its geometry in the options of the handshake. The snapshots are written in place by the server,
+	with the layout of the binary protocol, and the socket only carries doorbells: a SNAPSHOT_SLOT frame
+	gives the slot of the new snapshot, and the command is written inside the matching command slot before
+	answering with a COMMAND_SLOT frame. Snapshots larger than a slot, plans and the other messages are sent through
+	the socket as binary frames.
+
+	The records are read straight from the mapping: the NumPy arrays of a snapshot are read-only views of its
+	slot, which is only rewritten by the server nb_slots ticks later. The snapshots must not be kept longer,
+	so the protocol cannot be used by pipelined agents. The command is written inside the slot of the snapshot
+	it answers, given to encode_command.
+	'''
+
+	name = SHARED_MEMORY_PROTOCOL
+
+	def __init__(self, path: str, nb_slots: int, slot_size: int, command_slot_size: int, pool: RecordPool = None):
+		super().__init__(pool)
+		self.options = {'path': path, 'nb_slots': nb_slots, 'slot_size': slot_size, 'command_slot_size': command_slot_size}
+		self._slot_size = slot_size
+		self._command_slot_size = command_slot_size
+		self._commands_offset = nb_slots * slot_size
+		with open(path, 'r+b') as file:
+			self._map = mmap.mmap(file.fileno(), nb_slots * (slot_size + command_slot_size))
+		self._snapshots = memoryview(self._map).toreadonly()
+
+	@staticmethod
+	def _read_doorbell(body: bytes) -> typing.Optional[int]:
+		message_type, = TYPE_FIELD.unpack_from(body)
+		if message_type != SNAPSHOT_SLOT_TYPE:
+			return None
+		slot, = TYPE_FIELD.unpack_from(body, TYPE_FIELD.size)
+		return slot
+
+	def _snapshot_slot(self, snapshot: typing.Union[SnapshotData, bytes, None]) -> typing.Optional[int]:
+		# The agents decoding the snapshots in another process answer the raw doorbell
+		if snapshot is None:
+			return None
+		if isinstance(snapshot, SnapshotData):
+			return snapshot.slot
+		return self._read_doorbell(snapshot)
+
+	def message_header(self, body: bytes) -> str:
+		if self._read_doorbell(body) is not None:
+			return 'ASK_COMMAND'
+		return super().message_header(body)
+
+	def decode_message(self, body: bytes) -> typing.Tuple[str, typing.Any]:
+		slot = self._read_doorbell(body)
+		if slot is None:
+			return super().decode_message(body)
+		snapshot = self.parse_snapshot(self._snapshots, slot * self._slot_size)
+		snapshot.slot = slot
+		return 'ASK_COMMAND', snapshot
+
+	def encode_command(self, command: Command, snapshot: typing.Union[SnapshotData, bytes] = None) -> bytes:
+		'''The snapshot is the answered snapshot, or its raw doorbell. The command is sent through the socket
+		when the snapshot was, or when it does not fit in a command slot.'''
+		slot = self._snapshot_slot(snapshot)
+		if slot is None or type(command) not in (MoveCommand, ShootCommand):
+			return super().encode_command(command)
+		offset = self._commands_offset + slot * self._command_slot_size
+		if type(command) is MoveCommand:
+			x, y, z = command.move_direction
+			MOVE_COMMAND_BODY.pack_into(self._map, offset, MOVE_COMMAND_TYPE, x, y, z)
+		else:
+			SHOOT_COMMAND_BODY.pack_into(self._map, offset, SHOOT_COMMAND_TYPE, command.shoot_angle)
+		return SLOT_FRAME.pack(SLOT_FRAME.size - FRAME_HEADER.size, COMMAND_SLOT_TYPE, slot)
+
+	def close(self):
+		'''Unmaps the ring, the snapshots must no longer be used. The mapping is left to the garbage collector
+		while arrays of the snapshots are still referenced.'''
+		try:
+			self._snapshots.release()
+			self._map.close()
+		except BufferError:
+			pass
+
+
+# Values of the mirrored fields the server has not sent yet, the same as the fields skipped by the JSON protocol
+# (the unknown state is -1, as in the arrays built from the records)
+MIRROR_DEFAULTS = {'team': SKIPPED_FIELD_DEFAULTS['team'], 'state': -1}
+
+
+class _MirrorTable:
+	'''Entities of one kind mirrored by the DeltaCodec: a growing structured array with one row per entity,
+	kept in the order the entities were added, and a dense index from the entities to their rows.'''
+
+	def __init__(self, dtype: np.dtype):
+		self._default_row = np.zeros((), dtype=dtype)
+		for name, value in MIRROR_DEFAULTS.items():
+			if name in dtype.names:
+				self._default_row[name] = value
+		self.rows = np.zeros(16, dtype=dtype)
+		self.entities = np.zeros(16, dtype=np.int32)
+		self.size = 0
+		self._index = np.full(64, -1, dtype=np.int64)
+
+	def _reserve_index(self, max_entity: int):
+		if max_entity >= len(self._index):
+			index = np.full(max(max_entity + 1, len(self._index) * 2), -1, dtype=np.int64)
+			index[:len(self._index)] = self._index
+			self._index = index
+
+	def _reserve_rows(self, size: int):
+		if size > len(self.rows):
+			capacity = max(size, len(self.rows) * 2)
+			self.rows = np.resize(self.rows, capacity)
+			self.entities = np.resize(self.entities, capacity)
+
+	def rows_of(self, entities: np.ndarray) -> np.ndarray:
+		'''Returns the rows of the entities, -1 for the entities that are not in the table.'''
+		rows = np.full(len(entities), -1, dtype=np.int64)
+		known = entities < len(self._index)
+		rows[known] = self._index[entities[known]]
+		return rows
+
+	def update(self, entities: np.ndarray, values: np.ndarray):
+		'''Updates the fields of the entities given by the values, the unknown entities are added.'''
+		if len(entities) == 0:
+			return
+		self._reserve_index(int(entities.max()))
+		rows = self._index[entities]
+		added = rows < 0
+		if added.any():
+			nb_added = int(added.sum())
+			self._reserve_rows(self.size + nb_added)
+			rows[added] = np.arange(self.size, self.size + nb_added)
+			self._index[entities[added]] = rows[added]
+			self.entities[rows[added]] = entities[added]
+			# The resized and compacted arrays keep stale values, the fields never sent get the defaults
+			self.rows[rows[added]] = self._default_row
+			self.size += nb_added
+		for name in values.dtype.names:
+			self.rows[name][rows] = values[name]
+
+	def remove(self, entities: np.ndarray):
+		rows = self.rows_of(entities)
+		rows = rows[rows >= 0]
+		if len(rows) == 0:
+			return
+		kept = np.ones(self.size, dtype=bool)
+		kept[rows] = False
+		self._index[self.entities[rows]] = -1
+		size = int(kept.sum())
+		self.rows[:size] = self.rows[:self.size][kept]
+		self.entities[:size] = self.entities[:self.size][kept]
+		self.size = size
+		self._index[self.entities[:size]] = np.arange(size)
+
+
+class DeltaCodec(BinaryCodec):
+	'''Codec of the delta protocol, where the server only sends what changed since the previous snapshot.
+
+	The codec keeps a mirror of the players and the projectiles, indexed by their entity. A delta first
+	lists the removed entities, then groups the changed entities by kind and change mask: each group is
+	an array of entities followed by packed records containing only the changed fields. The entities that
+	are not mirrored yet are added, the server sends them with all their fields. The mirror is stored as
+	NumPy arrays with the layout of the binary records, so the deltas are applied without any loop over
+	the entities and the snapshots are decoded by the binary protocol decoders. The other messages are
+	the same as the binary protocol.
+	'''
+
+	name = DELTA_PROTOCOL
+
+	def __init__(self, pool: RecordPool = None):
+		super().__init__(pool)
+		self._players = _MirrorTable(PLAYER_DTYPE)
+		self._projectiles = _MirrorTable(PROJECTILE_DTYPE)
+		self._group_dtypes = {}
+
+	def _group_dtype(self, dtype: np.dtype, mask: int) -> np.dtype:
+		'''Returns the dtype of the packed records of a group, only a few masks are used during a game.'''
+		group_dtype = self._group_dtypes.get((dtype, mask))
+		if group_dtype is None:
+			group_dtype = np.dtype([(name, dtype.fields[name][0]) for index, name in enumerate(dtype.names) if mask & (1 << index)])
+			self._group_dtypes[(dtype, mask)] = group_dtype
+		return group_dtype
+
+	def _apply_delta(self, body: bytes) -> int:
+		'''Updates the mirror and returns the entity of the controlled player.'''
+		_, controlled_entity, nb_removed, nb_groups = DELTA_HEADER.unpack_from(body)
+		offset = DELTA_HEADER.size
+
+		if nb_removed > 0:
+			removed = np.frombuffer(body, ENTITY_DTYPE, nb_removed, offset).astype(np.int64)
+			offset += nb_removed * ENTITY_DTYPE.itemsize
+			self._players.remove(removed)
+			self._projectiles.remove(removed)
+
+		for _ in range(nb_groups):
+			kind, mask, count = DELTA_GROUP.unpack_from(body, offset)
+			offset += DELTA_GROUP.size
+			table = self._players if kind == PLAYER_KIND else self._projectiles
+			entities = np.frombuffer(body, ENTITY_DTYPE, count, offset).astype(np.int64)
+			offset += count * ENTITY_DTYPE.itemsize
+			group_dtype = self._group_dtype(table.rows.dtype, mask)
+			table.update(entities, np.frombuffer(body, group_dtype, count, offset))
+			offset += count * group_dtype.itemsize
+		return controlled_entity
+
+	def parse_delta(self, body: bytes) -> SnapshotData:
+		'''Applies the delta to the mirror and returns the resulting snapshot. The mirrored records are copied,
+		only the controlled player is converted right away and the rest is converted on first access.'''
+		if self._pool is not None:
+			self._pool.recycle()
+		controlled_entity = self._apply_delta(body)
+		players = self._players
+		controlled = players.entities[:players.size] == controlled_entity
+		if not controlled.any():
+			raise ValueError(f'Delta snapshot of entity {controlled_entity}, which is not mirrored.')
+		controlled_player = self._parse_player_record(PLAYER_RECORD.unpack(players.rows[:players.size][controlled].tobytes()))
+		other_players = players.rows[:players.size][~controlled].tobytes()
+		projectiles = self._projectiles.rows[:self._projectiles.size].tobytes()
+		return SnapshotData.lazy(controlled_player,
+			functools.partial(self._parse_other_players, other_players, 0, len(other_players)),
+			functools.partial(self._parse_projectiles, projectiles, 0, len(projectiles)),
+			functools.partial(np.frombuffer, other_players, PLAYER_DTYPE),
+			functools.partial(np.frombuffer, projectiles, PROJECTILE_DTYPE))
+
+	def message_header(self, body: bytes) -> str:
+		message_type, = TYPE_FIELD.unpack_from(body)
+		if message_type == DELTA_SNAPSHOT_TYPE:
+			return 'ASK_COMMAND'
+		return super().message_header(body)
+
+	def decode_message(self, body: bytes) -> typing.Tuple[str, typing.Any]:
+		message_type, = TYPE_FIELD.unpack_from(body)
+		if message_type == DELTA_SNAPSHOT_TYPE:
+			return 'ASK_COMMAND', self.parse_delta(body)
+		return super().decode_message(body)
+
+
+CODECS = {
+	JSON_PROTOCOL: JsonCodec,
+	BINARY_PROTOCOL: BinaryCodec,
+	SHARED_MEMORY_PROTOCOL: SharedMemoryCodec,
+	DELTA_PROTOCOL: DeltaCodec
+}
+
+
+def make_codec(protocol: str, **options):
+	if protocol not in CODECS:
+		raise ValueError(f'Unknown protocol: {protocol}')
+	return CODECS[protocol](**options)
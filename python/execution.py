@@ -0,0 +1,281 @@
+import concurrent.futures
+import ctypes
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import threading
+import time
+import traceback
+import typing
+
+
+class DeadlineExceeded(Exception):
+	'''Raised when an AI call did not return before its deadline.'''
+
+
+class _Interrupted(BaseException):
+	'''Raised inside a worker thread to stop a call that exceeded its deadline.
+	Derives from BaseException so that "except Exception" blocks of the AI code do not catch it.'''
+
+
+def _interrupt_thread(thread: threading.Thread):
+	# Same mechanism as func_timeout: the exception is raised in the thread at its next bytecode
+	ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread.ident), ctypes.py_object(_Interrupted))
+
+
+def _worker_loop(requests: queue.SimpleQueue, results: queue.SimpleQueue):
+	try:
+		while True:
+			request = requests.get()
+			if request is None:
+				return
+			function, args, future = request
+			try:
+				result = (True, function(*args))
+			except _Interrupted:
+				raise
+			except BaseException as exc:
+				result = (False, exc)
+			if future is None:
+				results.put(result)
+			elif result[0]:
+				future.set_result(result[1])
+			else:
+				future.set_exception(result[1])
+	except _Interrupted:
+		return
+
+
+class DeadlineExecutor:
+	'''Long-lived worker thread running the AI calls of an agent with a deadline.
+
+	Unlike func_timeout, which spawns a new thread for every call, the same worker thread is reused
+	between ticks. When a call exceeds its deadline, DeadlineExceeded is raised in the caller, the
+	worker is interrupted and a fresh worker is started on the next call.
+	'''
+
+	def __init__(self, name: str = 'ai-worker'):
+		self._name = name
+		self._thread = None
+		self._requests = None
+		self._results = None
+
+	def _start_worker(self):
+		self._requests = queue.SimpleQueue()
+		self._results = queue.SimpleQueue()
+		self._thread = threading.Thread(target=_worker_loop, args=(self._requests, self._results), name=self._name, daemon=True)
+		self._thread.start()
+
+	def call(self, timeout: float, function: typing.Callable, args: typing.Tuple = ()) -> typing.Any:
+		'''Runs function(*args) on the worker thread and returns its result, or raises the exception it raised.
+		Raises DeadlineExceeded if the call does not return within timeout seconds.'''
+		if self._thread is None:
+			self._start_worker()
+
+		self._requests.put((function, args, None))
+		try:
+			succeeded, value = self._results.get(timeout=max(timeout, 0.0))
+		except queue.Empty:
+			self.interrupt()
+			raise DeadlineExceeded(f'AI call did not return within {timeout:.3f} seconds.') from None
+
+		if not succeeded:
+			raise value
+		return value
+
+	def submit(self, function: typing.Callable, args: typing.Tuple = ()) -> concurrent.futures.Future:
+		'''Runs function(*args) on the worker thread without waiting for it. The caller is in charge of
+		the deadline and must call interrupt() if the returned future is not done in time.'''
+		if self._thread is None:
+			self._start_worker()
+
+		future = concurrent.futures.Future()
+		self._requests.put((function, args, future))
+		return future
+
+	def interrupt(self):
+		'''Interrupts the running call. The worker is abandoned along with its queues (and any late
+		result), a fresh worker is started on the next call.'''
+		if self._thread is not None:
+			_interrupt_thread(self._thread)
+			# Wakes the worker if the call returned in the meantime, the exception is only raised once it runs again
+			self._requests.put(None)
+			self._thread = None
+
+	def shutdown(self):
+		'''Stops the worker thread once it is idle.'''
+		if self._thread is not None:
+			self._requests.put(None)
+			self._thread = None
+
+
+# Signal used to interrupt the call running inside a worker process, processes are terminated when it does not exist
+INTERRUPT_SIGNAL = getattr(signal, 'SIGUSR1', None)
+
+
+class _WorkerState:
+	# Only the calls are interrupted, a late signal must not break the communication with the parent
+	running = False
+
+
+def _raise_interrupted(signum, frame):
+	if _WorkerState.running:
+		_WorkerState.running = False
+		raise _Interrupted()
+
+
+def _picklable_exception(exc: BaseException) -> BaseException:
+	try:
+		pickle.dumps(exc)
+		return exc
+	except Exception:
+		return Exception(f'{type(exc).__name__}: {exc}')
+
+
+def _process_worker_loop(connection, function: typing.Callable):
+	if INTERRUPT_SIGNAL is not None:
+		signal.signal(INTERRUPT_SIGNAL, _raise_interrupted)
+	while True:
+		request = connection.recv()
+		if request is None:
+			break
+		sequence, args = request
+		try:
+			try:
+				_WorkerState.running = True
+				result = (sequence, True, function(*args))
+			finally:
+				_WorkerState.running = False
+		except _Interrupted:
+			result = (sequence, False, DeadlineExceeded('AI call interrupted.'))
+		except BaseException as exc:
+			# The parent only receives the exception, the traceback is printed here
+			traceback.print_exc()
+			result = (sequence, False, _picklable_exception(exc))
+		try:
+			connection.send(result)
+		except Exception as exc:
+			connection.send((sequence, False, _picklable_exception(exc)))
+	# Gives the function back, along with the state it accumulated inside the worker
+	connection.send((None, True, function))
+	connection.close()
+
+
+# Modules imported by the forkserver once, before it forks the workers: the agents and the libraries used by the teams
+WORKER_PRELOAD = ['process_agent', 'session', 'numpy', 'scipy', 'shapely', 'sklearn']
+
+
+def worker_context(preload: typing.List[str] = None) -> multiprocessing.context.BaseContext:
+	'''Context starting the workers from a process that is not running the threads of the caller, so that they can
+	be started by several threads at once: the forkserver, which imports the preloaded modules (the missing ones
+	are skipped) before forking the workers, or spawn on the platforms without forkserver.'''
+	if 'forkserver' not in multiprocessing.get_all_start_methods():
+		return multiprocessing.get_context('spawn')
+	context = multiprocessing.get_context('forkserver')
+	# Only used when the forkserver is started, by the first worker of the team sessions or of a RoundPool
+	context.set_forkserver_preload(WORKER_PRELOAD if preload is None else preload)
+	return context
+
+
+class ProcessExecutor:
+	'''Long-lived worker process running a function with a deadline.
+
+	The function (and its arguments) are sent to the worker through a pipe, so they must be picklable
+	unless the processes are forked (see worker_context). The worker keeps its own copy of the function between the calls:
+	the state it accumulates lives in the worker, and is given back by shutdown(). When a call exceeds
+	its deadline, DeadlineExceeded is raised in the caller and the call is interrupted inside the worker,
+	or the worker is terminated on platforms without INTERRUPT_SIGNAL.
+	'''
+
+	def __init__(self, function: typing.Callable, name: str = 'ai-worker', shutdown_timeout: float = 1.0,
+	  context: multiprocessing.context.BaseContext = None):
+		self._function = function
+		self._name = name
+		self._shutdown_timeout = shutdown_timeout
+		# Start method of the worker, the default one of multiprocessing when not given
+		self._context = context if context is not None else multiprocessing
+		self._process = None
+		self._connection = None
+		self._sequence = 0
+
+	def start(self):
+		'''Starts the worker process, so that its startup is not counted in the deadline of the first call.'''
+		if self._process is not None:
+			return
+		self._connection, worker_connection = self._context.Pipe()
+		self._process = self._context.Process(target=_process_worker_loop, args=(worker_connection, self._function), name=self._name, daemon=True)
+		self._process.start()
+		worker_connection.close()
+
+	def _receive(self, sequence: typing.Optional[int], timeout: float) -> typing.Tuple[bool, typing.Any]:
+		deadline = time.perf_counter() + max(timeout, 0.0)
+		while True:
+			if not self._connection.poll(max(deadline - time.perf_counter(), 0.0)):
+				raise DeadlineExceeded(f'AI call did not return within {timeout:.3f} seconds.')
+			try:
+				answer_sequence, succeeded, value = self._connection.recv()
+			except EOFError:
+				self._terminate()
+				raise Exception('The AI worker process exited unexpectedly.') from None
+			# Skips the late answers of the interrupted calls
+			if answer_sequence == sequence:
+				return succeeded, value
+
+	def call(self, timeout: float, args: typing.Tuple = ()) -> typing.Any:
+		'''Runs function(*args) inside the worker process and returns its result, or raises the exception it raised.
+		Raises DeadlineExceeded if the call does not return within timeout seconds.'''
+		if self._process is None:
+			self.start()
+
+		self._sequence += 1
+		self._connection.send((self._sequence, args))
+		try:
+			succeeded, value = self._receive(self._sequence, timeout)
+		except DeadlineExceeded:
+			self.interrupt()
+			raise
+
+		if not succeeded:
+			raise value
+		return value
+
+	def interrupt(self):
+		'''Interrupts the running call, the worker is kept alive for the next calls.'''
+		if self._process is None:
+			return
+		if INTERRUPT_SIGNAL is None:
+			self._terminate()
+			return
+		try:
+			os.kill(self._process.pid, INTERRUPT_SIGNAL)
+		except ProcessLookupError:
+			pass
+
+	def _terminate(self):
+		self._process.terminate()
+		self._process.join()
+		self._connection.close()
+		self._process = None
+		self._connection = None
+
+	def shutdown(self) -> typing.Callable:
+		'''Stops the worker process and returns the function with the state it accumulated inside the worker.
+		The function is returned unchanged if the worker does not stop within shutdown_timeout seconds
+		(e.g. when it is stuck inside native code), the worker is then terminated.'''
+		if self._process is None:
+			return self._function
+		try:
+			self._connection.send(None)
+			_, self._function = self._receive(None, self._shutdown_timeout)
+		except Exception as exc:
+			print(f'Could not retrieve the state of the AI worker process: {exc}')
+			if self._process is not None:
+				self._terminate()
+			return self._function
+		self._process.join()
+		self._connection.close()
+		self._process = None
+		self._connection = None
+		return self._function
@@ -0,0 +1,350 @@
+import typing
+import json
+from dataclasses import dataclass
+from abc import ABC, abstractmethod
+import numpy as np
+
+# Names of the character states, in the order of the server enumeration
+STATES = ['IDLE', 'MOVING', 'SHOOTING', 'HIT', 'DEAD']
+STATE_INDICES = {state: index for index, state in enumerate(STATES)}
+
+# Layout of the player and projectile records, shared with the binary protocol
+PLAYER_DTYPE = np.dtype([('pos', '<f4', (3,)), ('speed', '<f4', (3,)), ('health', '<f4'),
+	('team', '<i4'), ('score', '<f4'), ('state', '<i4')])
+PROJECTILE_DTYPE = np.dtype([('pos', '<f4', (3,)), ('speed', '<f4', (3,))])
+
+
+@dataclass
+class PlayerData:
+	'''Structure containing the position (x, y, z), speed (dx, dy, dz), health (float), 
+	team (integer) and score (float, in seconds) of a player.'''
+	__slots__ = ('position', 'speed', 'health', 'team', 'score')
+	position: typing.Tuple[float, float, float]
+	speed: typing.Tuple[float, float, float]
+	health: float
+	team: int
+	score: float
+
+@dataclass
+class ProjectileData:
+	'''Structure containing the position (x, y, z) and speed (dx, dy, dz) of a projectile.'''
+	__slots__ = ('position', 'speed')
+	position: typing.Tuple[float, float, float]
+	speed: typing.Tuple[float, float]
+
+class RecordPool:
+	'''Pool of PlayerData and ProjectileData records, recycled between the ticks of an agent.
+
+	Each call to recycle starts a new generation (one per snapshot). The records handed out during a
+	generation stay untouched for that generation and the next one, so the AI can still compare the
+	current snapshot with the previous one; they are reused from the generation after. The records
+	must be treated as read-only and copied if the AI keeps them longer than one tick. At most
+	max_records records of each kind are kept for reuse, the others are left to the garbage collector.'''
+
+	def __init__(self, max_records: int = 256):
+		self.max_records = max_records
+		# Records handed out during the current and the previous generation
+		self._players = []
+		self._projectiles = []
+		self._previous_players = []
+		self._previous_projectiles = []
+		# Records of older generations, reused by player and projectile
+		self._free_players = []
+		self._free_projectiles = []
+
+	def _release(self, free: typing.List, released: typing.List):
+		free.extend(released[:self.max_records - len(free)])
+
+	def recycle(self):
+		'''Starts a new generation, the records of the generation before the previous one are reused.'''
+		self._release(self._free_players, self._previous_players)
+		self._release(self._free_projectiles, self._previous_projectiles)
+		self._previous_players, self._players = self._players, []
+		self._previous_projectiles, self._projectiles = self._projectiles, []
+
+	def player(self, position: typing.Tuple[float, float, float], speed: typing.Tuple[float, float, float],
+	  health: float, team: int, score: float) -> PlayerData:
+		'''Same signature as the PlayerData constructor.'''
+		if not self._free_players:
+			record = PlayerData(position, speed, health, team, score)
+		else:
+			record = self._free_players.pop()
+			record.position = position
+			record.speed = speed
+			record.health = health
+			record.team = team
+			record.score = score
+		self._players.append(record)
+		return record
+
+	def projectile(self, position: typing.Tuple[float, float, float], speed: typing.Tuple[float, float, float]) -> ProjectileData:
+		'''Same signature as the ProjectileData constructor.'''
+		if not self._free_projectiles:
+			record = ProjectileData(position, speed)
+		else:
+			record = self._free_projectiles.pop()
+			record.position = position
+			record.speed = speed
+		self._projectiles.append(record)
+		return record
+
+
+def players_to_array(players: typing.List[PlayerData]) -> np.ndarray:
+	'''Converts PlayerData records into a read-only array of PLAYER_DTYPE (the state is unknown and set to -1).'''
+	array = np.array([(player.position, player.speed, player.health, player.team, player.score, -1)
+		for player in players], dtype=PLAYER_DTYPE)
+	array.setflags(write=False)
+	return array
+
+
+def projectiles_to_array(projectiles: typing.List[ProjectileData]) -> np.ndarray:
+	'''Converts ProjectileData records into a read-only array of PROJECTILE_DTYPE.'''
+	array = np.array([(projectile.position, projectile.speed) for projectile in projectiles], dtype=PROJECTILE_DTYPE)
+	array.setflags(write=False)
+	return array
+
+
+class SnapshotData:
+	'''Structure containing the PlayerData of the controlled player and the other players,
+	as well as the ProjectileData of all projectiles.
+
+	The snapshots built by the agent are lazy: the other players and the projectiles are only
+	decoded the first time they are accessed, so AIs that never look at them do not pay for it.
+
+	The other players and the projectiles are also exposed as read-only NumPy arrays, built once
+	per snapshot on first access, for vectorized AIs: player_positions and player_speeds (N x 3),
+	player_health and player_team (N), in the order of other_players, as well as projectile_positions
+	and projectile_speeds (M x 3), in the order of projectiles. With the binary protocol, those arrays
+	are views on the received message, without any copy.
+
+	With the shared memory protocol, slot is the slot of the ring holding the snapshot (None otherwise).'''
+
+	def __init__(self, controlled_player: PlayerData, other_players: typing.List[PlayerData],
+	  projectiles: typing.List[ProjectileData]):
+		self.controlled_player = controlled_player
+		self.slot = None
+		self._other_players = other_players
+		self._projectiles = projectiles
+		self._load_other_players = None
+		self._load_projectiles = None
+		self._player_array = None
+		self._projectile_array = None
+		self._load_player_array = None
+		self._load_projectile_array = None
+
+	@classmethod
+	def lazy(cls, controlled_player: PlayerData, load_other_players: typing.Callable[[], typing.List[PlayerData]],
+	  load_projectiles: typing.Callable[[], typing.List[ProjectileData]],
+	  load_player_array: typing.Callable[[], np.ndarray] = None,
+	  load_projectile_array: typing.Callable[[], np.ndarray] = None) -> 'SnapshotData':
+		'''Builds a snapshot whose other players and projectiles are decoded on first access.
+		The array loaders are optional, the arrays are otherwise built from the records.'''
+		snapshot = cls(controlled_player, None, None)
+		snapshot._load_other_players = load_other_players
+		snapshot._load_projectiles = load_projectiles
+		snapshot._load_player_array = load_player_array
+		snapshot._load_projectile_array = load_projectile_array
+		return snapshot
+
+	@property
+	def other_players(self) -> typing.List[PlayerData]:
+		if self._other_players is None:
+			self._other_players = self._load_other_players()
+			self._load_other_players = None
+		return self._other_players
+
+	@other_players.setter
+	def other_players(self, other_players: typing.List[PlayerData]):
+		self._other_players = other_players
+		self._load_other_players = None
+		self._player_array = None
+		self._load_player_array = None
+
+	@property
+	def projectiles(self) -> typing.List[ProjectileData]:
+		if self._projectiles is None:
+			self._projectiles = self._load_projectiles()
+			self._load_projectiles = None
+		return self._projectiles
+
+	@projectiles.setter
+	def projectiles(self, projectiles: typing.List[ProjectileData]):
+		self._projectiles = projectiles
+		self._load_projectiles = None
+		self._projectile_array = None
+		self._load_projectile_array = None
+
+	@property
+	def player_array(self) -> np.ndarray:
+		'''Structured array (PLAYER_DTYPE) of the other players.'''
+		if self._player_array is None:
+			if self._load_player_array is not None:
+				self._player_array = self._load_player_array()
+				self._load_player_array = None
+			else:
+				self._player_array = players_to_array(self.other_players)
+		return self._player_array
+
+	@property
+	def projectile_array(self) -> np.ndarray:
+		'''Structured array (PROJECTILE_DTYPE) of the projectiles.'''
+		if self._projectile_array is None:
+			if self._load_projectile_array is not None:
+				self._projectile_array = self._load_projectile_array()
+				self._load_projectile_array = None
+			else:
+				self._projectile_array = projectiles_to_array(self.projectiles)
+		return self._projectile_array
+
+	@property
+	def player_positions(self) -> np.ndarray:
+		return self.player_array['pos']
+
+	@property
+	def player_speeds(self) -> np.ndarray:
+		return self.player_array['speed']
+
+	@property
+	def player_health(self) -> np.ndarray:
+		return self.player_array['health']
+
+	@property
+	def player_team(self) -> np.ndarray:
+		return self.player_array['team']
+
+	@property
+	def projectile_positions(self) -> np.ndarray:
+		return self.projectile_array['pos']
+
+	@property
+	def projectile_speeds(self) -> np.ndarray:
+		return self.projectile_array['speed']
+
+	def __eq__(self, other) -> bool:
+		if type(other) is not type(self):
+			return NotImplemented
+		return (self.controlled_player, self.other_players, self.projectiles) == \
+			(other.controlled_player, other.other_players, other.projectiles)
+
+	def __repr__(self) -> str:
+		return (f'{type(self).__name__}(controlled_player={self.controlled_player!r}, '
+			f'other_players={self.other_players!r}, projectiles={self.projectiles!r})')
+
+
+@dataclass
+class Subscription:
+	'''Subset of the snapshots the agent is interested in, declared to the server in the handshake.
+
+	other_players: 'all' the other players, only the 'nearest' one, or 'none' of them.
+	projectiles: when False, the snapshots contain no projectile.
+	projectile_radius: only the projectiles closer than this distance to the controlled player are sent.
+	skip_fields: fields of the records that are not sent (speed, state, health, team or score).
+	The binary and shared memory protocols keep their fixed records, the skipped fields are still sent.
+	'''
+	other_players: str = 'all'
+	projectiles: bool = True
+	projectile_radius: typing.Optional[float] = None
+	skip_fields: typing.Optional[typing.List[str]] = None
+
+	def to_dict(self) -> typing.Dict:
+		document = {'other_players': self.other_players, 'projectiles': self.projectiles}
+		if self.projectile_radius is not None:
+			document['projectile_radius'] = float(self.projectile_radius)
+		if self.skip_fields:
+			document['skip_fields'] = list(self.skip_fields)
+		return document
+
+
+@dataclass
+class Command(ABC, json.JSONEncoder):
+	'''Base class for all the commands'''
+	command_type: str
+
+@dataclass
+class MoveCommand(Command):
+	'''Asks the player to move. The direction will be normalized inside the game server 
+	so there is no need to have a norm higher than 1 ;)
+	Giving a move direction with a norm equal to 0 will put the character on IDLE state.
+	'''
+	move_direction: typing.Tuple[float, float, float]
+	
+	def __init__(self, move_direction):
+		self.command_type = 'MOVE'
+		self.move_direction = move_direction
+
+@dataclass
+class ShootCommand(Command):
+	'''
+	Asks the player where to shoot. The angle needs to be given in degrees and are directed
+	counterclockwise between 0 and 360 deg.
+	'''
+	shoot_angle: float
+
+	def __init__(self, shoot_angle):
+		self.command_type = 'SHOOT'
+		self.shoot_angle = shoot_angle
+
+
+@dataclass
+class PlanCommand(Command):
+	'''
+	Schedules several commands at once, the server then plays them without asking the AI.
+	The steps are (ticks, command) pairs played in order, the command of a step (a MoveCommand or a
+	ShootCommand) is issued on each of its ticks, as if the AI had returned it that many times.
+	The AI is asked again once the plan is over, or as soon as the player takes damage (when
+	interrupt_on_damage is set) or a projectile comes toward it closer than projectile_radius (when given).
+	'''
+	steps: typing.List[typing.Tuple[int, Command]]
+	interrupt_on_damage: bool
+	projectile_radius: typing.Optional[float]
+
+	def __init__(self, steps, interrupt_on_damage=True, projectile_radius=None):
+		self.command_type = 'PLAN'
+		self.steps = steps
+		self.interrupt_on_damage = interrupt_on_damage
+		self.projectile_radius = projectile_radius
+
+
+@dataclass
+class InvalidCommand(Command):
+	'''
+	Invalid command as a crash test for the server
+	'''
+	whatever_value : str
+
+	def __init__(self, value):
+		self.command_type = 'INVALID'
+		self.whatever_value = value
+
+
+class Strategy(ABC):
+	'''
+	Stateful AI of a team, given to the agents instead of the my_ai(gamestate, my_data) function.
+	The state lives in the attributes of the strategy instead of the my_data dictionary: what does not
+	change during the game (the walls of the map, the helpers) is computed once by setup, outside of
+	the time of the AI. Only step is counted in the ai_time of the agent.
+	'''
+
+	def setup(self, initial_snapshot: SnapshotData):
+		'''Called with the first snapshot of the game, before the first step, within its own time budget
+		(the setup_time of the agent).'''
+		pass
+
+	@abstractmethod
+	def step(self, snapshot: SnapshotData) -> Command:
+		'''Returns the command of the player for the given snapshot, timed like the my_ai function.'''
+		pass
+
+	def teardown(self):
+		'''Called once the game is over (when setup was called), not timed.'''
+		pass
+
+
+# The agents run a strategy as the AI function strategy_step, with the strategy as data: the strategy then
+# goes wherever the data goes (worker processes, sessions) and is given back as the data of the agent
+def strategy_step(snapshot: SnapshotData, strategy: Strategy) -> Command:
+	return strategy.step(snapshot)
+
+
+def setup_strategy(snapshot: SnapshotData, strategy: Strategy):
+	strategy.setup(snapshot)
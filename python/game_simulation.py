@@ -1,14 +1,24 @@
-from agent import AIAgent, challenge_thread_work, SnapshotData, Command, AgentResult
+from agent import AIAgent, ServerReadiness, challenge_thread_work, SnapshotData, Subscription, Command, Strategy, AgentResult, JSON_PROTOCOL
+from process_agent import ProcessAIAgent
+from session import TeamSession
+from match_host import MatchHost
+from jvm_startup import cds_options, dump_options, publish_archive
+from jre import resolve_java
+from round_pool import RoundPool
 import multiprocessing
+import queue
 import typing
 import threading
 import datetime
-import time
+import os
 
 class GameSimulation:
 
 	def __init__(self, jvm_path: str, game_time: float = 60.0, ai_time: float = 150.0,
-	  commands_per_second: int = 4, save_file: str = None, port: int = 2049):
+	  commands_per_second: int = 4, save_file: str = None, port: typing.Optional[int] = 2049, protocol: str = JSON_PROTOCOL,
+	  pooled_records: bool = False, agent_processes: bool = False, socket_path: str = None,
+	  subscription: Subscription = None, tick_deadline: float = None, host: MatchHost = None,
+	  jvm_options: typing.List[str] = None, cds_archive: str = None, pool: RoundPool = None):
 		self._first_agent_username = None
 		self._second_agent_username = None
 
@@ -18,73 +28,179 @@ class GameSimulation:
 		self._first_agent_data = None
 		self._second_agent_data = None
 
+		self._first_agent_session = None
+		self._second_agent_session = None
+
 		self._process = None
+		self._queue = None
 
 		self.game_time = game_time
 		self.ai_time = ai_time
 		self.commands_per_second = commands_per_second
 		self.save_file = save_file
-		self._jvm_path = jvm_path
+		# The Java runtime is resolved by jre.resolve_java when not given
+		self._jvm_path = jvm_path if jvm_path is not None or host is not None else resolve_java()
+		# The server binds a free port when the port is None, so that any number of simulations can run at once
 		self._port = port
+		# The agents connect through this unix domain socket instead of the TCP port when given
+		self.socket_path = socket_path
+		self.protocol = protocol
+		self.pooled_records = pooled_records
+		# Runs the AI function of each agent inside its own process, so that the agents do not share the GIL
+		self.agent_processes = agent_processes
+		# Subset of the snapshots sent to both agents, see Subscription
+		self.subscription = subscription
+		# Real-time mode: the server waits at most this deadline (in milliseconds) for each command and the agents
+		# answer the most recent snapshot
+		self.tick_deadline = tick_deadline
+		# The rounds are played by this running match host instead of a new server process
+		self.host = host
+		# Options of the server JVM, see jvm_startup.STARTUP_JVM_OPTIONS
+		self.jvm_options = jvm_options
+		# Class-data-sharing archive of the server, recorded by the first round when it does not exist yet
+		self.cds_archive = cds_archive
+		# The rounds are played by the warm workers of this pool instead of a new process per round
+		self.pool = pool
 
 		if save_file is None:
 			date_time = datetime.datetime.now()
 			self.save_file = date_time.strftime('%Y-%m-%d-%H-%M-%S.%f')[:-3] + '.hackathon'
 
-	def set_first_agent(self, username: str, ai: typing.Callable[[SnapshotData, typing.Dict], Command], data: typing.Dict):
+	def set_first_agent(self, username: str, ai: typing.Union[typing.Callable[[SnapshotData, typing.Dict], Command], Strategy], data: typing.Dict = None):
 		self._first_agent_username = username
 		self._first_agent_ai = ai
 		self._first_agent_data = data
+		self._first_agent_session = None
 
-	def set_second_agent(self, username: str, ai: typing.Callable[[SnapshotData, typing.Dict], Command], data: typing.Dict):
+	def set_second_agent(self, username: str, ai: typing.Union[typing.Callable[[SnapshotData, typing.Dict], Command], Strategy], data: typing.Dict = None):
 		self._second_agent_username = username
 		self._second_agent_ai = ai
 		self._second_agent_data = data
-
-	def _round_worker(self, queue: multiprocessing.Queue):
-		challenge_thread = threading.Thread(target=challenge_thread_work, args=(self._jvm_path, self.save_file, self.game_time, self.ai_time, self.commands_per_second, self._port))
+		self._second_agent_session = None
+
+	def set_first_session(self, username: str, session: TeamSession, data: typing.Dict = None):
+		'''The first agent is played by the session of its team, along with its other matches. The session of a
+		team module gives fresh data to the match when no data is given, see TeamSession.for_team.'''
+		self.set_first_agent(username, session.ai, data)
+		self._first_agent_session = session
+
+	def set_second_session(self, username: str, session: TeamSession, data: typing.Dict = None):
+		'''The second agent is played by the session of its team, along with its other matches. The session of a
+		team module gives fresh data to the match when no data is given, see TeamSession.for_team.'''
+		self.set_second_agent(username, session.ai, data)
+		self._second_agent_session = session
+
+	def _create_agent(self, port: int, session: TeamSession, username: str, team: int, ai: typing.Callable, data: typing.Dict) -> AIAgent:
+		options = dict(port=port, protocol=self.protocol, pooled_records=self.pooled_records, socket_path=self.socket_path,
+			subscription=self.subscription, pipelined=self.tick_deadline is not None)
+		if session is not None:
+			# The save file identifies the match inside the session
+			return session.agent(self.save_file, username, team, data, self.ai_time, **options)
+		agent_class = ProcessAIAgent if self.agent_processes else AIAgent
+		return agent_class(username, team, ai, data, self.ai_time, **options)
+
+	def _server_jvm_options(self) -> typing.Tuple[typing.List[str], typing.Optional[str]]:
+		'''Options of the server JVM of a round, and the temporary file the round records the archive to.'''
+		jvm_options = list(self.jvm_options or [])
+		if self.cds_archive is None:
+			return jvm_options, None
+		if os.path.exists(self.cds_archive):
+			return jvm_options + cds_options(self.cds_archive), None
+		options, temporary_archive = dump_options(self.cds_archive)
+		return jvm_options + options, temporary_archive
+
+	def play_round(self) -> typing.Tuple[typing.List[AgentResult], typing.List[typing.Any]]:
+		'''Plays a round inside the current process and returns its results, start_round plays it in the background.'''
+		ready = ServerReadiness()
+		temporary_archive = None
+		port = self._port if self._port is not None else 0
+		match_args = (self.save_file, self.game_time, self.ai_time, self.commands_per_second, port, self.socket_path, self.tick_deadline, ready)
+		if self.host is not None:
+			challenge_thread = threading.Thread(target=self.host.play_match, args=match_args)
+		else:
+			jvm_options, temporary_archive = self._server_jvm_options()
+			challenge_thread = threading.Thread(target=challenge_thread_work, args=(self._jvm_path,) + match_args,
+				kwargs=dict(jvm_options=jvm_options))
 		challenge_thread.start()
 
-		time.sleep(1)
+		# The server queues the connections once it listens, both agents connect right away
+		ready.wait()
+		if not ready.listening:
+			# The server exited before listening, the agents would only retry to connect
+			challenge_thread.join()
+			return self._server_failure(), [self._first_agent_data, self._second_agent_data]
+		if ready.port is not None:
+			port = ready.port
 
-		first_agent = AIAgent(self._first_agent_username, 0, self._first_agent_ai, self._first_agent_data, self.ai_time, port=self._port)
-		second_agent = AIAgent(self._second_agent_username, 1, self._second_agent_ai, self._second_agent_data, self.ai_time, port=self._port)
+		first_agent = self._create_agent(port, self._first_agent_session, self._first_agent_username, 0, self._first_agent_ai, self._first_agent_data)
+		second_agent = self._create_agent(port, self._second_agent_session, self._second_agent_username, 1, self._second_agent_ai, self._second_agent_data)
 
 		first_agent.start()
-		time.sleep(1)
 		second_agent.start()
 
 		first_agent.join()
 		second_agent.join()
 
 		challenge_thread.join()
+		if temporary_archive is not None:
+			publish_archive(temporary_archive, self.cds_archive)
 
-		queue.put(([first_agent.results, second_agent.results], [self._first_agent_data, self._second_agent_data]), block=True)
+		return [first_agent.results, second_agent.results], [first_agent.data, second_agent.data]
+
+	def _server_failure(self) -> typing.List[AgentResult]:
+		error = 'The server exited before accepting the agents.'
+		return [AgentResult(self._first_agent_username, 0, 0.0, False, True, error, 'server'),
+			AgentResult(self._second_agent_username, 1, 0.0, False, True, error, 'server')]
+
+	def _round_worker(self, queue: multiprocessing.Queue):
+		queue.put(self.play_round(), block=True)
 
 	def start_round(self) -> typing.List[AgentResult]:
 		if self._process is not None:
 			raise Exception('This game simulation already has a process running.')
 
 		assert self._first_agent_username is not None
-		assert self._first_agent_ai is not None
+		# The session of a team module has its AI function inside its worker
+		assert self._first_agent_ai is not None or self._first_agent_session is not None
 
 		assert self._second_agent_username is not None
-		assert self._second_agent_ai is not None
-
-		self._queue = multiprocessing.Queue()
-
-		self._process = multiprocessing.Process(target=self._round_worker, args=(self._queue,))
+		# The session of a team module has its AI function inside its worker
+		assert self._second_agent_ai is not None or self._second_agent_session is not None
+
+		if self._first_agent_session is not None or self._second_agent_session is not None:
+			# The sessions live in this process, the round is played by a thread
+			self._queue = queue.Queue()
+			self._process = threading.Thread(target=self._round_worker, args=(self._queue,))
+		elif self.pool is not None:
+			# The round is sent to an idle worker of the pool, its future gives back the results
+			self._process = self.pool.submit(self.play_round)
+			return
+		else:
+			self._queue = multiprocessing.Queue()
+			self._process = multiprocessing.Process(target=self._round_worker, args=(self._queue,))
 		self._process.start()
 
-
 	def end_round(self) -> typing.Tuple[typing.List[AgentResult], typing.List[typing.Any]]:
 		if self._process is None:
 			raise Exception('No round launched for this game simulation.')
 
-		agents_results, agents_data = self._queue.get()
-		self._process.join()
-
-		self._process = None
+		try:
+			if self._queue is None:
+				agents_results, agents_data = self._process.result()
+			else:
+				agents_results, agents_data = self._queue.get()
+				self._process.join()
+		finally:
+			self._process = None
+			self._queue = None
 
 		return agents_results, agents_data
 
+	def __getstate__(self):
+		# The simulations sent to the workers of a pool leave the round and the pool behind
+		state = self.__dict__.copy()
+		state['_process'] = None
+		state['_queue'] = None
+		state['pool'] = None
+		return state
+
@@ -0,0 +1,210 @@
+import functools
+import hashlib
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+# Version of the JRE installed when no suitable Java runtime is found
+JRE_VERSION = '16'
+
+# Oldest Java runtime able to run the challenge server with all its transports (the unix domain sockets need Java 16)
+MIN_JAVA_VERSION = 16
+
+# Local cache of the JRE archives, named after their SHA-256, and of their extracted runtimes
+CACHE_DIR = os.environ.get('CHALLENGE_JRE_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'challenge-server', 'jre'))
+
+# Archive formats of the JRE distributions
+ARCHIVE_EXTENSIONS = ['.tar.gz', '.zip']
+
+_JAVA_VERSION_PATTERN = re.compile(r'version "(\d+)(?:\.(\d+))?')
+
+
+class JREError(Exception):
+	'''Raised when no Java runtime could be found nor installed.'''
+	pass
+
+
+def parse_java_version(output: str) -> typing.Optional[int]:
+	'''Major version printed by java -version, None when the output does not contain any.'''
+	match = _JAVA_VERSION_PATTERN.search(output)
+	if match is None:
+		return None
+	major = int(match.group(1))
+	# The versions before 9 are named 1.<major>
+	return int(match.group(2) or 0) if major == 1 else major
+
+
+def java_version(java_path: str) -> typing.Optional[int]:
+	'''Major version of a Java runtime, None when it does not run.'''
+	try:
+		output = subprocess.run([java_path, '-version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+			universal_newlines=True, timeout=30).stdout
+	except (OSError, subprocess.SubprocessError):
+		return None
+	return parse_java_version(output)
+
+
+def _suitable(java_path: typing.Optional[str]) -> bool:
+	if java_path is None or not os.path.isfile(java_path):
+		return False
+	version = java_version(java_path)
+	return version is not None and version >= MIN_JAVA_VERSION
+
+
+def file_sha256(path: str) -> str:
+	digest = hashlib.sha256()
+	with open(path, 'rb') as file:
+		for block in iter(lambda: file.read(1 << 20), b''):
+			digest.update(block)
+	return digest.hexdigest()
+
+
+def _archive_extension(path: str) -> str:
+	for extension in ARCHIVE_EXTENSIONS:
+		if path.endswith(extension):
+			return extension
+	raise JREError(f'Unknown archive format: {path}')
+
+
+def _cache_key(version: str) -> str:
+	return f'{version}-{sys.platform}-{platform.machine()}'
+
+
+def _read_index(cache_dir: str) -> typing.Dict[str, str]:
+	try:
+		with open(os.path.join(cache_dir, 'index.json'), 'r') as file:
+			return json.load(file)
+	except (OSError, ValueError):
+		return {}
+
+
+def _write_index(cache_dir: str, index: typing.Dict[str, str]):
+	# Replaced at once, the other processes never read a partial index
+	temporary_path = os.path.join(cache_dir, f'index.json.{os.getpid()}.tmp')
+	with open(temporary_path, 'w') as file:
+		json.dump(index, file, indent=4)
+	os.replace(temporary_path, os.path.join(cache_dir, 'index.json'))
+
+
+def _cached_archive(cache_dir: str, sha256: str) -> typing.Optional[str]:
+	for extension in ARCHIVE_EXTENSIONS:
+		path = os.path.join(cache_dir, 'archives', sha256 + extension)
+		if os.path.isfile(path):
+			return path
+	return None
+
+
+def _find_java(directory: str) -> typing.Optional[str]:
+	for root, _, files in os.walk(directory):
+		if 'java' in files and os.path.basename(root) == 'bin':
+			return os.path.join(root, 'java')
+	return None
+
+
+def add_archive(archive: str, cache_dir: str = CACHE_DIR, version: str = None, sha256: str = None) -> str:
+	'''Copies a JRE archive into the cache under its SHA-256 and returns it, the archive is then used by
+	resolve_java for the given version without network access. Raises JREError when the archive does not
+	match the expected checksum.'''
+	digest = file_sha256(archive)
+	if sha256 is not None and digest != sha256.lower():
+		raise JREError(f'The checksum of {archive} is {digest}, expected {sha256}.')
+	if _cached_archive(cache_dir, digest) is None:
+		os.makedirs(os.path.join(cache_dir, 'archives'), exist_ok=True)
+		path = os.path.join(cache_dir, 'archives', digest + _archive_extension(archive))
+		temporary_path = f'{path}.{os.getpid()}.tmp'
+		shutil.copyfile(archive, temporary_path)
+		os.replace(temporary_path, path)
+	if version is not None:
+		index = _read_index(cache_dir)
+		index[_cache_key(version)] = digest
+		_write_index(cache_dir, index)
+	return digest
+
+
+def _extract_cached(cache_dir: str, sha256: str) -> typing.Optional[str]:
+	'''Java runtime of a cached archive, extracted once. The archive is checked against its checksum first.'''
+	runtime_dir = os.path.join(cache_dir, 'runtimes', sha256)
+	java_path = _find_java(runtime_dir) if os.path.isdir(runtime_dir) else None
+	if java_path is not None:
+		return java_path
+	archive = _cached_archive(cache_dir, sha256)
+	if archive is None or file_sha256(archive) != sha256:
+		return None
+	os.makedirs(os.path.join(cache_dir, 'runtimes'), exist_ok=True)
+	# Extracted next to its final place, then moved at once
+	temporary_dir = tempfile.mkdtemp(prefix=f'{sha256}.', dir=os.path.join(cache_dir, 'runtimes'))
+	try:
+		shutil.unpack_archive(archive, temporary_dir, 'gztar' if archive.endswith('.tar.gz') else 'zip')
+		try:
+			os.rename(temporary_dir, runtime_dir)
+		except OSError:
+			# Extracted by another process meanwhile
+			pass
+	finally:
+		shutil.rmtree(temporary_dir, ignore_errors=True)
+	return _find_java(runtime_dir)
+
+
+def _install(version: str, cache_dir: str, sha256: str = None) -> str:
+	import jdk
+	print(f'Downloading the JRE {version}.')
+	try:
+		archive = jdk.download(version=version, jre=True)
+	except Exception as exc:
+		raise JREError(f'The JRE {version} could not be downloaded: {exc}') from exc
+	try:
+		digest = add_archive(archive, cache_dir, version, sha256)
+	finally:
+		os.remove(archive)
+	java_path = _extract_cached(cache_dir, digest)
+	if java_path is None:
+		raise JREError(f'The JRE {version} archive does not contain a Java runtime.')
+	return java_path
+
+
+def _resolve(version: str, cache_dir: str, sha256: str, offline: bool) -> typing.Tuple[str, str]:
+	java_home = os.environ.get('JAVA_HOME')
+	if java_home and _suitable(os.path.join(java_home, 'bin', 'java')):
+		return os.path.join(java_home, 'bin', 'java'), 'JAVA_HOME'
+	if _suitable(shutil.which('java')):
+		return shutil.which('java'), 'PATH'
+
+	if sha256 is None:
+		sha256 = _read_index(cache_dir).get(_cache_key(version))
+	if sha256 is not None:
+		java_path = _extract_cached(cache_dir, sha256.lower())
+		if java_path is not None:
+			return java_path, 'cache'
+
+	if offline:
+		raise JREError(f'No Java runtime {MIN_JAVA_VERSION}+ found in JAVA_HOME, the PATH or the cache {cache_dir}.')
+	return _install(version, cache_dir, sha256), 'download'
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_java(version: str = JRE_VERSION, cache_dir: str = CACHE_DIR, sha256: str = None, offline: bool = False) -> str:
+	'''Returns the path of a Java runtime able to run the challenge server, resolved once per process.
+
+	The runtime of JAVA_HOME is used first, then the one of the PATH, then the JRE of the local cache, whose
+	archive is verified against its SHA-256 before being extracted (the expected checksum when given, the one recorded by the cache
+	otherwise). The JRE is downloaded into the cache only when none of them is available, and never when
+	offline. Raises JREError when no runtime could be found.'''
+	begin = time.perf_counter()
+	java_path, source = _resolve(version, cache_dir, sha256, offline)
+	print(f'Resolved the Java runtime {java_path} from {source} in {time.perf_counter() - begin:.3f} seconds.')
+	return java_path
+
+
+if __name__ == '__main__':
+	# python jre.py [archive [sha256]]: adds a JRE archive to the cache of an offline machine, or resolves the runtime
+	if len(sys.argv) > 1:
+		digest = add_archive(sys.argv[1], version=JRE_VERSION, sha256=sys.argv[2] if len(sys.argv) > 2 else None)
+		print(f'Added {sys.argv[1]} to the cache as {digest}.')
+	resolve_java()
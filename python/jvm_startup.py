@@ -0,0 +1,73 @@
+import os
+import sys
+import threading
+import typing
+from agent import AIAgent, ServerReadiness, challenge_thread_work, MoveCommand
+from jre import resolve_java
+
+# Options shortening the startup and the warm-up of the server JVM for short games: the C1 compiler alone
+# compiles the hot methods sooner, and the serial collector does not start the threads of a parallel one
+STARTUP_JVM_OPTIONS = ['-XX:TieredStopAtLevel=1', '-XX:+UseSerialGC']
+
+# Application class-data-sharing archive of challenge.jar, next to the jar
+DEFAULT_CDS_ARCHIVE = 'challenge.jsa'
+
+# Length of the game played to record the classes of the archive, in seconds
+TRAINING_GAME_TIME = 5.0
+
+
+def cds_options(archive: str) -> typing.List[str]:
+	'''Options using the class-data-sharing archive. The JVM maps the classes of the archive instead of loading
+	and verifying them from the jar, it ignores an archive that does not match the jar or the JVM.'''
+	return [f'-XX:SharedArchiveFile={archive}', '-Xshare:auto']
+
+
+def dump_options(archive: str) -> typing.Tuple[typing.List[str], str]:
+	'''Options recording the classes loaded by the JVM into an archive when it exits, and the temporary file it is
+	written to (see publish_archive): the concurrent rounds never read a partially written archive.'''
+	temporary_archive = f'{archive}.{os.getpid()}.{threading.get_ident()}.tmp'
+	return [f'-XX:ArchiveClassesAtExit={temporary_archive}'], temporary_archive
+
+
+def publish_archive(temporary_archive: str, archive: str) -> bool:
+	'''Moves the archive dumped by a server in place, returns whether the server dumped it.'''
+	if not os.path.exists(temporary_archive):
+		return False
+	os.replace(temporary_archive, archive)
+	return True
+
+
+def _idle_ai(gamestate, my_data):
+	return MoveCommand((0.0, 1.0, 0.0))
+
+
+def create_cds_archive(jvm_path: str, archive: str = DEFAULT_CDS_ARCHIVE, game_time: float = TRAINING_GAME_TIME,
+  jvm_options: typing.List[str] = None) -> bool:
+	'''Plays a short windowless game recording the classes loaded by the server into the archive, which is then
+	given to the next servers by cds_options. The archive has to be created again when the jar or the JVM change.
+	Returns whether the archive was created.'''
+	options, temporary_archive = dump_options(archive)
+	ready = ServerReadiness()
+	challenge_thread = threading.Thread(target=challenge_thread_work, args=(jvm_path, f'{archive}.hackathon', game_time),
+		kwargs=dict(port=0, ready=ready, jvm_options=list(jvm_options or []) + options))
+	challenge_thread.start()
+	ready.wait()
+	if ready.listening:
+		agents = [AIAgent(f'player_{team}', team, _idle_ai, {}, port=ready.port) for team in range(2)]
+		for agent in agents:
+			agent.start()
+		for agent in agents:
+			agent.join()
+	challenge_thread.join()
+	if os.path.exists(f'{archive}.hackathon'):
+		os.remove(f'{archive}.hackathon')
+	return publish_archive(temporary_archive, archive)
+
+
+if __name__ == '__main__':
+	# python jvm_startup.py [jvm path] [archive path]
+	jvm_path = sys.argv[1] if len(sys.argv) > 1 else resolve_java()
+	archive = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_CDS_ARCHIVE
+	if not create_cds_archive(jvm_path, archive, jvm_options=STARTUP_JVM_OPTIONS):
+		sys.exit(f'The JVM did not create the archive {archive}.')
+	print(f'Created the class-data-sharing archive {archive}.')
@@ -1,4 +1,6 @@
 from game_simulation import GameSimulation, SnapshotData
+from jre import resolve_java
+from round_pool import RoundPool
 from agent import InvalidCommand, MoveCommand, ShootCommand, Command
 import typing
 import time
@@ -33,9 +35,12 @@ TEAM_1 = 'brogrammers'
 
 if __name__ == '__main__':
 	simulation_list = []
-	used_port = 2049
 
-	simulation = GameSimulation('java', game_time=60.0, ai_time=150.0, commands_per_second=4.0, port=used_port)
+	# The rounds are played by a warm worker, the agents and the team libraries are imported once
+	pool = RoundPool(1)
+
+	# The server binds a free port
+	simulation = GameSimulation(resolve_java(), game_time=60.0, ai_time=150.0, commands_per_second=4.0, port=None, pool=pool)
 
 	first_ai_file_name = os.path.join('teams', TEAM_1, 'my_ai').replace('/', '.')
 	second_ai_file_name = os.path.join('teams', TEAM_2, 'my_ai').replace('/', '.')
@@ -58,6 +63,7 @@ if __name__ == '__main__':
 	simulation.start_round()
 
 	results, data = simulation.end_round()
+	pool.shutdown()
 
 	for agent_result in results:
 		print(f'Agent result: {agent_result}')
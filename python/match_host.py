@@ -0,0 +1,107 @@
+import json
+import subprocess
+import threading
+import typing
+from agent import JAR_FILE, ServerReadiness
+from jre import resolve_java
+from transport import MessageReader, connect
+
+# Printed by the host once it accepts the matches, followed by its control port
+HOST_READY_PREFIX = 'Match host ready on port '
+
+# Time given to the JVM to start the host, in seconds
+HOST_START_TIMEOUT = 60.0
+
+
+class MatchHostError(Exception):
+	'''Raised when the host could not start or could not play a match.'''
+	pass
+
+
+class MatchHost:
+	'''Client of a challenge server running in host mode, which plays many matches inside a single JVM.
+
+	start() launches the host, unless the control port of a running host is given. play_match() then plays
+	a match through its own control connection: it can be called by several threads (and processes) at once,
+	each match listening for its agents on its own port (a free port when the port is 0). A GameSimulation
+	given a host plays its rounds through it instead of starting a JVM for each round.
+	'''
+
+	def __init__(self, jvm_path: str = None, port: int = None, address: str = '127.0.0.1', jvm_options: typing.List[str] = None):
+		self._jvm_path = jvm_path
+		# Options of the host JVM, see jvm_startup
+		self.jvm_options = jvm_options
+		self.port = port
+		self.address = address
+		self._process = None
+
+	def start(self, timeout: float = HOST_START_TIMEOUT):
+		'''Launches the host and waits until it accepts the matches.'''
+		if self.port is not None:
+			return
+		if self._jvm_path is None:
+			self._jvm_path = resolve_java()
+		ready = threading.Event()
+		self._process = subprocess.Popen([self._jvm_path] + list(self.jvm_options or []) + ['-jar', '--illegal-access=warn', JAR_FILE, '-m', 'host', '-p', '0'],
+			stdout=subprocess.PIPE, universal_newlines=True)
+		threading.Thread(target=self._forward_output, args=(ready,), name='match-host-output', daemon=True).start()
+		if not ready.wait(timeout) or self.port is None:
+			raise MatchHostError('The match host did not start.')
+
+	def _forward_output(self, ready: threading.Event):
+		try:
+			for line in self._process.stdout:
+				print(line, end='')
+				if line.startswith(HOST_READY_PREFIX):
+					self.port = int(line[len(HOST_READY_PREFIX):].strip().rstrip('.'))
+					ready.set()
+		finally:
+			ready.set()
+
+	def _request(self, request: typing.Dict) -> typing.Tuple[typing.Any, MessageReader]:
+		connection = connect(self.address, self.port)
+		connection.sendall((json.dumps(request) + '\n').encode('UTF-8'))
+		return connection, MessageReader(connection)
+
+	def play_match(self, file: str, game_time: float = 60.0, ai_time: float = 150.0, commands_per_second: int = 4,
+	  port: int = 0, socket_path: str = None, tick_deadline: float = None, ready: ServerReadiness = None) -> typing.Dict:
+		'''Plays a match with the parameters of challenge_thread_work, and returns its results once it is over
+		(the results of the teams, and whether the match was aborted). The ready object is set once the agents
+		can connect, with the port of the match.'''
+		request = {'request': 'PLAY', 'file': file, 'game_time': game_time, 'ai_time': ai_time,
+			'commands_per_second': commands_per_second, 'port': port, 'socket_path': socket_path,
+			'tick_deadline': tick_deadline if tick_deadline is not None else 0.0}
+		try:
+			connection, reader = self._request(request)
+			with connection:
+				while True:
+					event = json.loads(reader.read_line())
+					if event['event'] == 'READY':
+						if ready is not None:
+							ready.set(event['address'])
+					elif event['event'] == 'FINISHED':
+						return {'results': event['results'], 'aborted': event['aborted']}
+					else:
+						raise MatchHostError(f'The host failed to play the match {file}: {event.get("error")}')
+		finally:
+			# The agents do not wait for a match that failed to start
+			if ready is not None:
+				ready.set()
+
+	def shutdown(self):
+		'''Stops the host once its matches are over.'''
+		if self.port is None:
+			return
+		connection, reader = self._request({'request': 'SHUTDOWN'})
+		with connection:
+			reader.read_line()
+		if self._process is not None:
+			self._process.wait()
+			self._process = None
+		self.port = None
+
+	def __getstate__(self):
+		# The rounds played in other processes only need the control port of the host
+		state = self.__dict__.copy()
+		state['_process'] = None
+		return state
@@ -0,0 +1,110 @@
+import typing
+import traceback
+from agent import AIAgent
+from execution import ProcessExecutor
+from game_data import RecordPool, SnapshotData, Command, setup_strategy
+from codec import DELTA_PROTOCOL, make_codec
+
+
+class _AIRunner:
+	'''Runs the AI function inside the worker process of a ProcessAIAgent.
+	The messages are decoded inside the worker, only their raw bytes are sent through the pipe.'''
+
+	def __init__(self, ai: typing.Callable, data: typing.Dict, pooled_records: bool):
+		self.ai = ai
+		self.data = data
+		self.pooled_records = pooled_records
+		self.set_up = False
+		self._codecs = {}
+		# First snapshot of a strategy, decoded by its setup and given again to its first step
+		self._setup_snapshot = None
+
+	def decode(self, protocol: str, options: typing.Dict, message: bytes) -> SnapshotData:
+		if self._setup_snapshot is not None:
+			setup_message, snapshot = self._setup_snapshot
+			self._setup_snapshot = None
+			if setup_message == message:
+				# Decoded once, a delta is only applied once to the mirror
+				return snapshot
+		codec = self._codecs.get(protocol)
+		if codec is None:
+			codec = make_codec(protocol, pool=RecordPool() if self.pooled_records else None, **options)
+			self._codecs[protocol] = codec
+		_, snapshot = codec.decode_message(message)
+		return snapshot
+
+	def __call__(self, protocol: str, options: typing.Dict, message: bytes, setup: bool = False) -> Command:
+		snapshot = self.decode(protocol, options, message)
+		if setup:
+			# The data is a strategy, set up with the snapshot of its first step
+			setup_strategy(snapshot, self.data)
+			self.set_up = True
+			self._setup_snapshot = (message, snapshot)
+			return None
+		return self.ai(snapshot, self.data)
+
+	def close(self):
+		self._setup_snapshot = None
+		for codec in self._codecs.values():
+			codec.close()
+		self._codecs = {}
+
+	def teardown(self):
+		if not self.set_up:
+			return
+		try:
+			self.data.teardown()
+		except Exception as exc:
+			print(f'Exception during the teardown of the strategy:\n\t{exc}')
+			traceback.print_exc()
+
+	def __getstate__(self):
+		# The codecs are rebuilt on each side of the pipe
+		state = self.__dict__.copy()
+		state['_codecs'] = {}
+		state['_setup_snapshot'] = None
+		return state
+
+
+class ProcessAIAgent(AIAgent):
+	'''AIAgent running its AI function inside a dedicated worker process.
+
+	Both agents of a round are then executed in parallel instead of sharing the GIL of the round process.
+	The AI function and its data must be picklable unless the processes are forked. The data is owned by
+	the worker during the game and retrieved when the game is over, see the data property. The deadline
+	of the AI function is enforced the same way as the threaded AIAgent, from this process.
+	'''
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		if self._pipelined and self._protocol == DELTA_PROTOCOL:
+			# The deltas are applied by the worker, the skipped snapshots would be missing from its mirror
+			raise ValueError('The delta protocol cannot be used by a pipelined agent running its AI in a process.')
+		self._runner = _AIRunner(self.ai, self._data, self._record_pool is not None)
+		self._executor = ProcessExecutor(self._runner, f'{self.username}-ai')
+
+	def _receive_message(self) -> typing.Tuple[str, typing.Any]:
+		# The snapshots are decoded by the worker, the other messages are decoded here
+		message = self._codec.read_raw_message(self._reader)
+		header = self._codec.message_header(message)
+		if header == 'ASK_COMMAND':
+			return header, message
+		return self._codec.decode_message(message)
+
+	def _setup_strategy(self, message: bytes):
+		self._executor.call(self._setup_time, (self._codec.name, self._codec.options, message, True))
+
+	def _call_ai(self, message: bytes) -> Command:
+		return self._executor.call(self._remaining_time, (self._codec.name, self._codec.options, message))
+
+	def _work(self):
+		self._executor.start()
+		try:
+			self._connect()
+			self._play()
+		finally:
+			self._close_connection()
+			self._codec.close()
+			self._runner = self._executor.shutdown()
+			self._data = self._runner.data
+			self._teardown_strategy()
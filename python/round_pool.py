@@ -0,0 +1,135 @@
+import concurrent.futures
+import multiprocessing
+import os
+import queue
+import threading
+import traceback
+import typing
+from importlib import import_module
+from execution import WORKER_PRELOAD, _picklable_exception, worker_context
+
+# Modules imported by the workers before their first round: the agents and the libraries used by the teams
+DEFAULT_PRELOAD = ['agent', 'game_simulation'] + WORKER_PRELOAD
+
+
+def _preload(modules: typing.List[str]):
+	for name in modules:
+		try:
+			import_module(name)
+		except ImportError as exc:
+			# A library the tournament does not need, or a team module imported on its first round
+			print(f'Could not preload the module {name}: {exc}')
+
+
+def _round_pool_worker(connection, preload: typing.List[str]):
+	_preload(preload)
+	connection.send(os.getpid())
+	while True:
+		request = connection.recv()
+		if request is None:
+			break
+		function, args = request
+		try:
+			result = (True, function(*args))
+		except BaseException as exc:
+			# The caller only receives the exception, the traceback is printed here
+			traceback.print_exc()
+			result = (False, _picklable_exception(exc))
+		try:
+			connection.send(result)
+		except Exception as exc:
+			connection.send((False, _picklable_exception(exc)))
+	connection.close()
+
+
+class RoundPool:
+	'''Persistent worker processes playing the rounds of the game simulations, instead of a new process per round.
+
+	The workers import the preloaded modules once (the forkserver imports them before forking the workers, where
+	it is available), then play the rounds submitted to the pool one after the other: the process startup and the
+	imports of the agents and of the team modules are paid once per worker instead of once per round. A round is
+	a function and its arguments, sent to a worker through a pipe, so they must be picklable. A worker that exits
+	during a round fails the round and is replaced.
+	'''
+
+	def __init__(self, nb_workers: int = None, preload: typing.List[str] = None, name: str = 'round-worker'):
+		self.nb_workers = nb_workers or os.cpu_count() or 1
+		self.preload = list(DEFAULT_PRELOAD if preload is None else preload)
+		self._name = name
+		self._context = None
+		self._tasks = queue.Queue()
+		self._threads = []
+		self._lock = threading.Lock()
+
+	def start(self):
+		'''Starts the workers and waits until they preloaded their modules, done by the first round otherwise.'''
+		with self._lock:
+			if self._threads:
+				return
+			# The forkserver is shared with the workers of the team sessions, the workers import what it did not
+			self._context = worker_context(self.preload)
+			workers = [self._start_worker(index) for index in range(self.nb_workers)]
+			for index, worker in enumerate(workers):
+				thread = threading.Thread(target=self._dispatch, args=(index, worker), name=f'{self._name}-{index}-dispatcher', daemon=True)
+				thread.start()
+				self._threads.append(thread)
+
+	def _start_worker(self, index: int) -> typing.Tuple[multiprocessing.Process, typing.Any]:
+		connection, worker_connection = self._context.Pipe()
+		# Not a daemon, the agents of a round start their own worker processes
+		process = self._context.Process(target=_round_pool_worker, args=(worker_connection, self.preload), name=f'{self._name}-{index}')
+		process.start()
+		worker_connection.close()
+		# Ready once its modules are imported
+		connection.recv()
+		return process, connection
+
+	def _dispatch(self, index: int, worker: typing.Tuple[multiprocessing.Process, typing.Any]):
+		# Hands the rounds to one worker, one at a time
+		process, connection = worker
+		while True:
+			task = self._tasks.get()
+			if task is None:
+				connection.send(None)
+				process.join()
+				connection.close()
+				return
+			future, function, args = task
+			if not future.set_running_or_notify_cancel():
+				continue
+			try:
+				connection.send((function, args))
+				succeeded, value = connection.recv()
+			except (EOFError, OSError) as exc:
+				future.set_exception(Exception(f'The worker {process.name} exited during the round: {exc}'))
+				process.join()
+				connection.close()
+				process, connection = self._start_worker(index)
+				continue
+			except Exception as exc:
+				# The round could not be sent to the worker
+				future.set_exception(exc)
+				continue
+			if succeeded:
+				future.set_result(value)
+			else:
+				future.set_exception(value)
+
+	def submit(self, function: typing.Callable, *args) -> concurrent.futures.Future:
+		'''Plays function(*args) inside the next idle worker, the future gives back its result.'''
+		self.start()
+		future = concurrent.futures.Future()
+		self._tasks.put((future, function, args))
+		return future
+
+	def shutdown(self):
+		'''Stops the workers once the submitted rounds are over.'''
+		with self._lock:
+			for _ in self._threads:
+				self._tasks.put(None)
+			for thread in self._threads:
+				thread.join()
+			self._threads = []
+
+	def __getstate__(self):
+		raise TypeError('A RoundPool can only be used by the process that created it.')
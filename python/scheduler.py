@@ -1,11 +1,13 @@
 from dataclasses import dataclass
 import typing
 from game_simulation import GameSimulation
+from jvm_startup import DEFAULT_CDS_ARCHIVE
+from session import TeamSession
 import json
-import multiprocessing
-from importlib import import_module
+import concurrent.futures
+import threading
 import os
-import jdk
+from jre import resolve_java
 
 @dataclass
 class ScheduledMatch:
@@ -36,73 +38,46 @@ class Pool:
 AI_TIME = 150.0
 GAME_TIME = 60.0
 COMMANDS_PER_SECOND = 4.0
-NB_PROCESSES = 4
+# Matches played at the same time
+NB_CONCURRENT_MATCHES = 4
 
 JVM_PATH = None
 
-def match_process_worker(port: int, match_queue: multiprocessing.Queue, match_result_queue: multiprocessing.Queue):
-	while not match_queue.empty():
-		match_schedule = match_queue.get()
-		print(f'[Process {port}] Polled game simulation for teams: {match_schedule.team_1} - {match_schedule.team_2}')
+def team_session(team: str) -> TeamSession:
+	'''Session of a team for the whole tournament, importing its module once inside its own worker process.'''
+	return TeamSession.for_team(team, os.path.join('teams', team, 'my_ai').replace('/', '.'), os.path.join('teams', team))
 
-		first_ai_file_name = os.path.join('teams', match_schedule.team_1, 'my_ai').replace('/', '.')
-		second_ai_file_name = os.path.join('teams', match_schedule.team_2, 'my_ai').replace('/', '.')
 
-		module_team_1 = import_module(first_ai_file_name)
-		module_team_2 = import_module(second_ai_file_name)
+def play_scheduled_match(match_schedule: ScheduledMatch, jvm_path: str, sessions: typing.Dict[str, TeamSession]) -> MatchResult:
+	'''Plays a match between the sessions of its teams, each match gets fresh data from the team modules.'''
+	worker = threading.current_thread().name
+	print(f'[{worker}] Started game simulation for teams: {match_schedule.team_1} - {match_schedule.team_2}')
 
-		ai_team_1 = getattr(module_team_1, 'my_ai')
-		data_team_1 = getattr(module_team_2, 'my_data')
+	simulation = GameSimulation(jvm_path, match_schedule.game_time, match_schedule.ai_time, match_schedule.commands_per_second, match_schedule.save_file, port=None,
+		cds_archive=DEFAULT_CDS_ARCHIVE)
 
-		ai_team_2 = getattr(module_team_1, 'my_ai')
-		data_team_2 = getattr(module_team_2, 'my_data')
+	simulation.set_first_session(match_schedule.team_1, sessions[match_schedule.team_1])
+	simulation.set_second_session(match_schedule.team_2, sessions[match_schedule.team_2])
 
-		current_dir = os.getcwd()
+	simulation.start_round()
 
-		# Changes the directory to load the data inside the team folders
-		os.chdir(os.path.join('teams', match_schedule.team_1))
+	results, _ = simulation.end_round()
 
-		print(f'[Process {port}] Loading data for team {match_schedule.team_1}')
-		loaded_data_team_1 = data_team_1()
-		print(f'[Process {port}] Loading data for team {match_schedule.team_2}')
-		loaded_data_team_2 = data_team_2()
+	winner = None
+	for agent_result in results:
+		if agent_result.won:
+			winner = agent_result.username
 
-		# Rolls bacj the current directory 
-		os.chdir(current_dir)
+	match_result = MatchResult(match_schedule, results[0].score, results[1].score, winner, results[0].aborted, results[0].error_message)
+	print(f'[{worker}] Finished game simulation for teams: {match_schedule.team_1} - {match_schedule.team_2}, aborted: {match_result.aborted}, winner: {match_result.winner}')
 
-		simulation = GameSimulation(JVM_PATH, match_schedule.game_time, match_schedule.ai_time, match_schedule.commands_per_second, match_schedule.save_file, port)
-
-		simulation.set_first_agent(match_schedule.team_1, ai_team_1, loaded_data_team_1)
-		simulation.set_second_agent(match_schedule.team_2, ai_team_2, loaded_data_team_2)
-
-		print(f'[Process {port}] Started game simulation for teams: {match_schedule.team_1} - {match_schedule.team_2}')
-
-		simulation.start_round()
-
-		results, _ = simulation.end_round()
-
-		winner = None
-		for agent_result in results:
-			if agent_result.won:
-				winner = agent_result.username
-
-		match_result = MatchResult(match_schedule, results[0].score, results[1].score, winner, results[0].aborted, results[0].error_message)
-		print(f'[Process {port}] Finished game simulation for teams: {match_schedule.team_1} - {match_schedule.team_2}, aborted: {match_result.aborted}, winner: {match_result.winner}')
-
-		match_result_queue.put(match_result)
-
-	match_result_queue.put(None)
+	return match_result
 
 
 if __name__ == '__main__':
 
-	try:
-		jdk.uninstall('15', jre=True)
-	except:
-		pass
-
-	jvm_path = jdk.install('15', jre=True)
-	JVM_PATH = os.path.join(jvm_path, 'bin', 'java')
+	# Installs the JRE only when no Java runtime is available, see jre.resolve_java
+	JVM_PATH = resolve_java()
 
 	with open('pool_data.json', 'r') as file:
 		pool_data = json.load(file)
@@ -130,35 +105,24 @@ if __name__ == '__main__':
 
 	print(total_matches)
 
-	matches_per_process = len(total_matches) // NB_PROCESSES
-	all_processes = []
+	# The teams are imported and their data loaded once, before their first match. The sessions are started at once,
+	# their workers are forked by the forkserver rather than by these threads (see execution.worker_context)
+	sessions = {team: team_session(team) for pool in pools for team in pool.players}
+	with concurrent.futures.ThreadPoolExecutor(len(sessions) or 1) as executor:
+		list(executor.map(TeamSession.start, sessions.values()))
 
-	for idx in range(NB_PROCESSES):
-		match_queue = multiprocessing.Queue()
-		result_queue = multiprocessing.Queue()
-		process = multiprocessing.Process(target=match_process_worker, args=(2049 + idx, match_queue, result_queue))
-		all_processes.append((process, result_queue))
-		
-		if idx == NB_PROCESSES - 1:
-			for match in total_matches[idx*matches_per_process:]:
-				match_queue.put(match)
-		else:
-			for match in total_matches[idx*matches_per_process:(idx+1)*matches_per_process]:
-				match_queue.put(match)
-
-		process.start()
+	with concurrent.futures.ThreadPoolExecutor(NB_CONCURRENT_MATCHES, thread_name_prefix='match') as executor:
+		matches_futures = [executor.submit(play_scheduled_match, match, JVM_PATH, sessions) for match in total_matches]
 
 	matches_results = []
-
-	for process, queue in all_processes:
-		keep = True
-		while keep:
-			result = queue.get()
-			if result is None:
-				keep = False
-				process.join()
-			else:
-				matches_results.append(result)
+	for match, future in zip(total_matches, matches_futures):
+		try:
+			matches_results.append(future.result())
+		except Exception as exc:
+			print(f'The match {match.team_1} - {match.team_2} failed: {exc}')
+
+	for session in sessions.values():
+		session.shutdown()
 
 	# Count the wins
 	for pool in pools:
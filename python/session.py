@@ -0,0 +1,365 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+import typing
+from importlib import import_module
+from agent import _CommandRequest
+from async_agent import AsyncAIAgent
+from execution import ProcessExecutor, DeadlineExceeded, worker_context
+from process_agent import _AIRunner
+from game_data import Command, Strategy
+
+# Operations sent to the worker of a session, tagged with the match they concern
+OPEN_MATCH = 'OPEN_MATCH'
+ASK_COMMAND = 'ASK_COMMAND'
+# Asks the commands of several matches at once to the batch AI function, sent without match
+ASK_COMMANDS = 'ASK_COMMANDS'
+CLOSE_MATCH = 'CLOSE_MATCH'
+# Imports the module of a team inside the worker and loads its data, sent without match
+LOAD_TEAM = 'LOAD_TEAM'
+
+# Deadline of the operations opening and closing the matches (the data of the match goes through the pipe)
+MATCH_OPERATION_TIMEOUT = 30.0
+
+# Deadline of the loading of a team module (its imports and its my_data function), and of the data of its matches
+TEAM_LOAD_TIMEOUT = 300.0
+
+# Time given to the other matches to ask for their command before calling the batch AI function, in seconds
+DEFAULT_BATCH_WINDOW = 0.002
+
+
+class _SessionRunner:
+	'''Runs the AI function of a team inside the worker process of a TeamSession, for all its matches.
+	Each match has its own data and codecs (the delta protocol keeps a mirror of each match), the strategies
+	of the matches are torn down when the matches are closed.'''
+
+	def __init__(self, ai: typing.Callable, pooled_records: bool, ai_batch: typing.Callable = None):
+		self.ai = ai
+		self.ai_batch = ai_batch
+		self.pooled_records = pooled_records
+		self._matches = {}
+
+	def _ask_commands(self, requests: typing.List[typing.Tuple]) -> typing.List[Command]:
+		runners = [self._matches[match_id] for match_id, *_ in requests]
+		snapshots = [runner.decode(protocol, options, message) for runner, (_, protocol, options, message) in zip(runners, requests)]
+		commands = list(self.ai_batch(snapshots, [runner.data for runner in runners]))
+		if len(commands) != len(requests):
+			raise ValueError(f'The batch AI function returned {len(commands)} commands for {len(requests)} snapshots.')
+		return commands
+
+	def __call__(self, operation: str, match_id: str, *payload) -> typing.Any:
+		if operation == ASK_COMMAND:
+			return self._matches[match_id](*payload)
+		elif operation == ASK_COMMANDS:
+			return self._ask_commands(*payload)
+		elif operation == OPEN_MATCH:
+			self._matches[match_id] = _AIRunner(self.ai, payload[0], self.pooled_records)
+			# Tells the agent whether the data is a strategy to set up
+			return isinstance(payload[0], Strategy)
+		elif operation == CLOSE_MATCH:
+			runner = self._matches.pop(match_id)
+			runner.close()
+			runner.teardown()
+			return runner.data
+		raise ValueError(f'Unknown session operation: {operation}')
+
+
+class _TeamRunner(_SessionRunner):
+	'''Session runner of a team module, imported inside the worker of the session along with the libraries it uses.
+
+	The module is imported and its my_data function called once. The matches opened without data then get
+	fresh data from the reset hook of the module, my_reset(loaded_data), which keeps what was loaded (models,
+	precomputed maps) and returns the data of a new match. Without hook, the first match gets the loaded data
+	and the next ones call my_data again. The team functions run inside the directory of the team.'''
+
+	def __init__(self, module_name: str, directory: str, pooled_records: bool):
+		super().__init__(None, pooled_records)
+		self.module_name = module_name
+		self.directory = directory
+		self._module = None
+		self._loaded_data = None
+
+	def _team_call(self, function: typing.Callable, *args) -> typing.Any:
+		current_dir = os.getcwd()
+		if self.directory is not None:
+			os.chdir(self.directory)
+		try:
+			return function(*args)
+		finally:
+			os.chdir(current_dir)
+
+	def _load(self) -> bool:
+		if self._module is None:
+			self._module = import_module(self.module_name)
+			self.ai = getattr(self._module, 'my_ai')
+			self.ai_batch = getattr(self._module, 'my_ai_batch', None)
+			if hasattr(self._module, 'my_data'):
+				self._loaded_data = self._team_call(self._module.my_data)
+		# Tells the session whether the commands are batched
+		return self.ai_batch is not None
+
+	def _fresh_data(self) -> typing.Any:
+		self._load()
+		reset = getattr(self._module, 'my_reset', None)
+		if reset is not None:
+			return self._team_call(reset, self._loaded_data)
+		if self._loaded_data is not None:
+			data, self._loaded_data = self._loaded_data, None
+			return data
+		if hasattr(self._module, 'my_data'):
+			return self._team_call(self._module.my_data)
+		return {}
+
+	def __call__(self, operation: str, match_id: str, *payload) -> typing.Any:
+		if operation == LOAD_TEAM:
+			return self._load()
+		if operation == OPEN_MATCH and payload[0] is None:
+			payload = (self._fresh_data(),)
+		data = super().__call__(operation, match_id, *payload)
+		if operation == CLOSE_MATCH:
+			# The data of the matches stays inside the worker
+			return None
+		return data
+
+	def __getstate__(self):
+		# The module of the team and its data stay inside the worker, they are not given back on shutdown
+		state = self.__dict__.copy()
+		state.update(ai=None, ai_batch=None, _module=None, _loaded_data=None)
+		return state
+
+
+class TeamSession:
+	'''Plays all the concurrent matches of a team with a single worker process and a single thread.
+
+	The connections of the matches are handled by an event loop running on the session thread, and the AI
+	calls of every match go to the same worker process, tagged with their match: the modules of the team
+	are imported once, and each match keeps its own data and time budget. The worker runs the calls one
+	after the other, the time a call waits for the calls of the other matches is not counted.
+
+	When the team provides a batch AI function, my_ai_batch(snapshots, datas) -> commands, the matches
+	asking for a command within batch_window seconds of each other are answered by a single call (sooner
+	when every match is waiting). Each batched match is charged the whole call, which is how long it waited
+	for its command, and the deadline of the call is the smallest remaining time of the batched matches. The
+	matches whose remaining time is below the duration of the previous batch are answered alone by my_ai.
+	When the batch runs out of time, only the matches with the smallest remaining time fail, and when
+	my_ai_batch raises, the matches are answered alone: the other matches are then asked to my_ai.
+
+	A team playing a Strategy gives strategy_step as AI function, and a new strategy as the data of each match.
+	The session of a team module, see for_team, imports the team inside its worker and gives fresh data to its
+	matches: it lives for the whole tournament.
+	'''
+
+	def __init__(self, name: str, ai: typing.Callable, pooled_records: bool = False, ai_batch: typing.Callable = None,
+	  batch_window: float = DEFAULT_BATCH_WINDOW):
+		self.name = name
+		self.ai = ai
+		self.ai_batch = ai_batch
+		self.batch_window = batch_window
+		self.pooled_records = pooled_records
+		self._executor = ProcessExecutor(_SessionRunner(ai, pooled_records, ai_batch), f'{name}-session')
+		# Set once the worker imported the module of the team, see for_team
+		self._batched = ai_batch is not None
+		self._loads_team = False
+		# The calls are sent to the worker one at a time, from this thread
+		self._dispatcher = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix=f'{name}-dispatcher')
+		self._loop = None
+		self._thread = None
+		self._lock = threading.Lock()
+		# Commands waiting for the next batch, only used by the event loop of the session
+		self._nb_open_matches = 0
+		self._pending = []
+		self._batch_full = None
+		# Duration of the previous batch, the matches with less remaining time are not batched
+		self._batch_seconds = 0.0
+
+	@classmethod
+	def for_module(cls, name: str, module, **kwargs) -> 'TeamSession':
+		'''Session of a team module, using its my_ai_batch function when it has one.'''
+		return cls(name, getattr(module, 'my_ai'), ai_batch=getattr(module, 'my_ai_batch', None), **kwargs)
+
+	@classmethod
+	def for_team(cls, name: str, module_name: str, directory: str = None, **kwargs) -> 'TeamSession':
+		'''Long-lived session of a team module, imported once inside the worker of the session (see _TeamRunner),
+		so that the imports and the data loading of the team are paid once for all its matches. The matches
+		opened without data get fresh data from the module. The worker is started by the forkserver (spawned where
+		it does not exist, see worker_context), which imports the main module of the program: the program must
+		be guarded by if __name__ == '__main__'.'''
+		session = cls(name, None, **kwargs)
+		# Nothing is inherited from this process, the sessions of the teams can be started by several threads at once
+		session._executor = ProcessExecutor(_TeamRunner(module_name, directory, session.pooled_records), f'{name}-session',
+			context=worker_context())
+		session._loads_team = True
+		return session
+
+	def start(self):
+		'''Starts the worker process and the session thread, done by the first match otherwise.
+		The module of a team session is imported and its data loaded before returning.'''
+		with self._lock:
+			if self._thread is not None:
+				return
+			self._executor.start()
+			if self._loads_team:
+				self._batched = self._executor.call(TEAM_LOAD_TIMEOUT, (LOAD_TEAM, None))
+			self._loop = asyncio.new_event_loop()
+			self._thread = threading.Thread(target=self._loop.run_forever, name=f'{self.name}-session', daemon=True)
+			self._thread.start()
+
+	def _timed_call(self, timeout: float, args: typing.Tuple) -> typing.Tuple[typing.Any, float]:
+		begin = time.perf_counter()
+		value = self._executor.call(timeout, args)
+		return value, time.perf_counter() - begin
+
+	async def call(self, timeout: float, operation: str, match_id: str, *payload) -> typing.Tuple[typing.Any, float]:
+		'''Runs an operation of a match inside the worker, returns its result and the time it took.
+		Raises DeadlineExceeded if the operation does not return within timeout seconds.'''
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(self._dispatcher, self._timed_call, timeout, (operation, match_id) + payload)
+
+	async def open_match(self, match_id: str, data: typing.Dict) -> bool:
+		'''Opens a match with the given data, or with fresh data of the team module when None (see for_team).
+		Returns whether the data of the match is a strategy.'''
+		timeout = MATCH_OPERATION_TIMEOUT if data is not None else TEAM_LOAD_TIMEOUT
+		strategy, _ = await self.call(timeout, OPEN_MATCH, match_id, data)
+		self._nb_open_matches += 1
+		return strategy
+
+	async def close_match(self, match_id: str) -> typing.Dict:
+		self._nb_open_matches -= 1
+		data, _ = await self.call(MATCH_OPERATION_TIMEOUT, CLOSE_MATCH, match_id)
+		return data
+
+	async def ask_command(self, timeout: float, match_id: str, protocol: str, options: typing.Dict, message: bytes) -> typing.Tuple[Command, float]:
+		'''Returns the command of a match and the time charged to the match.
+		Raises DeadlineExceeded if the command is not computed within timeout seconds.'''
+		if not self._batched:
+			return await self.call(timeout, ASK_COMMAND, match_id, protocol, options, message)
+
+		loop = asyncio.get_running_loop()
+		future = loop.create_future()
+		self._pending.append((timeout, (match_id, protocol, options, message), future))
+		if len(self._pending) == 1:
+			self._batch_full = loop.create_future()
+			loop.create_task(self._ask_batch())
+		elif len(self._pending) >= self._nb_open_matches and not self._batch_full.done():
+			self._batch_full.set_result(None)
+		return await future
+
+	async def _ask_alone(self, timeout: float, request: typing.Tuple, future: asyncio.Future):
+		try:
+			future.set_result(await self.call(timeout, ASK_COMMAND, *request))
+		except Exception as exc:
+			future.set_exception(exc)
+
+	async def _ask_batch(self):
+		# Waits for the other matches to ask for their command
+		if len(self._pending) < self._nb_open_matches:
+			await asyncio.wait([self._batch_full], timeout=self.batch_window)
+		pending, self._pending = self._pending, []
+		batched = [entry for entry in pending if entry[0] >= self._batch_seconds]
+		alone = [entry for entry in pending if entry[0] < self._batch_seconds]
+		if len(batched) == 1:
+			alone += batched
+			batched = []
+
+		if batched:
+			timeout = min(timeout for timeout, _, _ in batched)
+			try:
+				commands, elapsed_seconds = await self.call(timeout, ASK_COMMANDS, None, [request for _, request, _ in batched])
+			except DeadlineExceeded as exc:
+				self._batch_seconds = timeout
+				# The matches with more remaining time did not run out of it, they are answered alone
+				for entry in batched:
+					if entry[0] <= timeout:
+						entry[2].set_exception(exc)
+					else:
+						alone.append(entry)
+			except Exception:
+				alone += batched
+			else:
+				self._batch_seconds = elapsed_seconds
+				for (_, _, future), command in zip(batched, commands):
+					future.set_result((command, elapsed_seconds))
+
+		if alone:
+			await asyncio.gather(*(self._ask_alone(*entry) for entry in alone))
+
+	def submit(self, coroutine: typing.Coroutine) -> concurrent.futures.Future:
+		'''Runs the coroutine on the event loop of the session.'''
+		self.start()
+		return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+	def agent(self, match_id: str, username: str, team: int, data: typing.Dict = None, *args, **kwargs) -> 'SessionAIAgent':
+		'''Returns the agent playing the given match for the team, the arguments are the ones of the AIAgent.'''
+		return SessionAIAgent(self, match_id, username, team, data, *args, **kwargs)
+
+	def shutdown(self):
+		'''Stops the session once its matches are over.'''
+		with self._lock:
+			if self._thread is None:
+				return
+			self._loop.call_soon_threadsafe(self._loop.stop)
+			self._thread.join()
+			self._loop.close()
+			self._thread = None
+		self._dispatcher.shutdown()
+		self._executor.shutdown()
+
+
+class SessionAIAgent(AsyncAIAgent):
+	'''Agent of one match played by a TeamSession.
+
+	The snapshots are decoded and given to the AI inside the worker of the session, along with the data
+	of the match, which is given back by the data property once the match is over. The agent is started
+	and joined like an AIAgent, it is played by the event loop of the session.
+	'''
+
+	def __init__(self, session: TeamSession, match_id: str, username: str, team: int, data: typing.Dict = None, *args, **kwargs):
+		super().__init__(username, team, session.ai, data, *args, **kwargs)
+		self.match_id = match_id
+		self._session = session
+		self._future = None
+
+	async def _receive_message_async(self) -> typing.Tuple[str, typing.Any]:
+		# The snapshots are decoded by the worker, the other messages are decoded here
+		if self._codec.length_prefixed:
+			message = await self._reader.read_frame()
+		else:
+			message = await self._reader.read_line()
+		header = self._codec.message_header(message)
+		if header == 'ASK_COMMAND':
+			return header, message
+		return self._codec.decode_message(message)
+
+	async def _setup_strategy_async(self, message: bytes):
+		await self._session.call(self._setup_time, ASK_COMMAND, self.match_id, self._codec.name, self._codec.options, message, True)
+
+	def _teardown_strategy(self):
+		# Done by the worker of the session when the match is closed
+		pass
+
+	async def _ask_command_async(self, message: bytes) -> Command:
+		with _CommandRequest(self) as request:
+			if request.setup_pending():
+				await self._setup_strategy_async(message)
+				request.set_up()
+
+			command, elapsed_seconds = await self._session.ask_command(self._remaining_time, self.match_id,
+				self._codec.name, self._codec.options, message)
+			request.answer(command, elapsed_seconds)
+		return request.command
+
+	async def play(self):
+		'''Connects to the server and plays the match until it is finished or aborted.'''
+		self._setup_pending = await self._session.open_match(self.match_id, self._data)
+		try:
+			await super().play()
+		finally:
+			self._data = await self._session.close_match(self.match_id)
+
+	def start(self):
+		self._future = self._session.submit(self.play())
+
+	def join(self):
+		self._future.result()
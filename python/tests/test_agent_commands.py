@@ -0,0 +1,168 @@
+'''Commands returned by the AIs: the invalid ones, the exceptions and the timeouts are replaced by an InvalidCommand,
+which aborts the game, instead of stopping the agent.'''
+import asyncio
+import json
+import time
+import numpy as np
+import pytest
+from agent import AIAgent
+from async_agent import AsyncAIAgent
+from codec import JsonCodec, BinaryCodec
+from game_data import MoveCommand, ShootCommand, PlanCommand, InvalidCommand, PlayerData, SnapshotData, Strategy
+
+SNAPSHOT = SnapshotData(PlayerData((0.0, 0.0, 0.0), (0.0, 0.0, 0.0), 20.0, 0, 0.0), [], [])
+
+
+def returning(command):
+	return lambda gamestate, my_data: command
+
+
+def sleeping(gamestate, my_data):
+	time.sleep(1.0)
+	return ShootCommand(0.0)
+
+
+def failing(gamestate, my_data):
+	raise RuntimeError('bug in the ai')
+
+
+class CountingStrategy(Strategy):
+
+	def __init__(self, setup_delay: float = 0.0):
+		self.setup_delay = setup_delay
+		self.nb_setups = 0
+		self.nb_steps = 0
+
+	def setup(self, initial_snapshot):
+		self.nb_setups += 1
+		time.sleep(self.setup_delay)
+
+	def step(self, snapshot):
+		self.nb_steps += 1
+		return ShootCommand(float(self.nb_steps))
+
+
+@pytest.fixture
+def make_agent():
+	agents = []
+
+	def make(ai, agent_class=AIAgent, **kwargs):
+		agent = agent_class('player_0', 0, ai, None if isinstance(ai, Strategy) else {}, **kwargs)
+		agents.append(agent)
+		return agent
+	yield make
+	for agent in agents:
+		agent._executor.shutdown()
+
+
+@pytest.mark.parametrize('command', [
+	MoveCommand((1.0, 0.0, 0.0)),
+	MoveCommand(np.array([0.0, 1.0, 0.0], dtype=np.float32)),
+	MoveCommand([1, 0, np.float64(0.5)]),
+	ShootCommand(90),
+	ShootCommand(np.float32(45.0)),
+	PlanCommand([(2, MoveCommand(np.zeros(3))), (1, ShootCommand(10.0))]),
+	InvalidCommand('crash test')
+])
+def test_valid_commands(command):
+	AIAgent._check_command(command)
+
+
+@pytest.mark.parametrize('command', [
+	None,
+	'MOVE',
+	MoveCommand((1.0, 0.0)),
+	MoveCommand(None),
+	MoveCommand(('1', 0.0, 0.0)),
+	MoveCommand(np.zeros((3, 1))),
+	ShootCommand(None),
+	ShootCommand('90'),
+	PlanCommand([]),
+	PlanCommand([(0, ShootCommand(1.0))]),
+	PlanCommand([(1.5, ShootCommand(1.0))]),
+	PlanCommand([(1, PlanCommand([(1, ShootCommand(1.0))]))]),
+	PlanCommand([(1, MoveCommand((1.0, 0.0)))]),
+	PlanCommand([(1, ShootCommand(None))])
+])
+def test_invalid_commands_abort_the_game(make_agent, command):
+	with pytest.raises(Exception):
+		AIAgent._check_command(command)
+	assert type(make_agent(returning(command))._ask_command(SNAPSHOT)) is InvalidCommand
+
+
+def test_exception_in_ai(make_agent):
+	command = make_agent(failing)._ask_command(SNAPSHOT)
+	assert type(command) is InvalidCommand
+	assert 'bug in the ai' in command.whatever_value
+
+
+def test_timeout(make_agent):
+	agent = make_agent(sleeping, ai_time=0.1)
+	command = agent._ask_command(SNAPSHOT)
+	assert type(command) is InvalidCommand
+	assert 'timed out' in command.whatever_value
+
+
+def test_async_timeout(make_agent):
+	agent = make_agent(sleeping, AsyncAIAgent, ai_time=0.1)
+	assert type(asyncio.run(agent._ask_command_async(SNAPSHOT))) is InvalidCommand
+	agent = make_agent(returning(ShootCommand(None)), AsyncAIAgent)
+	assert type(asyncio.run(agent._ask_command_async(SNAPSHOT))) is InvalidCommand
+
+
+def test_unencodable_command(make_agent):
+	agent = make_agent(sleeping)
+	assert json.loads(agent._encode_command(MoveCommand((1.0, 0.0))))['command_type'] == 'INVALID'
+	agent._codec = BinaryCodec()
+	# Frame size, then the INVALID type
+	assert agent._encode_command(ShootCommand(None))[4:8] == bytes(4)
+
+
+def test_json_non_finite_values():
+	codec = JsonCodec()
+	line = codec.encode_command(MoveCommand((float('nan'), float('inf'), -float('inf'))))
+	assert line == b'{"command_type": "MOVE", "move_direction": [NaN, Infinity, -Infinity]}\n'
+	assert codec.encode_command(ShootCommand(np.float32(1.5))) == b'{"command_type": "SHOOT", "shoot_angle": 1.5}\n'
+	plan = PlanCommand([(2, MoveCommand(np.array([0.5, np.nan, 0.0]))), (1, ShootCommand(np.float64(10.0)))], projectile_radius=3)
+	assert json.loads(codec.encode_command(plan)) == {
+		'command_type': 'PLAN',
+		'steps': [{'ticks': 2, 'command': {'command_type': 'MOVE', 'move_direction': [0.5, pytest.approx(float('nan'), nan_ok=True), 0.0]}},
+			{'ticks': 1, 'command': {'command_type': 'SHOOT', 'shoot_angle': 10.0}}],
+		'interrupt_on_damage': True,
+		'projectile_radius': 3.0
+	}
+	assert b'NaN' in codec.encode_command(plan)
+
+
+def test_strategy_with_data():
+	with pytest.raises(ValueError):
+		AIAgent('player_0', 0, CountingStrategy(), {})
+
+
+def test_pipelined_shared_memory():
+	with pytest.raises(ValueError):
+		AIAgent('player_0', 0, returning(ShootCommand(0.0)), protocol='shm', pipelined=True)
+
+
+@pytest.mark.parametrize('agent_class', [AIAgent, AsyncAIAgent])
+def test_strategy_setup(make_agent, agent_class):
+	strategy = CountingStrategy()
+	agent = make_agent(strategy, agent_class)
+	for angle in [1.0, 2.0]:
+		if agent_class is AIAgent:
+			command = agent._ask_command(SNAPSHOT)
+		else:
+			command = asyncio.run(agent._ask_command_async(SNAPSHOT))
+		assert command == ShootCommand(angle)
+	assert (strategy.nb_setups, strategy.nb_steps) == (1, 2)
+	assert agent._strategy_set_up
+	assert agent.data is strategy
+
+
+def test_strategy_setup_timeout(make_agent):
+	# The setup has its own budget, it is not counted in the time of the AI
+	strategy = CountingStrategy(setup_delay=0.3)
+	agent = make_agent(strategy, ai_time=0.2, setup_time=0.1)
+	assert type(agent._ask_command(SNAPSHOT)) is InvalidCommand
+	assert not agent._strategy_set_up
+	assert agent._remaining_time == 0.2
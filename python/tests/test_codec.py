@@ -0,0 +1,175 @@
+'''Round trips of the binary, shared memory and delta codecs on fixed frames, with the layouts written by the server.'''
+import mmap
+import numpy as np
+import pytest
+from codec import BinaryCodec, SharedMemoryCodec, DeltaCodec, _MirrorTable
+from game_data import PLAYER_DTYPE, PROJECTILE_DTYPE, PlayerData, ProjectileData, RecordPool
+from game_data import MoveCommand, ShootCommand, PlanCommand
+
+# ASK_COMMAND snapshot: the controlled player, one other player and one projectile
+SNAPSHOT_BODY = bytes.fromhex(
+	'0100000001000000010000000000803f00000040000000000000003f00000000000000000000a041'
+	'000000000000c03f01000000000040c0000080400000000000000000000080bf0000000000002041'
+	'0100000000000000000000000000a0400000c04000000000000000c00000000000000000')
+
+CONTROLLED_PLAYER = PlayerData((1.0, 2.0, 0.0), (0.5, 0.0, 0.0), 20.0, 0, 1.5)
+OTHER_PLAYER = PlayerData((-3.0, 4.0, 0.0), (0.0, -1.0, 0.0), 10.0, 1, 0.0)
+PROJECTILE = ProjectileData((5.0, 6.0, 0.0), (-2.0, 0.0, 0.0))
+
+MOVE_FRAME = bytes.fromhex('10000000' '01000000' '0000803f' '000000c0' '00000000')
+SHOOT_FRAME = bytes.fromhex('08000000' '02000000' '0000c03f')
+# Move for 3 ticks then shoot for 1 tick, interrupted on damage, without projectile radius
+PLAN_FRAME = bytes.fromhex('30000000' '04000000' '01000000' '000080bf' '02000000'
+	'03000000' '01000000' '0000803f' '00000000' '00000000'
+	'01000000' '02000000' '00000040')
+
+# Delta adding the players 7 (controlled) and 9 with all their fields, and the projectile 12
+DELTA_ADD_BODY = bytes.fromhex(
+	'05000000070000000000000002000000000000003f0000000200000007000000090000000000803f'
+	'00000040000000000000003f00000000000000000000a041000000000000c03f01000000000040c0'
+	'000080400000000000000000000080bf000000000000204101000000000000000000000001000000'
+	'03000000010000000c0000000000a0400000c04000000000000000c00000000000000000')
+# Delta removing the projectile 12 and setting the health of the player 9 to 5
+DELTA_UPDATE_BODY = bytes.fromhex('050000000700000001000000010000000c000000000000000400000001000000090000000000a040')
+
+
+def test_record_dtypes_match_binary_records():
+	assert PLAYER_DTYPE.itemsize == 40
+	assert PROJECTILE_DTYPE.itemsize == 24
+	players = np.frombuffer(SNAPSHOT_BODY, PLAYER_DTYPE, 2, 12)
+	assert players['pos'].tolist() == [[1.0, 2.0, 0.0], [-3.0, 4.0, 0.0]]
+	assert players['team'].tolist() == [0, 1]
+	assert players['state'].tolist() == [1, 0]
+	projectiles = np.frombuffer(SNAPSHOT_BODY, PROJECTILE_DTYPE, 1, 92)
+	assert projectiles['speed'].tolist() == [[-2.0, 0.0, 0.0]]
+
+
+@pytest.mark.parametrize('pool', [None, RecordPool()])
+def test_binary_snapshot(pool):
+	header, snapshot = BinaryCodec(pool).decode_message(SNAPSHOT_BODY)
+	assert header == 'ASK_COMMAND'
+	assert snapshot.controlled_player == CONTROLLED_PLAYER
+	assert snapshot.other_players == [OTHER_PLAYER]
+	assert snapshot.projectiles == [PROJECTILE]
+	assert snapshot.player_health.tolist() == [10.0]
+	assert snapshot.projectile_positions.tolist() == [[5.0, 6.0, 0.0]]
+
+
+def test_binary_commands():
+	codec = BinaryCodec()
+	assert codec.encode_command(MoveCommand((1.0, -2.0, 0.0))) == MOVE_FRAME
+	assert codec.encode_command(MoveCommand(np.array([1.0, -2.0, 0.0]))) == MOVE_FRAME
+	assert codec.encode_command(ShootCommand(1.5)) == SHOOT_FRAME
+	plan = PlanCommand([(3, MoveCommand((1.0, 0.0, 0.0))), (1, ShootCommand(2.0))], interrupt_on_damage=True)
+	assert codec.encode_command(plan) == PLAN_FRAME
+
+
+@pytest.fixture
+def ring(tmp_path):
+	nb_slots, slot_size, command_slot_size = 2, 256, 64
+	path = tmp_path / 'ring'
+	path.write_bytes(bytes(nb_slots * (slot_size + command_slot_size)))
+	codec = SharedMemoryCodec(str(path), nb_slots, slot_size, command_slot_size)
+	with open(path, 'r+b') as file:
+		server_map = mmap.mmap(file.fileno(), 0)
+	yield codec, server_map, slot_size, nb_slots * slot_size, command_slot_size
+	server_map.close()
+
+
+def test_shared_memory_snapshot_and_command(ring):
+	codec, server_map, slot_size, commands_offset, command_slot_size = ring
+	server_map[slot_size:slot_size + len(SNAPSHOT_BODY)] = SNAPSHOT_BODY
+	doorbell = bytes.fromhex('04000000' '01000000')
+	assert codec.message_header(doorbell) == 'ASK_COMMAND'
+	header, snapshot = codec.decode_message(doorbell)
+	assert header == 'ASK_COMMAND'
+	assert snapshot.controlled_player == CONTROLLED_PLAYER
+	assert snapshot.other_players == [OTHER_PLAYER]
+	assert snapshot.projectiles == [PROJECTILE]
+
+	# The slot of the answered snapshot is used even when the next doorbell was already decoded
+	codec.decode_message(bytes.fromhex('04000000' '00000000'))
+	assert codec.encode_command(ShootCommand(1.5), snapshot) == bytes.fromhex('08000000' '03000000' '01000000')
+	offset = commands_offset + command_slot_size
+	assert server_map[offset:offset + 8] == SHOOT_FRAME[4:]
+	assert server_map[commands_offset:commands_offset + 8] == bytes(8)
+	# The agents decoding the snapshots in another process answer the raw doorbell
+	assert codec.encode_command(MoveCommand((1.0, -2.0, 0.0)), doorbell) == bytes.fromhex('08000000' '03000000' '01000000')
+	assert server_map[offset:offset + 16] == MOVE_FRAME[4:]
+
+	# Plans do not fit in the command slots and are sent through the socket
+	plan = PlanCommand([(3, MoveCommand((1.0, 0.0, 0.0))), (1, ShootCommand(2.0))], interrupt_on_damage=True)
+	assert codec.encode_command(plan, snapshot) == PLAN_FRAME
+
+	del snapshot
+	codec.close()
+	assert codec._map.closed
+
+
+def test_shared_memory_snapshot_through_socket(ring):
+	codec = ring[0]
+	header, snapshot = codec.decode_message(SNAPSHOT_BODY)
+	assert snapshot.other_players == [OTHER_PLAYER]
+	assert codec.encode_command(MoveCommand((1.0, -2.0, 0.0)), snapshot) == MOVE_FRAME
+
+
+def test_delta_snapshots():
+	codec = DeltaCodec()
+	assert codec.message_header(DELTA_ADD_BODY) == 'ASK_COMMAND'
+	header, snapshot = codec.decode_message(DELTA_ADD_BODY)
+	assert header == 'ASK_COMMAND'
+	assert snapshot.controlled_player == CONTROLLED_PLAYER
+	assert snapshot.other_players == [OTHER_PLAYER]
+	assert snapshot.projectiles == [PROJECTILE]
+
+	_, snapshot = codec.decode_message(DELTA_UPDATE_BODY)
+	assert snapshot.controlled_player == CONTROLLED_PLAYER
+	assert snapshot.other_players == [PlayerData((-3.0, 4.0, 0.0), (0.0, -1.0, 0.0), 5.0, 1, 0.0)]
+	assert snapshot.projectiles == []
+	assert snapshot.projectile_array.shape == (0,)
+
+
+def test_mirror_table():
+	table = _MirrorTable(PROJECTILE_DTYPE)
+	values = np.zeros(3, dtype=PROJECTILE_DTYPE)
+	values['pos'][:, 0] = [1.0, 2.0, 3.0]
+	table.update(np.array([4, 100, 8]), values)
+	assert table.size == 3
+	assert table.rows_of(np.array([8, 4, 5, 1000])).tolist() == [2, 0, -1, -1]
+
+	speeds = np.zeros(1, dtype=np.dtype([('speed', '<f4', (3,))]))
+	speeds['speed'] = [0.0, 1.0, 0.0]
+	table.update(np.array([100]), speeds)
+	assert table.rows['speed'][1].tolist() == [0.0, 1.0, 0.0]
+	assert table.rows['pos'][1].tolist() == [2.0, 0.0, 0.0]
+
+	table.remove(np.array([4, 5]))
+	assert table.size == 2
+	assert table.entities[:table.size].tolist() == [100, 8]
+	assert table.rows_of(np.array([4, 100, 8])).tolist() == [-1, 0, 1]
+	assert table.rows['pos'][:table.size, 0].tolist() == [2.0, 3.0]
+
+	# A removed entity is added again with its fields zeroed, then the table grows past its capacity
+	table.update(np.array([4]), np.zeros(1, dtype=np.dtype([('speed', '<f4', (3,))])))
+	assert table.rows['pos'][table.rows_of(np.array([4]))[0]].tolist() == [0.0, 0.0, 0.0]
+	table.update(np.arange(200, 240), np.zeros(40, dtype=PROJECTILE_DTYPE))
+	assert table.size == 43
+	assert table.rows_of(np.array([239, 8])).tolist() == [42, 1]
+
+
+def test_mirror_table_defaults_and_empty_groups():
+	table = _MirrorTable(PLAYER_DTYPE)
+	table.update(np.array([], dtype=np.int64), np.zeros(0, dtype=np.dtype([('health', '<f4')])))
+	assert table.size == 0
+	# The fields never sent have the values of the fields skipped by the JSON protocol
+	health = np.zeros(1, dtype=np.dtype([('health', '<f4')]))
+	health['health'] = 5.0
+	table.update(np.array([3]), health)
+	assert table.rows['team'][0] == -1
+	assert table.rows['state'][0] == -1
+	assert table.rows['health'][0] == 5.0
+
+
+def test_delta_of_unknown_controlled_entity():
+	with pytest.raises(ValueError):
+		DeltaCodec().decode_message(DELTA_UPDATE_BODY)
@@ -0,0 +1,14 @@
+'''An interrupted DeadlineExecutor does not leave its worker thread blocked.'''
+from execution import DeadlineExecutor
+
+
+def test_interrupted_idle_worker_exits():
+	executor = DeadlineExecutor()
+	executor.submit(lambda: 1).result(timeout=5.0)
+	worker = executor._thread
+	# The call already returned, the worker waits for the next request when it is interrupted
+	executor.interrupt()
+	worker.join(timeout=5.0)
+	assert not worker.is_alive()
+	assert executor.call(5.0, lambda: 2) == 2
+	executor.shutdown()
@@ -0,0 +1,24 @@
+'''Rounds whose server exits before accepting the agents are aborted right away, without starting the agents.'''
+import shutil
+import time
+import pytest
+from game_simulation import GameSimulation
+from game_data import MoveCommand
+
+
+def idle_ai(gamestate, my_data):
+	return MoveCommand((0.0, 1.0, 0.0))
+
+
+# The server thread of a JVM that cannot be started reports the error of the spawn without raising
+@pytest.mark.filterwarnings('error::pytest.PytestUnhandledThreadExceptionWarning')
+@pytest.mark.parametrize('jvm_path', [shutil.which('false'), '/nonexistent/bin/java'])
+def test_server_exiting_before_listening(tmp_path, jvm_path):
+	simulation = GameSimulation(jvm_path, save_file=str(tmp_path / 'round.hackathon'), port=None)
+	simulation.set_first_agent('first', idle_ai, {'first': True})
+	simulation.set_second_agent('second', idle_ai, {'second': True})
+	begin = time.perf_counter()
+	results, data = simulation.play_round()
+	assert time.perf_counter() - begin < 5.0
+	assert [(result.username, result.aborted, result.blame) for result in results] == [('first', True, 'server'), ('second', True, 'server')]
+	assert data == [{'first': True}, {'second': True}]
@@ -0,0 +1,106 @@
+'''Resolution of the Java runtime: the versions printed by java -version and the JRE archives of the local cache.'''
+import os
+import stat
+import tarfile
+import pytest
+import jre
+
+OPENJDK_16 = '''openjdk version "16.0.2" 2021-07-20
+OpenJDK Runtime Environment AdoptOpenJDK-16.0.2+7 (build 16.0.2+7)
+OpenJDK 64-Bit Server VM AdoptOpenJDK-16.0.2+7 (build 16.0.2+7, mixed mode, sharing)
+'''
+OPENJDK_15 = '''openjdk version "15.0.2" 2021-01-19
+OpenJDK Runtime Environment AdoptOpenJDK (build 15.0.2+7)
+OpenJDK 64-Bit Server VM AdoptOpenJDK (build 15.0.2+7, mixed mode, sharing)
+'''
+ORACLE_8 = '''java version "1.8.0_301"
+Java(TM) SE Runtime Environment (build 1.8.0_301-b09)
+'''
+EARLY_ACCESS = 'openjdk version "17-ea" 2021-09-14\n'
+
+
+@pytest.mark.parametrize('output, version', [
+	(OPENJDK_16, 16),
+	(OPENJDK_15, 15),
+	(ORACLE_8, 8),
+	(EARLY_ACCESS, 17),
+	('Error: could not find libjava.so\n', None),
+	('', None)
+])
+def test_parse_java_version(output, version):
+	assert jre.parse_java_version(output) == version
+
+
+def fake_java(directory, output: str) -> str:
+	'''Script printing the given version, as java -version does (on the standard error).'''
+	bin_dir = os.path.join(directory, 'bin')
+	os.makedirs(bin_dir)
+	java_path = os.path.join(bin_dir, 'java')
+	with open(java_path, 'w') as file:
+		file.write('#!/bin/sh\n' + ''.join(f"echo '{line}' >&2\n" for line in output.splitlines()))
+	os.chmod(java_path, os.stat(java_path).st_mode | stat.S_IXUSR)
+	return java_path
+
+
+@pytest.fixture
+def jre_archive(tmp_path):
+	fake_java(str(tmp_path / 'jdk-16.0.2+7-jre'), OPENJDK_16)
+	archive = str(tmp_path / 'jre16.tar.gz')
+	with tarfile.open(archive, 'w:gz') as file:
+		file.add(str(tmp_path / 'jdk-16.0.2+7-jre'), 'jdk-16.0.2+7-jre')
+	return archive
+
+
+@pytest.fixture
+def no_system_java(monkeypatch, tmp_path):
+	monkeypatch.delenv('JAVA_HOME', raising=False)
+	monkeypatch.setenv('PATH', str(tmp_path / 'empty'))
+	jre.resolve_java.cache_clear()
+	yield
+	jre.resolve_java.cache_clear()
+
+
+def test_java_version(tmp_path):
+	assert jre.java_version(fake_java(str(tmp_path), OPENJDK_16)) == 16
+	assert jre.java_version(str(tmp_path / 'missing' / 'java')) is None
+
+
+def test_resolve_from_cache(tmp_path, jre_archive, no_system_java):
+	cache_dir = str(tmp_path / 'cache')
+	with pytest.raises(jre.JREError):
+		jre.resolve_java(cache_dir=cache_dir, offline=True)
+
+	digest = jre.add_archive(jre_archive, cache_dir, version=jre.JRE_VERSION)
+	assert digest == jre.file_sha256(jre_archive)
+	java_path = jre.resolve_java(cache_dir=cache_dir, offline=True)
+	assert java_path.startswith(os.path.join(cache_dir, 'runtimes', digest))
+	assert jre.java_version(java_path) == 16
+	# Resolved once per process
+	assert jre.resolve_java(cache_dir=cache_dir, offline=True) is java_path
+
+
+def test_resolve_rejects_old_java_home(tmp_path, jre_archive, no_system_java, monkeypatch):
+	fake_java(str(tmp_path / 'jdk-15'), OPENJDK_15)
+	monkeypatch.setenv('JAVA_HOME', str(tmp_path / 'jdk-15'))
+	cache_dir = str(tmp_path / 'cache')
+	jre.add_archive(jre_archive, cache_dir, version=jre.JRE_VERSION)
+	assert jre.java_version(jre.resolve_java(cache_dir=cache_dir, offline=True)) == 16
+
+	fake_java(str(tmp_path / 'jdk-16'), OPENJDK_16)
+	monkeypatch.setenv('JAVA_HOME', str(tmp_path / 'jdk-16'))
+	jre.resolve_java.cache_clear()
+	assert jre.resolve_java(cache_dir=cache_dir, offline=True) == str(tmp_path / 'jdk-16' / 'bin' / 'java')
+
+
+def test_corrupted_cache(tmp_path, jre_archive, no_system_java):
+	cache_dir = str(tmp_path / 'cache')
+	with pytest.raises(jre.JREError):
+		jre.add_archive(jre_archive, cache_dir, sha256='00' * 32)
+
+	digest = jre.add_archive(jre_archive, cache_dir, version=jre.JRE_VERSION)
+	with open(jre._cached_archive(cache_dir, digest), 'ab') as file:
+		file.write(b'corrupted')
+	# The archive no longer matches its checksum, it is not extracted
+	with pytest.raises(jre.JREError):
+		jre.resolve_java(cache_dir=cache_dir, offline=True)
+	assert not os.path.exists(os.path.join(cache_dir, 'runtimes', digest))
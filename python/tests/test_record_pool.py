@@ -0,0 +1,46 @@
+'''The records of a RecordPool are only reused two generations after they were handed out.'''
+from codec import BinaryCodec, SNAPSHOT_HEADER, PLAYER_RECORD, PROJECTILE_RECORD
+from game_data import RecordPool
+
+
+def snapshot_body(tick: int) -> bytes:
+	return (SNAPSHOT_HEADER.pack(1, 1, 1) + PLAYER_RECORD.pack(tick, 0, 0, 0, 0, 0, 20, 0, 0, 1)
+		+ PLAYER_RECORD.pack(-tick, 0, 0, 0, 0, 0, 10, 1, 0, 0) + PROJECTILE_RECORD.pack(tick, tick, 0, 0, 0, 0))
+
+
+def test_previous_snapshot_is_not_overwritten():
+	codec = BinaryCodec(RecordPool())
+	previous = None
+	for tick in range(5):
+		_, snapshot = codec.decode_message(snapshot_body(tick))
+		assert snapshot.controlled_player.position[0] == tick
+		assert snapshot.other_players[0].position[0] == -tick
+		assert snapshot.projectiles[0].position[1] == tick
+		if previous is not None:
+			assert previous.controlled_player.position[0] == tick - 1
+			assert previous.other_players[0].position[0] == -(tick - 1)
+			assert previous.projectiles[0].position[1] == tick - 1
+		previous = snapshot
+
+
+def test_records_are_reused():
+	pool = RecordPool()
+	codec = BinaryCodec(pool)
+	records = set()
+	for tick in range(10):
+		_, snapshot = codec.decode_message(snapshot_body(tick))
+		records.update(id(record) for record in (snapshot.controlled_player, snapshot.other_players[0], snapshot.projectiles[0]))
+	# Three generations of three records at most
+	assert len(records) <= 9
+
+
+def test_free_records_are_capped():
+	pool = RecordPool(max_records=2)
+	for _ in range(3):
+		pool.recycle()
+		for _ in range(10):
+			pool.player((0.0, 0.0, 0.0), (0.0, 0.0, 0.0), 0.0, 0, 0.0)
+			pool.projectile((0.0, 0.0, 0.0), (0.0, 0.0, 0.0))
+	pool.recycle()
+	assert len(pool._free_players) == 2
+	assert len(pool._free_projectiles) == 2
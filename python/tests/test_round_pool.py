@@ -0,0 +1,31 @@
+'''The rounds of a RoundPool are played by the same warm workers, a worker exiting during a round is replaced.'''
+import os
+import pytest
+from round_pool import RoundPool
+
+
+def worker_pid() -> int:
+	return os.getpid()
+
+
+def exiting_round():
+	os._exit(3)
+
+
+@pytest.fixture
+def pool():
+	pool = RoundPool(1, preload=[])
+	yield pool
+	pool.shutdown()
+
+
+def test_rounds_reuse_the_worker(pool):
+	pids = {pool.submit(worker_pid).result(timeout=30.0) for _ in range(3)}
+	assert len(pids) == 1
+	assert os.getpid() not in pids
+
+
+def test_exited_worker_is_replaced(pool):
+	with pytest.raises(Exception, match='exited during the round'):
+		pool.submit(exiting_round).result(timeout=30.0)
+	assert pool.submit(worker_pid).result(timeout=30.0) != os.getpid()
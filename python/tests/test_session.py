@@ -0,0 +1,99 @@
+'''Sessions of the team modules, started by several threads at once as the scheduler does, and the batched commands.'''
+import asyncio
+import concurrent.futures
+import time
+import typing
+import pytest
+from codec import BINARY_PROTOCOL, SNAPSHOT_HEADER, PLAYER_RECORD
+from execution import DeadlineExceeded
+from game_data import ShootCommand
+from session import TeamSession
+
+TEAM_MODULE = '''
+import os
+from game_data import ShootCommand
+
+
+def my_data():
+	return {'pid': os.getpid(), 'matches': 0}
+
+
+def my_reset(loaded_data):
+	loaded_data['matches'] += 1
+	return dict(loaded_data)
+
+
+def my_ai(gamestate, my_data):
+	return ShootCommand(0.0)
+'''
+
+
+async def open_and_close(session: TeamSession, match_id: str) -> bool:
+	strategy = await session.open_match(match_id, None)
+	await session.close_match(match_id)
+	return strategy
+
+
+def test_sessions_started_concurrently(tmp_path, monkeypatch):
+	for team in ['alpha', 'beta', 'gamma']:
+		(tmp_path / f'{team}_ai.py').write_text(TEAM_MODULE)
+	monkeypatch.syspath_prepend(str(tmp_path))
+	sessions = [TeamSession.for_team(team, f'{team}_ai', str(tmp_path)) for team in ['alpha', 'beta', 'gamma']]
+	try:
+		with concurrent.futures.ThreadPoolExecutor(len(sessions)) as executor:
+			list(executor.map(TeamSession.start, sessions))
+		for session in sessions:
+			assert session.submit(open_and_close(session, 'match')).result() is False
+	finally:
+		for session in sessions:
+			session.shutdown()
+
+# Binary snapshot of the controlled player alone
+SNAPSHOT_BODY = SNAPSHOT_HEADER.pack(1, 0, 0) + PLAYER_RECORD.pack(0, 0, 0, 0, 0, 0, 20, 0, 0, 0)
+
+
+def batch_ai(gamestates, datas):
+	if any(data.get('raises') for data in datas):
+		raise ValueError('Batch failure')
+	time.sleep(max(data.get('sleep', 0.0) for data in datas))
+	return [ShootCommand(1.0) for _ in gamestates]
+
+
+def alone_ai(gamestate, my_data):
+	return ShootCommand(2.0)
+
+
+async def ask_commands(session: TeamSession, datas: typing.List[typing.Dict], timeouts: typing.List[float]) -> typing.List:
+	match_ids = [f'match-{index}' for index in range(len(datas))]
+	for match_id, data in zip(match_ids, datas):
+		await session.open_match(match_id, data)
+	try:
+		return await asyncio.gather(*(session.ask_command(timeout, match_id, BINARY_PROTOCOL, {}, SNAPSHOT_BODY)
+			for match_id, timeout in zip(match_ids, timeouts)), return_exceptions=True)
+	finally:
+		for match_id in match_ids:
+			await session.close_match(match_id)
+
+
+@pytest.fixture
+def batch_session():
+	session = TeamSession('batch', alone_ai, ai_batch=batch_ai)
+	yield session
+	session.shutdown()
+
+
+def test_batch_charges_each_match_the_whole_call(batch_session):
+	results = batch_session.submit(ask_commands(batch_session, [{'sleep': 0.05}, {}], [5.0, 5.0])).result()
+	assert [command for command, _ in results] == [ShootCommand(1.0), ShootCommand(1.0)]
+	assert all(elapsed_seconds >= 0.05 for _, elapsed_seconds in results)
+
+
+def test_batch_failure_asks_each_match_alone(batch_session):
+	results = batch_session.submit(ask_commands(batch_session, [{'raises': True}, {}], [5.0, 5.0])).result()
+	assert [command for command, _ in results] == [ShootCommand(2.0), ShootCommand(2.0)]
+
+
+def test_batch_timeout_only_fails_the_match_out_of_time(batch_session):
+	results = batch_session.submit(ask_commands(batch_session, [{'sleep': 0.5}, {}], [0.1, 5.0])).result()
+	assert isinstance(results[0], DeadlineExceeded)
+	assert results[1][0] == ShootCommand(2.0)
@@ -0,0 +1,160 @@
+import asyncio
+import socket
+import struct
+import time
+import typing
+
+FRAME_HEADER = struct.Struct('<I')
+
+# The connections are retried while the server is starting, with an exponential backoff (in seconds)
+CONNECT_TIMEOUT = 30.0
+FIRST_RETRY_DELAY = 0.005
+MAX_RETRY_DELAY = 0.25
+
+# Errors raised when the server is not listening yet (the unix domain socket file does not exist yet)
+_NOT_LISTENING_ERRORS = (ConnectionRefusedError, FileNotFoundError)
+
+
+def _retry_delays(timeout: float) -> typing.Iterator[float]:
+	'''Delays to wait between the connection attempts, until timeout seconds have elapsed.'''
+	deadline = time.monotonic() + timeout
+	delay = FIRST_RETRY_DELAY
+	while time.monotonic() + delay < deadline:
+		yield delay
+		delay = min(delay * 2, MAX_RETRY_DELAY)
+
+
+def _connect_once(address: str, port: int, socket_path: str = None) -> socket.socket:
+	if socket_path is not None:
+		connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		target = socket_path
+	else:
+		connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		target = (address, port)
+	try:
+		connection.connect(target)
+	except OSError:
+		connection.close()
+		raise
+	return connection
+
+
+def connect(address: str, port: int, socket_path: str = None, timeout: float = CONNECT_TIMEOUT) -> socket.socket:
+	'''Connects to the server through the unix domain socket at socket_path if given, through TCP otherwise.
+	The connection is retried until the server listens, for at most timeout seconds.'''
+	for delay in _retry_delays(timeout):
+		try:
+			return _connect_once(address, port, socket_path)
+		except _NOT_LISTENING_ERRORS:
+			time.sleep(delay)
+	return _connect_once(address, port, socket_path)
+
+
+async def _open_connection_once(address: str, port: int, socket_path: str, limit: int) \
+	-> typing.Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+	if socket_path is not None:
+		return await asyncio.open_unix_connection(socket_path, limit=limit)
+	return await asyncio.open_connection(address, port, limit=limit)
+
+
+async def open_connection(address: str, port: int, socket_path: str = None, limit: int = 2 ** 16,
+	timeout: float = CONNECT_TIMEOUT) -> typing.Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+	'''Asyncio counterpart of connect(), returns the reader and the writer of the connection.'''
+	for delay in _retry_delays(timeout):
+		try:
+			return await _open_connection_once(address, port, socket_path, limit)
+		except _NOT_LISTENING_ERRORS:
+			await asyncio.sleep(delay)
+	return await _open_connection_once(address, port, socket_path, limit)
+
+
+class MessageReader:
+	'''Newline-framed (and length-prefixed framed) reader over a stream socket.
+
+	The bytes received from the socket are accumulated inside a single reusable buffer,
+	so partial messages (snapshots larger than one segment) and coalesced messages (several
+	messages inside one segment) are both handled. Blank lines are skipped, as the server
+	sends an empty line after each message.
+	'''
+
+	def __init__(self, connection: socket.socket, buffer_size: int = 65536):
+		self._socket = connection
+		self._buffer = bytearray(buffer_size)
+		# [_start, _end) is the range of received bytes that are not consumed yet
+		self._start = 0
+		self._end = 0
+
+	def _fill(self):
+		if self._start == self._end:
+			self._start = self._end = 0
+		elif self._end == len(self._buffer):
+			if self._start > 0:
+				# Moves the pending bytes at the beginning of the buffer
+				pending = self._end - self._start
+				self._buffer[:pending] = self._buffer[self._start:self._end]
+				self._start, self._end = 0, pending
+			else:
+				# The pending message does not fit inside the buffer, doubles its size
+				self._buffer.extend(bytes(len(self._buffer)))
+
+		with memoryview(self._buffer) as view:
+			received = self._socket.recv_into(view[self._end:])
+		if received == 0:
+			raise ConnectionError('Connection closed by the remote end.')
+		self._end += received
+
+	def read_line(self) -> bytes:
+		'''Returns the next non-blank line received on the socket, without the trailing newline.
+		Blocks until a full line is available.'''
+		while True:
+			end = self._buffer.find(b'\n', self._start, self._end)
+			if end < 0:
+				self._fill()
+				continue
+			line = bytes(self._buffer[self._start:end])
+			self._start = end + 1
+			if line.strip():
+				return line
+
+	def read_exact(self, size: int) -> bytes:
+		'''Returns exactly the next size bytes received on the socket.'''
+		while self._end - self._start < size:
+			self._fill()
+		data = bytes(self._buffer[self._start:self._start + size])
+		self._start += size
+		return data
+
+	def read_frame(self) -> bytes:
+		'''Returns the body of the next length-prefixed frame (little-endian uint32 size, then the body).'''
+		size, = FRAME_HEADER.unpack(self.read_exact(FRAME_HEADER.size))
+		return self.read_exact(size)
+
+	def pending(self) -> int:
+		'''Number of received bytes that were not consumed yet.'''
+		return self._end - self._start
+
+
+class AsyncMessageReader:
+	'''Asyncio counterpart of the MessageReader, reading from an asyncio.StreamReader.'''
+
+	def __init__(self, stream: asyncio.StreamReader):
+		self._stream = stream
+
+	async def read_line(self) -> bytes:
+		'''Returns the next non-blank line, without the trailing newline.'''
+		while True:
+			try:
+				line = await self._stream.readuntil(b'\n')
+			except asyncio.IncompleteReadError:
+				raise ConnectionError('Connection closed by the remote end.') from None
+			line = line[:-1]
+			if line.strip():
+				return line
+
+	async def read_frame(self) -> bytes:
+		'''Returns the body of the next length-prefixed frame.'''
+		try:
+			size, = FRAME_HEADER.unpack(await self._stream.readexactly(FRAME_HEADER.size))
+			return await self._stream.readexactly(size)
+		except asyncio.IncompleteReadError:
+			raise ConnectionError('Connection closed by the remote end.') from None
@@ -3,22 +3,26 @@ package client;
 import com.badlogic.gdx.backends.lwjgl.LwjglApplication;
 import com.badlogic.gdx.backends.lwjgl.LwjglApplicationConfiguration;
 import game.DesktopClient;
+import game.MatchHost;
 import game.ReplayClient;
 import game.WindowlessClient;
 import game.WindowlessReplayClient;
 import org.apache.commons.cli.*;
+import systems.AITransports;
 
 import java.awt.*;
 
 public class ClientDesktopLauncher {
     public static void main(String[] arg) throws ParseException, IllegalArgumentException {
         Options options = new Options();
-        options.addRequiredOption("m", "mode", true, "The mode of the server to run (window, windowless and replay)");
+        options.addRequiredOption("m", "mode", true, "The mode of the server to run (window, windowless, host and replay)");
         options.addOption("f", "file", true, "Path to the file where to save the AI actions or where to replay the actions.");
         options.addOption("t", "gametime", true, "Game time (in seconds) - Default: 60s");
         options.addOption("a", "aitime", true, "Time dedicated for each AI to compute. - Default: 150s");
         options.addOption("c", "cps", true, "Commands per seconds (asked to the python AI). - Default: 4 per second");
-        options.addOption("p", "port", true, "Used port by the server.");
+        options.addOption("p", "port", true, "Used port by the server, 0 to bind a free port (printed once the server is ready). In host mode, the control port of the host - Default: a free port");
+        options.addOption("s", "socket", true, "Path of the unix domain socket used instead of the port (requires Java 16+).");
+        options.addOption("d", "deadline", true, "Per-tick deadline (in milliseconds) of the AI commands, the game keeps running in real-time and applies the last command when it is reached. - Default: disabled, the game waits for each command");
 
         CommandLineParser parser = new DefaultParser();
         CommandLine cmd = parser.parse(options, arg);
@@ -29,11 +33,14 @@ public class ClientDesktopLauncher {
         String aiTime = cmd.getOptionValue("a");
         String commandsPerSecond = cmd.getOptionValue("c");
         String port = cmd.getOptionValue("p");
+        String socketPath = cmd.getOptionValue("s");
+        String tickDeadline = cmd.getOptionValue("d");
 
         float actualGameTime = 0f;
         float actualAITime = 0f;
         float actualCommandsPerSeconds = 0f;
         int actualPort = 0;
+        float actualTickDeadline = 0f;
 
         if (gameTime != null)
             actualGameTime = Float.parseFloat(gameTime);
@@ -55,6 +62,12 @@ public class ClientDesktopLauncher {
         else
             actualPort = 2049;
 
+        if (tickDeadline != null)
+            actualTickDeadline = Float.parseFloat(tickDeadline);
+
+        if (socketPath != null)
+            AITransports.requireUnixSockets();
+
         if (mode.equals("window")) {
             LwjglApplicationConfiguration applicationConfiguration = new LwjglApplicationConfiguration();
             applicationConfiguration.title = "Hackathon22";
@@ -71,9 +84,15 @@ public class ClientDesktopLauncher {
             if (file == null) {
                 throw new IllegalArgumentException("Please specify the save file path when running on windowless mode.");
             }
-            WindowlessClient client = new WindowlessClient(file, actualGameTime, actualAITime, actualCommandsPerSeconds, actualPort);
+            WindowlessClient client = new WindowlessClient(file, actualGameTime, actualAITime, actualCommandsPerSeconds, actualPort, socketPath, actualTickDeadline);
             client.create();
             client.play();
+            System.exit(0);
+        }
+        else if (mode.equals("host")) {
+            // the matches are requested on the control port, see MatchHost
+            MatchHost host = new MatchHost(port != null ? actualPort : 0);
+            host.serve();
         }
         else if (mode.equals("replay")) {
             if (file == null) {
@@ -50,6 +50,26 @@ class ShootCommand(@SerializedName("angle") val angle: Float? = null) : StateCom
     }
 }
 
+/**
+ * Step of a plan, its command is issued on each of its AI ticks.
+ */
+data class PlanStep(@SerializedName("ticks") val ticks: Int, @SerializedName("command") val command: StateCommand)
+
+/**
+ * Sent by an AI to schedule several commands at once. The AI system issues the steps one AI tick after the other,
+ * and only asks the AI again when the plan is over, when the character takes damage (if interruptOnDamage) or when a
+ * projectile comes toward it within the projectile radius (if given).
+ */
+class PlanCommand(
+    @SerializedName("steps") val steps: List<PlanStep>,
+    @SerializedName("interruptOnDamage") val interruptOnDamage: Boolean = true,
+    @SerializedName("projectileRadius") val projectileRadius: Float? = null
+) : StateCommand("planCommand") {
+    override fun toString(): String {
+        return "PlanCommand(steps=$steps, interruptOnDamage=$interruptOnDamage, projectileRadius=$projectileRadius)"
+    }
+}
+
 
 data class CommandComponent(var controllerType: ControllerType = ControllerType.LOCAL_INPUT,
                             val commands: Queue<Command> = LinkedList()) : IComponent
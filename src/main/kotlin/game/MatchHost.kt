@@ -0,0 +1,128 @@
+package game
+
+import com.google.gson.annotations.SerializedName
+import systems.JSONConvertable
+import systems.ScoreResult
+import systems.toObject
+import java.io.BufferedReader
+import java.io.InputStreamReader
+import java.io.OutputStreamWriter
+import java.io.PrintWriter
+import java.net.InetAddress
+import java.net.InetSocketAddress
+import java.net.ServerSocket
+import java.net.Socket
+import java.net.SocketException
+import kotlin.concurrent.thread
+
+/**
+ * Request sent on a control connection of the match host, as a single JSON line. A PLAY request plays a match
+ * with the parameters of the windowless mode, a SHUTDOWN request stops the host once its matches are over.
+ */
+data class HostRequest(
+    @SerializedName("request") val request: String,
+    @SerializedName("file") val file: String?,
+    @SerializedName("game_time") val gameTime: Float,
+    @SerializedName("ai_time") val aiTime: Float,
+    @SerializedName("commands_per_second") val commandsPerSecond: Float,
+    @SerializedName("port") val port: Int,
+    @SerializedName("socket_path") val socketPath: String?,
+    @SerializedName("tick_deadline") val tickDeadline: Float
+) : JSONConvertable
+
+/**
+ * Events sent back on the control connection of a match, one JSON line each: READY once the agents can connect to
+ * the address of the match, then FINISHED with the results of the match, or ERROR.
+ */
+data class HostEvent(
+    @SerializedName("event") val event: String,
+    @SerializedName("address") val address: String? = null,
+    @SerializedName("results") val results: List<ScoreResult>? = null,
+    @SerializedName("aborted") val aborted: Boolean? = null,
+    @SerializedName("error") val error: String? = null
+) : JSONConvertable
+
+/**
+ * Runs many matches inside a single JVM (host mode), so that the matches do not pay for the startup of the JVM,
+ * the class loading and the warm-up of the JIT. The matches are requested on a control port bound to the loopback
+ * interface: each control connection plays one match with its own Instance on its own thread, the matches are
+ * played back-to-back and concurrently.
+ */
+class MatchHost(port: Int) {
+
+    private val _serverSocket = ServerSocket()
+
+    @Volatile
+    private var _running = true
+
+    init {
+        _serverSocket.reuseAddress = true
+        _serverSocket.bind(InetSocketAddress(InetAddress.getLoopbackAddress(), port))
+    }
+
+    /**
+     * Accepts the control connections until a SHUTDOWN request is received.
+     */
+    fun serve() {
+        println("Match host ready on port ${_serverSocket.localPort}.")
+        System.out.flush()
+        while (_running) {
+            val connection = try {
+                _serverSocket.accept()
+            } catch (exc: SocketException) {
+                // closed by a SHUTDOWN request
+                break
+            }
+            thread(name = "match-${connection.port}") { handle(connection) }
+        }
+    }
+
+    private fun handle(connection: Socket) {
+        connection.use {
+            val input = BufferedReader(InputStreamReader(it.getInputStream(), Charsets.UTF_8))
+            val output = PrintWriter(OutputStreamWriter(it.getOutputStream(), Charsets.UTF_8), true)
+            val request = (input.readLine() ?: return).toObject<HostRequest>()
+            when (request.request) {
+                PLAY -> play(request, output)
+                SHUTDOWN -> {
+                    _running = false
+                    _serverSocket.close()
+                    output.println(HostEvent(STOPPED).toJSON())
+                }
+                else -> output.println(HostEvent(ERROR, error = "Unknown request: ${request.request}").toJSON())
+            }
+        }
+    }
+
+    private fun play(request: HostRequest, output: PrintWriter) {
+        var client: WindowlessClient? = null
+        try {
+            if (request.file == null)
+                throw IllegalArgumentException("Please specify the save file path of the match.")
+            client = WindowlessClient(
+                request.file, request.gameTime, request.aiTime, request.commandsPerSecond, request.port,
+                request.socketPath, request.tickDeadline
+            )
+            output.println(HostEvent(READY, address = client.aiAddress).toJSON())
+            client.create()
+            val outcome = client.play()
+            output.println(HostEvent(FINISHED, results = outcome.results, aborted = outcome.aborted).toJSON())
+        } catch (exc: Exception) {
+            println("Match of ${request.file} failed.")
+            exc.printStackTrace()
+            output.println(HostEvent(ERROR, error = exc.toString()).toJSON())
+        } finally {
+            client?.close()
+        }
+    }
+
+    companion object {
+        const val PLAY = "PLAY"
+        const val SHUTDOWN = "SHUTDOWN"
+
+        const val READY = "READY"
+        const val FINISHED = "FINISHED"
+        const val STOPPED = "STOPPED"
+        const val ERROR = "ERROR"
+    }
+}
@@ -168,9 +168,16 @@ object SceneRegistry {
         _instance.registerComponent<SpawnerComponent>()
     }
 
+    /**
+     * Builds the components of a scene. The entities used to build them are released once the scene is built, as the
+     * matches of the host mode load the scene concurrently and many times.
+     */
+    @Synchronized
     fun loadScene(name: String): Scene {
         assert(sceneMap[name] != null)
-        return sceneMap[name]!!()
+        val scene = sceneMap[name]!!()
+        scene.keys.forEach { _instance.destroyEntity(it) }
+        return scene
     }
 
     private fun addWall(x: Float, y: Float, width: Float, height: Float): Entity {
@@ -6,14 +6,20 @@ import core.Signature
 import core.System
 import org.lwjgl.Sys
 import systems.*
-import kotlin.system.exitProcess
+
+/**
+ * Results of a match played by a windowless client.
+ */
+data class MatchOutcome(val results: List<ScoreResult>, val aborted: Boolean)
 
 open class WindowlessClient(
     private val gameFile: String,
     private val gameTime: Float = 60f,
     private val aiTime: Float = 60f,
     private val actionsPerSecond: Float = 4f,
-    private val port: Int = 2049
+    private val port: Int = 2049,
+    private val socketPath: String? = null,
+    private val tickDeadline: Float = 0f
 ) {
 
     private val _instance = Instance()
@@ -94,7 +100,7 @@ open class WindowlessClient(
         spawnerSignature.set(_instance.getComponentType<SpawnerComponent>(), true)
         _instance.setSystemSignature<SpawnerSystem>(spawnerSignature)
 
-        _aiSystem.initialize(aiTime, gameTime, actionsPerSecond, gameFile, port)
+        _aiSystem.initialize(aiTime, gameTime, actionsPerSecond, gameFile, port, socketPath ?: "", tickDeadline)
         val aiSignature = Signature()
         aiSignature.set(_instance.getComponentType<CommandComponent>(), true)
         _instance.setSystemSignature<PythonAISystem>(aiSignature)
@@ -107,6 +113,10 @@ open class WindowlessClient(
         println("Components and Systems are initialized.")
     }
 
+    // address the agents connect to, contains the bound port when the port 0 was requested
+    val aiAddress: String
+        get() = (_aiSystem as PythonAISystem).address
+
     fun create() {
         val scene = SceneRegistry.loadScene("baseSceneWindowless")
         scene.forEach { (_, components) ->
@@ -120,7 +130,7 @@ open class WindowlessClient(
         for (i in 0..1) addAgent()
     }
 
-    fun play() {
+    fun play(): MatchOutcome {
         val deltaTime = 1.0f / 60.0f
         var tickCounter = 0
         val aiModulo = (60 / actionsPerSecond).toInt()
@@ -146,11 +156,17 @@ open class WindowlessClient(
         if (!_aiSystem.aborted()) {
             (_aiSystem).finish(gameResult)
             println("Game finished, game results are: $gameResult")
-            exitProcess(0)
         } else {
             println("Game aborted, game results are: $gameResult")
-            exitProcess(0)
         }
+        return MatchOutcome(gameResult, _aiSystem.aborted())
+    }
+
+    /**
+     * Stops listening for the agents, the process keeps running in host mode.
+     */
+    fun close() {
+        (_aiSystem as PythonAISystem).close()
     }
 
     private fun addAgent() {
@@ -0,0 +1,605 @@
+package systems
+
+import com.google.gson.Gson
+import com.google.gson.JsonElement
+import com.google.gson.annotations.SerializedName
+import components.CharacterComponent
+import components.DynamicComponent
+import components.MoveCommand
+import components.PlanCommand
+import components.PlanStep
+import components.ScoreComponent
+import components.ShootCommand
+import components.StateCommand
+import components.StateComponent
+import components.States
+import components.TransformComponent
+import core.Entity
+import core.IComponent
+import core.Vec3F
+import java.io.*
+import java.nio.ByteBuffer
+import java.nio.ByteOrder
+import java.nio.MappedByteBuffer
+import java.nio.channels.FileChannel
+import java.util.UUID
+import kotlin.reflect.KClass
+import kotlin.math.max
+
+/**
+ * Handshake sent by a python agent upon connection, after its username.
+ * Legacy agents only send their team number, newer agents send this JSON document in order to
+ * negotiate the protocol used for the rest of the game.
+ */
+data class HandshakeRequest(
+    @SerializedName("team") val team: Int,
+    @SerializedName("protocol") val protocol: String?,
+    @SerializedName("subscription") val subscription: Subscription? = null
+) : JSONConvertable
+
+/**
+ * Subset of the snapshots an agent is interested in, declared in its handshake. Every value is optional:
+ * - other players: all of them (default), only the nearest one or none,
+ * - projectiles: whether the projectiles are sent, and the radius around the controlled player they are culled to,
+ * - skipped fields: fields of the records that are not sent (the position is always sent). They are removed from the
+ *   JSON messages and never sent as deltas, the binary records keep their fixed layout.
+ */
+data class Subscription(
+    @SerializedName("other_players") val otherPlayers: String? = null,
+    @SerializedName("projectiles") val projectiles: Boolean? = null,
+    @SerializedName("projectile_radius") val projectileRadius: Float? = null,
+    @SerializedName("skip_fields") val skipFields: List<String>? = null
+) : JSONConvertable {
+
+    companion object {
+        const val ALL = "all"
+        const val NEAREST = "nearest"
+        const val NONE = "none"
+    }
+
+    val skippedFields: Set<String>
+        get() = skipFields.orEmpty().filter { it != "pos" }.toSet()
+}
+
+/**
+ * Answer of the server to a JSON handshake, containing the protocol that will be used along with its options.
+ */
+data class HandshakeMessage(
+    @SerializedName("protocol") val protocol: String,
+    @SerializedName("options") val options: Map<String, Any>? = null
+) :
+    AIMessage(MessageHeaders.HANDSHAKE), JSONConvertable
+
+/**
+ * Wire protocol used to exchange the snapshots and the commands with a python agent.
+ */
+interface AIProtocol {
+
+    fun sendSnapshot(snapshot: SnapshotData)
+
+    fun receiveCommand(): StateCommand
+
+    /**
+     * Sends a message that does not carry a snapshot (game finished, abort).
+     */
+    fun sendMessage(message: AIMessage)
+
+    /**
+     * Options sent to the agent along with the accepted protocol during the handshake.
+     */
+    val handshakeOptions: Map<String, Any>?
+        get() = null
+
+    /**
+     * Releases the resources of the protocol once the connection is closed.
+     */
+    fun close() {
+    }
+}
+
+object AIProtocols {
+
+    const val JSON = "json"
+
+    const val BINARY = "binary"
+
+    const val SHARED_MEMORY = "shm"
+
+    const val DELTA = "delta"
+
+    fun parseHandshake(line: String): HandshakeRequest {
+        return if (line.trimStart().startsWith("{"))
+            line.toObject<HandshakeRequest>()
+        else
+            HandshakeRequest(Integer.parseInt(line.trim()), null)
+    }
+
+    /**
+     * Chooses the protocol asked by the agent if it is supported, and falls back to JSON otherwise.
+     * Legacy handshakes (team number only) do not expect any answer and always use JSON.
+     */
+    fun negotiate(client: AIConnection, input: BufferedReader, request: HandshakeRequest): AIProtocol {
+        if (request.protocol == null)
+            return JsonAIProtocol(client, input)
+
+        val accepted = when (request.protocol) {
+            BINARY -> BINARY
+            SHARED_MEMORY -> SHARED_MEMORY
+            DELTA -> DELTA
+            else -> JSON
+        }
+        val skippedFields = request.subscription?.skippedFields.orEmpty()
+        val protocol = when (accepted) {
+            BINARY -> BinaryAIProtocol(client)
+            SHARED_MEMORY -> SharedMemoryAIProtocol(client)
+            DELTA -> DeltaAIProtocol(client, skippedFields)
+            else -> JsonAIProtocol(client, input, skippedFields)
+        }
+
+        // the answer is not followed by a blank line, binary frames can start right after it
+        val output = PrintWriter(client.outputStream, true)
+        output.println(HandshakeMessage(accepted, protocol.handshakeOptions).toJSON())
+        output.flush()
+
+        return protocol
+    }
+}
+
+/**
+ * Line-based JSON protocol, each message is followed by a blank line.
+ * The fields skipped by the subscription of the agent are removed from the players and the projectiles.
+ */
+class JsonAIProtocol(
+    client: AIConnection,
+    private val input: BufferedReader,
+    private val skippedFields: Set<String> = emptySet()
+) : AIProtocol {
+
+    private val _output = PrintWriter(client.outputStream, true)
+
+    private val _gson = Gson()
+
+    override val handshakeOptions: Map<String, Any>?
+        get() = if (skippedFields.isEmpty()) null else mapOf("skip_fields" to skippedFields.toList())
+
+    private fun removeSkippedFields(record: JsonElement) {
+        skippedFields.forEach { record.asJsonObject.remove(it) }
+    }
+
+    override fun sendSnapshot(snapshot: SnapshotData) {
+        if (skippedFields.isEmpty()) {
+            sendMessage(AskCommandMessage(snapshot))
+            return
+        }
+        val message = _gson.toJsonTree(AskCommandMessage(snapshot)).asJsonObject
+        val snapshotTree = message.getAsJsonObject("snapshot")
+        removeSkippedFields(snapshotTree.get("controlledPlayer"))
+        snapshotTree.getAsJsonArray("otherPlayers").forEach { removeSkippedFields(it) }
+        snapshotTree.getAsJsonArray("projectiles").forEach { removeSkippedFields(it) }
+        _output.println(_gson.toJson(message) + "\n")
+        _output.flush()
+    }
+
+    override fun receiveCommand(): StateCommand {
+        val serializedResult = input.readLine() ?: throw EOFException("Agent closed the connection.")
+        return parseCommand(serializedResult, true)
+    }
+
+    private fun parseCommand(serializedResult: String, planAllowed: Boolean): StateCommand {
+        // gets the base class from the command
+        val aiCommand = serializedResult.toObject<AICommand>()
+
+        // parses the result
+        return when (aiCommand.commandType) {
+            "MOVE" -> {
+                val moveCommand = serializedResult.toObject<AIMoveCommand>()
+                val direction = moveCommand.moveDirection
+                MoveCommand(Vec3F(direction[0], direction[1], direction[2]))
+            }
+            "SHOOT" -> {
+                val shootCommand = serializedResult.toObject<AIShootCommand>()
+                val angle = shootCommand.shootDirection
+                ShootCommand(angle)
+            }
+            "PLAN" -> {
+                if (!planAllowed)
+                    throw IllegalArgumentException("Nested plan.")
+                val planCommand = serializedResult.toObject<AIPlanCommand>()
+                val steps = (planCommand.steps ?: throw IllegalArgumentException("Plan without steps.")).map {
+                    PlanStep(it.ticks, parseCommand(it.command.toString(), false))
+                }
+                PlanCommand(steps, planCommand.interruptOnDamage ?: true, planCommand.projectileRadius)
+            }
+            else -> {
+                throw IllegalArgumentException("Invalid command type.")
+            }
+        }
+    }
+
+    override fun sendMessage(message: AIMessage) {
+        _output.println(message.toJSON() + "\n")
+        _output.flush()
+    }
+}
+
+/**
+ * Compact binary protocol. Every message is a frame made of its size (little-endian uint32) followed by its body.
+ *
+ * The body of a snapshot starts with the message type, the number of other players and the number of projectiles,
+ * followed by fixed-layout little-endian records for the controlled player, the other players and the projectiles.
+ * Finished and abort messages contain the message type followed by the JSON document of the message.
+ * Commands sent back by the agent contain the command type followed by its values. A plan contains its flags (the
+ * first bit interrupts it on damage), its projectile radius (negative without projectile trigger) and its number of
+ * steps, followed by the steps: their number of ticks and their command.
+ */
+open class BinaryAIProtocol(client: AIConnection) : AIProtocol {
+
+    companion object {
+        const val ASK_COMMAND = 1
+        const val GAME_FINISHED = 2
+        const val ABORT = 3
+
+        const val INVALID_COMMAND = 0
+        const val MOVE_COMMAND = 1
+        const val SHOOT_COMMAND = 2
+        const val PLAN_COMMAND = 4
+
+        const val PLAN_INTERRUPT_ON_DAMAGE = 1
+
+        const val SNAPSHOT_HEADER_SIZE = 12
+
+        // position (3 floats), speed (3 floats), health (float), team (int), score (float), state (int)
+        const val PLAYER_RECORD_SIZE = 40
+
+        // position (3 floats), speed (3 floats)
+        const val PROJECTILE_RECORD_SIZE = 24
+
+        fun snapshotSize(snapshot: SnapshotData): Int =
+            SNAPSHOT_HEADER_SIZE + PLAYER_RECORD_SIZE * (1 + snapshot.otherPlayers.size) +
+                    PROJECTILE_RECORD_SIZE * snapshot.projectiles.size
+
+        fun putVector(buffer: ByteBuffer, vector: Vec3F) {
+            buffer.putFloat(vector.x)
+            buffer.putFloat(vector.y)
+            buffer.putFloat(vector.z)
+        }
+
+        fun putPlayer(buffer: ByteBuffer, player: PlayerData) {
+            putVector(buffer, player.pos)
+            putVector(buffer, player.speed)
+            buffer.putFloat(player.health)
+            buffer.putInt(player.team)
+            buffer.putFloat(player.score)
+            buffer.putInt(player.state.ordinal)
+        }
+
+        fun putProjectile(buffer: ByteBuffer, projectile: ProjectileData) {
+            putVector(buffer, projectile.pos)
+            putVector(buffer, projectile.speed)
+        }
+
+        /**
+         * Writes the snapshot records (without the frame size) inside the buffer.
+         */
+        fun putSnapshot(buffer: ByteBuffer, snapshot: SnapshotData) {
+            buffer.putInt(ASK_COMMAND)
+            buffer.putInt(snapshot.otherPlayers.size)
+            buffer.putInt(snapshot.projectiles.size)
+            putPlayer(buffer, snapshot.controlledPlayer)
+            snapshot.otherPlayers.forEach { putPlayer(buffer, it) }
+            snapshot.projectiles.forEach { putProjectile(buffer, it) }
+        }
+
+        fun parseCommand(buffer: ByteBuffer, planAllowed: Boolean = true): StateCommand {
+            return when (buffer.int) {
+                MOVE_COMMAND -> MoveCommand(Vec3F(buffer.float, buffer.float, buffer.float))
+                SHOOT_COMMAND -> ShootCommand(buffer.float)
+                PLAN_COMMAND -> if (planAllowed) parsePlan(buffer) else throw IllegalArgumentException("Nested plan.")
+                else -> throw IllegalArgumentException("Invalid command type.")
+            }
+        }
+
+        private fun parsePlan(buffer: ByteBuffer): PlanCommand {
+            val flags = buffer.int
+            val projectileRadius = buffer.float
+            val nbSteps = buffer.int
+            // each step takes at least 8 bytes, the number of steps cannot be larger than the frame
+            if (nbSteps < 0 || nbSteps > buffer.remaining() / 8)
+                throw IllegalArgumentException("Invalid number of plan steps: $nbSteps")
+            val steps = List(nbSteps) { PlanStep(buffer.int, parseCommand(buffer, false)) }
+            return PlanCommand(
+                steps,
+                flags and PLAN_INTERRUPT_ON_DAMAGE != 0,
+                if (projectileRadius >= 0f) projectileRadius else null
+            )
+        }
+    }
+
+    private val _output = BufferedOutputStream(client.outputStream)
+
+    private val _input = DataInputStream(BufferedInputStream(client.inputStream))
+
+    // the buffers are reused between the snapshots and only grow when needed, the commands have their own buffer as
+    // they are received by another thread in real-time mode
+    private var _buffer = ByteBuffer.allocate(1024).order(ByteOrder.LITTLE_ENDIAN)
+
+    private var _inputBuffer = ByteBuffer.allocate(64).order(ByteOrder.LITTLE_ENDIAN)
+
+    protected fun prepareBuffer(size: Int): ByteBuffer {
+        if (_buffer.capacity() < size) {
+            _buffer = ByteBuffer.allocate(max(size, _buffer.capacity() * 2)).order(ByteOrder.LITTLE_ENDIAN)
+        }
+        _buffer.clear()
+        return _buffer
+    }
+
+    protected fun writeBuffer() {
+        _output.write(_buffer.array(), 0, _buffer.position())
+        _output.flush()
+    }
+
+    override fun sendSnapshot(snapshot: SnapshotData) {
+        val bodySize = snapshotSize(snapshot)
+        val buffer = prepareBuffer(4 + bodySize)
+        buffer.putInt(bodySize)
+        putSnapshot(buffer, snapshot)
+        writeBuffer()
+    }
+
+    /**
+     * Reads the next frame sent by the agent and returns its body.
+     */
+    protected fun readFrame(): ByteBuffer {
+        val size = Integer.reverseBytes(_input.readInt())
+        if (_inputBuffer.capacity() < size) {
+            _inputBuffer = ByteBuffer.allocate(max(size, _inputBuffer.capacity() * 2)).order(ByteOrder.LITTLE_ENDIAN)
+        }
+        _inputBuffer.clear()
+        _input.readFully(_inputBuffer.array(), 0, size)
+        _inputBuffer.limit(size)
+        return _inputBuffer
+    }
+
+    override fun receiveCommand(): StateCommand {
+        return parseCommand(readFrame())
+    }
+
+    override fun sendMessage(message: AIMessage) {
+        val messageType = when (message.header) {
+            MessageHeaders.GAME_FINISHED -> GAME_FINISHED
+            MessageHeaders.ABORT -> ABORT
+            else -> throw IllegalArgumentException("Unsupported binary message: ${message.header}")
+        }
+        val document = message.toJSON().toByteArray(Charsets.UTF_8)
+        val buffer = prepareBuffer(8 + document.size)
+        buffer.putInt(4 + document.size)
+        buffer.putInt(messageType)
+        buffer.put(document)
+        writeBuffer()
+    }
+}
+
+/**
+ * Binary protocol where the snapshots and the commands are exchanged through a memory-mapped file shared with the
+ * agent, for the agents running on the same host as the server.
+ *
+ * The file contains a ring of fixed-size snapshot slots followed by a ring of command slots. Each snapshot is written
+ * in place inside the next slot, using the records of the binary protocol, and the socket is only used as doorbell:
+ * the server sends a SNAPSHOT_SLOT frame containing the slot index, the agent writes its command inside the matching
+ * command slot and answers with a COMMAND_SLOT frame. Snapshots larger than a slot, invalid commands and the other
+ * messages are sent through the socket exactly as the binary protocol does.
+ */
+class SharedMemoryAIProtocol(
+    client: AIConnection,
+    private val nbSlots: Int = DEFAULT_NB_SLOTS,
+    private val slotSize: Int = DEFAULT_SLOT_SIZE
+) : BinaryAIProtocol(client) {
+
+    companion object {
+        const val SNAPSHOT_SLOT = 4
+        const val COMMAND_SLOT = 3
+
+        const val DEFAULT_NB_SLOTS = 4
+        const val DEFAULT_SLOT_SIZE = 65536
+
+        // command type followed by at most 3 floats
+        const val COMMAND_SLOT_SIZE = 64
+    }
+
+    private val _file: File = File.createTempFile("challenge-", ".shm")
+
+    // the mapping stays valid once the file is closed
+    private val _map: MappedByteBuffer = RandomAccessFile(_file, "rw").use {
+        it.channel.map(FileChannel.MapMode.READ_WRITE, 0, nbSlots.toLong() * (slotSize + COMMAND_SLOT_SIZE))
+    }
+
+    // view of the command slots with its own position, the commands can be read while a snapshot is written
+    private val _commandView: ByteBuffer = _map.duplicate().order(ByteOrder.LITTLE_ENDIAN)
+
+    private var _nextSlot = 0
+
+    init {
+        _file.deleteOnExit()
+        _map.order(ByteOrder.LITTLE_ENDIAN)
+    }
+
+    override fun close() {
+        // the mapping stays valid until it is collected, the file is not needed anymore
+        _file.delete()
+    }
+
+    override val handshakeOptions: Map<String, Any>
+        get() = mapOf(
+            "path" to _file.absolutePath,
+            "nb_slots" to nbSlots,
+            "slot_size" to slotSize,
+            "command_slot_size" to COMMAND_SLOT_SIZE
+        )
+
+    override fun sendSnapshot(snapshot: SnapshotData) {
+        if (snapshotSize(snapshot) > slotSize) {
+            super.sendSnapshot(snapshot)
+            return
+        }
+        val slot = _nextSlot
+        _nextSlot = (_nextSlot + 1) % nbSlots
+
+        _map.clear()
+        _map.position(slot * slotSize)
+        putSnapshot(_map, snapshot)
+
+        val buffer = prepareBuffer(12)
+        buffer.putInt(8)
+        buffer.putInt(SNAPSHOT_SLOT)
+        buffer.putInt(slot)
+        writeBuffer()
+    }
+
+    override fun receiveCommand(): StateCommand {
+        val buffer = readFrame()
+        if (buffer.getInt(0) != COMMAND_SLOT)
+            return parseCommand(buffer)
+
+        val slot = buffer.getInt(4)
+        if (slot < 0 || slot >= nbSlots)
+            throw IllegalArgumentException("Invalid command slot: $slot")
+        _commandView.clear()
+        _commandView.position(nbSlots * slotSize + slot * COMMAND_SLOT_SIZE)
+        return parseCommand(_commandView)
+    }
+}
+
+/**
+ * Binary protocol sending only what changed since the previous snapshot, the agent keeps a mirror of the game.
+ *
+ * Each player and projectile is identified by its entity. The changed values are found by a ChangeRecord, like the
+ * network system does for the remote clients. A DELTA_SNAPSHOT body contains the message type, the entity of the
+ * controlled player, the number of removed entities and the number of groups, followed by the removed entities and
+ * the groups. The changed entities are grouped by kind and change mask (one bit per field of the records): a group
+ * contains its kind, mask and size, the entities and then their records packed with the changed fields only.
+ * The entities added since the previous snapshot are sent with all their fields. The fields skipped by the
+ * subscription of the agent are never sent.
+ */
+class DeltaAIProtocol(
+    client: AIConnection,
+    private val skippedFields: Set<String> = emptySet()
+) : BinaryAIProtocol(client) {
+
+    companion object {
+        const val DELTA_SNAPSHOT = 5
+
+        const val PLAYER_KIND = 0
+        const val PROJECTILE_KIND = 1
+
+        const val DELTA_HEADER_SIZE = 16
+        const val GROUP_HEADER_SIZE = 12
+
+        // fields of the records, the index of a field is its bit inside the change masks
+        val PLAYER_FIELDS = listOf("pos", "speed", "health", "team", "score", "state")
+        val PROJECTILE_FIELDS = listOf("pos", "speed")
+
+        fun networkID(entity: Entity): UUID = UUID(0L, entity.toLong())
+
+        fun fieldSize(value: Any): Int = if (value is Vec3F) 12 else 4
+
+        fun putField(buffer: ByteBuffer, value: Any) {
+            when (value) {
+                is Vec3F -> putVector(buffer, value)
+                is Float -> buffer.putFloat(value)
+                is Int -> buffer.putInt(value)
+                is States -> buffer.putInt(value.ordinal)
+                else -> throw IllegalArgumentException("Unsupported delta field: $value")
+            }
+        }
+    }
+
+    /**
+     * Changed entities sharing the same kind and change mask.
+     */
+    private class ChangeGroup(val kind: Int, val mask: Int) {
+        val entities = ArrayList<Entity>()
+        val values = ArrayList<Any>()
+
+        fun size(): Int = GROUP_HEADER_SIZE + 4 * entities.size + values.sumOf { fieldSize(it) }
+    }
+
+    private val _changeRecord = ServerNetworkSystem.ChangeRecord()
+
+    // kind of the entities known by the agent
+    private var _knownEntities = HashMap<Entity, Int>()
+
+    private fun addChange(id: UUID, componentType: KClass<out IComponent>, field: String, value: Any) {
+        if (field !in skippedFields)
+            _changeRecord.addChange(id, componentType, field, value)
+    }
+
+    private fun recordPlayer(player: PlayerData) {
+        val id = networkID(player.entity)
+        // the vectors are copied, the components are updated in place
+        addChange(id, TransformComponent::class, "pos", Vec3F(player.pos))
+        addChange(id, DynamicComponent::class, "speed", Vec3F(player.speed))
+        addChange(id, CharacterComponent::class, "health", player.health)
+        addChange(id, ScoreComponent::class, "team", player.team)
+        addChange(id, ScoreComponent::class, "score", player.score)
+        addChange(id, StateComponent::class, "state", player.state)
+    }
+
+    private fun recordProjectile(projectile: ProjectileData) {
+        val id = networkID(projectile.entity)
+        addChange(id, TransformComponent::class, "pos", Vec3F(projectile.pos))
+        addChange(id, DynamicComponent::class, "speed", Vec3F(projectile.speed))
+    }
+
+    private fun groupChanges(changes: NetworkedProperties, kinds: Map<Entity, Int>): Collection<ChangeGroup> {
+        val groups = LinkedHashMap<Pair<Int, Int>, ChangeGroup>()
+        changes.forEach { (id, components) ->
+            val entity = id.leastSignificantBits.toInt()
+            val kind = kinds[entity]!!
+            val values = HashMap<String, Any>()
+            components.values.forEach { values.putAll(it) }
+
+            val fields = if (kind == PLAYER_KIND) PLAYER_FIELDS else PROJECTILE_FIELDS
+            val changed = fields.mapNotNull { values[it] }
+            var mask = 0
+            fields.forEachIndexed { index, field -> if (field in values) mask = mask or (1 shl index) }
+
+            val group = groups.getOrPut(Pair(kind, mask)) { ChangeGroup(kind, mask) }
+            group.entities.add(entity)
+            group.values.addAll(changed)
+        }
+        return groups.values
+    }
+
+    override fun sendSnapshot(snapshot: SnapshotData) {
+        val players = listOf(snapshot.controlledPlayer) + snapshot.otherPlayers
+        val currentEntities = HashMap<Entity, Int>()
+        players.forEach { currentEntities[it.entity] = PLAYER_KIND }
+        snapshot.projectiles.forEach { currentEntities[it.entity] = PROJECTILE_KIND }
+
+        // an entity reused with another kind is removed and added again, with all its fields
+        val removed = _knownEntities.filter { (entity, kind) -> currentEntities[entity] != kind }.keys.toList()
+        removed.forEach { _changeRecord.removeEntity(networkID(it)) }
+        players.forEach { recordPlayer(it) }
+        snapshot.projectiles.forEach { recordProjectile(it) }
+        _knownEntities = currentEntities
+
+        val groups = groupChanges(_changeRecord.commit(), currentEntities)
+
+        val bodySize = DELTA_HEADER_SIZE + 4 * removed.size + groups.sumOf { it.size() }
+        val buffer = prepareBuffer(4 + bodySize)
+        buffer.putInt(bodySize)
+        buffer.putInt(DELTA_SNAPSHOT)
+        buffer.putInt(snapshot.controlledPlayer.entity)
+        buffer.putInt(removed.size)
+        buffer.putInt(groups.size)
+        removed.forEach { buffer.putInt(it) }
+        groups.forEach { group ->
+            buffer.putInt(group.kind)
+            buffer.putInt(group.mask)
+            buffer.putInt(group.entities.size)
+            group.entities.forEach { buffer.putInt(it) }
+            group.values.forEach { putField(buffer, it) }
+        }
+        writeBuffer()
+    }
+}
@@ -10,15 +10,16 @@ import java.io.*
 import java.lang.Exception
 import java.lang.RuntimeException
 import java.lang.reflect.Type
-import java.net.ServerSocket
-import java.net.Socket
 import java.time.Duration
 import java.time.Instant
 import java.util.*
+import java.util.concurrent.LinkedBlockingQueue
 import java.util.concurrent.TimeUnit
 import java.util.concurrent.TimeoutException
 import kotlin.collections.ArrayList
 import kotlin.collections.HashMap
+import kotlin.concurrent.thread
+import kotlin.math.max
 
 
 // JSON serialization solution from
@@ -32,18 +33,21 @@ inline fun <reified T : JSONConvertable> String.toObject(): T = Gson().fromJson(
 
 
 // Snapshot data classes to send to the python AI agent
+// the entity is only used by the delta protocol to identify the records, it is not serialized
 data class PlayerData(
     @SerializedName("pos") val pos: Vec3F,
     @SerializedName("speed") val speed: Vec3F,
     @SerializedName("state") val state: States,
     @SerializedName("health") val health: Float,
     @SerializedName("team") val team: Int,
-    @SerializedName("score") val score: Float
+    @SerializedName("score") val score: Float,
+    @Transient val entity: Entity = -1
 ) : JSONConvertable
 
 data class ProjectileData(
     @SerializedName("pos") val pos: Vec3F,
-    @SerializedName("speed") val speed: Vec3F
+    @SerializedName("speed") val speed: Vec3F,
+    @Transient val entity: Entity = -1
 ) : JSONConvertable
 
 data class SnapshotData(
@@ -62,11 +66,23 @@ data class AIMoveCommand(@SerializedName("move_direction") val moveDirection: Li
 data class AIShootCommand(@SerializedName("shoot_angle") val shootDirection: Float) :
     AICommand("SHOOT"), JSONConvertable
 
+data class AIPlanStep(
+    @SerializedName("ticks") val ticks: Int,
+    @SerializedName("command") val command: JsonObject
+) : JSONConvertable
+
+data class AIPlanCommand(
+    @SerializedName("steps") val steps: List<AIPlanStep>?,
+    @SerializedName("interrupt_on_damage") val interruptOnDamage: Boolean?,
+    @SerializedName("projectile_radius") val projectileRadius: Float?
+) : AICommand("PLAN"), JSONConvertable
+
 // Messages sent to the python AI to ask for a new command or notice the end of the game.
 enum class MessageHeaders : JSONConvertable {
     ASK_COMMAND,
     GAME_FINISHED,
-    ABORT
+    ABORT,
+    HANDSHAKE
 }
 
 abstract class AIMessage(@SerializedName("header") val header: MessageHeaders) : JSONConvertable
@@ -84,97 +100,173 @@ data class AbortMessage(
     AIMessage(MessageHeaders.ABORT), JSONConvertable
 
 class PythonClient(
-    private val client: Socket,
+    private val client: AIConnection,
     private val username: String,
     val entity: Entity,
     private val team: Int,
-    private var time: Float
+    private var time: Float,
+    private val protocol: AIProtocol,
+    private val subscription: Subscription = Subscription(),
+    tickDeadline: Float = 0f
 ) {
 
+    private class ReceivedCommand(val command: StateCommand?, val error: Exception?)
+
     private var _remainingTimeNs = (time * 10e9f).toLong()
     init {
         println("Initialized python client with time: $time, - $_remainingTimeNs")
     }
 
+    // plan sent by the agent, its remaining steps and the remaining ticks of the current step
+    private var _plan: PlanCommand? = null
+    private val _planSteps: Queue<PlanStep> = LinkedList()
+    private var _step: PlanStep? = null
+    private var _stepTicks = 0
+
+    // health of the controlled player on the previous tick, to detect the damages
+    private var _previousHealth: Float? = null
+
+    // command of the current tick given by the plan
+    private var _plannedCommand: StateCommand? = null
+
+    private var _lastMoveCommand: MoveCommand? = null
+
+    // in real-time mode, the commands are received by a dedicated thread while the game keeps running
+    private val _receivedCommands = LinkedBlockingQueue<ReceivedCommand>()
+
+    private val _commandReader: Thread? =
+        if (tickDeadline > 0f) thread(isDaemon = true, name = "$username-commands") { receiveCommandsForever() } else null
+
     fun pollActions(instance: Instance): StateCommand {
-        // streams to send/receive messages
-        val output = PrintWriter(client.getOutputStream(), true)
-        val input = BufferedReader(InputStreamReader(client.getInputStream()))
+        sendSnapshot(instance)
+        return receiveCommand(null)
+    }
 
-        // Retrieves the game state and serialized it before sending it to the python AI.
+    /**
+     * Sends the snapshot of the current tick to the agent, unless the command is given by its plan.
+     */
+    fun sendSnapshot(instance: Instance) {
+        // the steps of the current plan are issued without asking the agent, until a trigger fires
+        if (!planInterrupted(instance)) {
+            _plannedCommand = nextPlannedCommand()
+            if (_plannedCommand != null) return
+        }
+        cancelPlan()
+
+        // Retrieves the game state and sends it to the python AI.
         val snapshotData = gatherSnapshot(instance)
-        // serializes the data
-        val askCommandMessage = AskCommandMessage(snapshotData)
-        val serializedData = askCommandMessage.toJSON()
+        protocol.sendSnapshot(snapshotData)
+    }
 
-        // sends the data to the client
-        output.println(serializedData + "\n")
-        output.flush()
+    /**
+     * Returns the command of the current tick. In real-time mode, the command must be received before the deadline
+     * (System.nanoTime), otherwise the last move command is applied again (the shots are not repeated).
+     */
+    fun receiveCommand(deadline: Long?): StateCommand {
+        val plannedCommand = _plannedCommand
+        _plannedCommand = null
+        val command = plannedCommand ?: receiveAgentCommand(deadline)
+        if (command is MoveCommand)
+            _lastMoveCommand = command
+        return command
+    }
 
+    private fun receiveAgentCommand(deadline: Long?): StateCommand {
         // waits for the result to come
         val beginTime = Instant.now()
-        val serializedResult = input.readLine()
+        val command = if (deadline != null) receiveCommandBefore(deadline) else protocol.receiveCommand()
         val duration = Duration.between(beginTime, Instant.now()).toNanos()
         _remainingTimeNs -= duration
 
-        // gets the base class from the command
-        val aiCommand = serializedResult.toObject<AICommand>()
+        if (command is PlanCommand) {
+            startPlan(command)
+            return nextPlannedCommand()!!
+        }
+        return command
+    }
 
-        // parses the result
-        return when (aiCommand.commandType) {
-            "MOVE" -> {
-                val moveCommand = serializedResult.toObject<AIMoveCommand>()
-                val direction = moveCommand.moveDirection
-                MoveCommand(Vec3F(direction[0], direction[1], direction[2]))
-            }
-            "SHOOT" -> {
-                val shootCommand = serializedResult.toObject<AIShootCommand>()
-                val angle = shootCommand.shootDirection
-                ShootCommand(angle)
-            }
-            else -> {
-                throw IllegalArgumentException("Invalid command type.")
-            }
+    private fun receiveCommandsForever() {
+        try {
+            while (true)
+                _receivedCommands.put(ReceivedCommand(protocol.receiveCommand(), null))
+        } catch (exc: Exception) {
+            // the connection is closed at the end of the game as well
+            _receivedCommands.put(ReceivedCommand(null, exc))
         }
     }
 
-    private fun gatherSnapshot(instance: Instance): SnapshotData {
+    private fun receiveCommandBefore(deadline: Long): StateCommand {
+        var received = _receivedCommands.poll(max(deadline - System.nanoTime(), 0L), TimeUnit.NANOSECONDS)
+        // only the most recent command is applied when the agent sent several of them
+        var command: StateCommand? = null
+        while (received != null) {
+            if (received.error != null)
+                throw received.error
+            command = received.command
+            received = _receivedCommands.poll()
+        }
+        return command ?: _lastMoveCommand ?: MoveCommand(Vec3F(0f, 0f, 0f))
+    }
 
-        // Retrieves all the projectiles in the game
-        val projectileSystem = instance.getSystem<ProjectileSystem>()
-        val projectiles = ArrayList<ProjectileData>()
-        projectileSystem.entities.forEach {
-            val projectileComponent =
-                instance.getComponentDynamicUnsafe(it, ProjectileComponent::class)
-            if (projectileComponent != null) {
-                val transformComponent = instance.getComponent<TransformComponent>(it)
-                val dynamicComponent = instance.getComponent<DynamicComponent>(it)
-                projectiles.add(ProjectileData(transformComponent.pos, dynamicComponent.speed))
-            }
+    private fun startPlan(plan: PlanCommand) {
+        if (plan.steps.isEmpty())
+            throw IllegalArgumentException("Empty plan.")
+        plan.steps.forEach {
+            if (it.ticks < 1)
+                throw IllegalArgumentException("Invalid number of ticks in plan step: ${it.ticks}")
+            if (it.command is PlanCommand)
+                throw IllegalArgumentException("Nested plans are not supported.")
         }
+        _plan = plan
+        _planSteps.addAll(plan.steps)
+    }
 
-        val scoreSystem = instance.getSystem<ScoreSystem>()
-        val otherPlayers = ArrayList<PlayerData>()
-        scoreSystem.entities.forEach {
-            val characterComponent =
-                instance.getComponentDynamicUnsafe(it, CharacterComponent::class)
-            if (characterComponent != null && it != entity) {
-                val characterComponentCasted = characterComponent as CharacterComponent
-                val transformComponent = instance.getComponent<TransformComponent>(it)
-                val dynamicComponent = instance.getComponent<DynamicComponent>(it)
-                val stateComponent = instance.getComponent<StateComponent>(it)
-                val scoreComponent = instance.getComponent<ScoreComponent>(it)
-                val playerData = PlayerData(
-                    transformComponent.pos,
-                    dynamicComponent.speed,
-                    stateComponent.state,
-                    characterComponentCasted.health,
-                    scoreComponent.team,
-                    scoreComponent.score
-                )
-                otherPlayers.add(playerData)
-            }
+    private fun cancelPlan() {
+        _plan = null
+        _planSteps.clear()
+        _step = null
+        _stepTicks = 0
+    }
+
+    private fun nextPlannedCommand(): StateCommand? {
+        if (_stepTicks == 0) {
+            val step = _planSteps.poll() ?: return null
+            _step = step
+            _stepTicks = step.ticks
         }
+        _stepTicks -= 1
+        return _step!!.command
+    }
+
+    private fun planInterrupted(instance: Instance): Boolean {
+        val health = instance.getComponent<CharacterComponent>(entity).health
+        val damaged = _previousHealth != null && health < _previousHealth!!
+        _previousHealth = health
+
+        val plan = _plan ?: return false
+        if (plan.interruptOnDamage && damaged)
+            return true
+        val projectileRadius = plan.projectileRadius ?: return false
+        return projectileIncoming(instance, projectileRadius)
+    }
+
+    /**
+     * Whether a projectile within the radius moves toward the controlled player (the projectiles it just shot move
+     * away from it).
+     */
+    private fun projectileIncoming(instance: Instance, radius: Float): Boolean {
+        val position = instance.getComponent<TransformComponent>(entity).pos
+        val projectileSystem = instance.getSystem<ProjectileSystem>()
+        return projectileSystem.entities.any {
+            if (instance.getComponentDynamicUnsafe(it, ProjectileComponent::class) == null)
+                return@any false
+            val offset = position - instance.getComponent<TransformComponent>(it).pos
+            val speed = instance.getComponent<DynamicComponent>(it).speed
+            offset.norm() <= radius && offset.x * speed.x + offset.y * speed.y + offset.z * speed.z > 0f
+        }
+    }
+
+    private fun gatherSnapshot(instance: Instance): SnapshotData {
 
         val controlledPlayerTransformComponent = instance.getComponent<TransformComponent>(entity)
         val controlledPlayerDynamicComponent = instance.getComponent<DynamicComponent>(entity)
@@ -187,27 +279,102 @@ class PythonClient(
             controlledPlayerStateComponent.state,
             controlledPlayerCharacterComponent.health,
             controlledPlayerScoreComponent.team,
-            controlledPlayerScoreComponent.score
+            controlledPlayerScoreComponent.score,
+            entity
         )
+        val controlledPosition = controlledPlayerTransformComponent.pos
+
+        // Retrieves the projectiles in the game the agent subscribed to
+        val projectiles = ArrayList<ProjectileData>()
+        if (subscription.projectiles != false) {
+            val projectileSystem = instance.getSystem<ProjectileSystem>()
+            val projectileRadius = subscription.projectileRadius
+            projectileSystem.entities.forEach {
+                val projectileComponent =
+                    instance.getComponentDynamicUnsafe(it, ProjectileComponent::class)
+                if (projectileComponent != null) {
+                    val transformComponent = instance.getComponent<TransformComponent>(it)
+                    if (projectileRadius == null || (transformComponent.pos - controlledPosition).norm() <= projectileRadius) {
+                        val dynamicComponent = instance.getComponent<DynamicComponent>(it)
+                        projectiles.add(ProjectileData(transformComponent.pos, dynamicComponent.speed, it))
+                    }
+                }
+            }
+        }
+
+        val otherPlayers = ArrayList<PlayerData>()
+        if (subscription.otherPlayers != Subscription.NONE) {
+            val scoreSystem = instance.getSystem<ScoreSystem>()
+            scoreSystem.entities.forEach {
+                val characterComponent =
+                    instance.getComponentDynamicUnsafe(it, CharacterComponent::class)
+                if (characterComponent != null && it != entity) {
+                    val characterComponentCasted = characterComponent as CharacterComponent
+                    val transformComponent = instance.getComponent<TransformComponent>(it)
+                    val dynamicComponent = instance.getComponent<DynamicComponent>(it)
+                    val stateComponent = instance.getComponent<StateComponent>(it)
+                    val scoreComponent = instance.getComponent<ScoreComponent>(it)
+                    val playerData = PlayerData(
+                        transformComponent.pos,
+                        dynamicComponent.speed,
+                        stateComponent.state,
+                        characterComponentCasted.health,
+                        scoreComponent.team,
+                        scoreComponent.score,
+                        it
+                    )
+                    otherPlayers.add(playerData)
+                }
+            }
+            if (subscription.otherPlayers == Subscription.NEAREST && otherPlayers.size > 1) {
+                val nearestPlayer = otherPlayers.minByOrNull { (it.pos - controlledPosition).norm() }!!
+                otherPlayers.retainAll { it === nearestPlayer }
+            }
+        }
+
         return SnapshotData(controllerPlayer, otherPlayers, projectiles)
     }
 
     fun abort(message: String, blame: String) {
-        val abortMessage = AbortMessage(message, blame)
-        val serializedMessage = abortMessage.toJSON()
-        val output = PrintWriter(client.getOutputStream(), true)
-        output.println(serializedMessage + "\n")
-        Thread.sleep(500)
-        client.close()
+        protocol.sendMessage(AbortMessage(message, blame))
+        closeAfterAck()
     }
 
     fun finished(results: List<ScoreResult>) {
-        val gameFinishedMessage = GameFinishedMessage(results)
-        val serializedMessage = gameFinishedMessage.toJSON()
-        val output = PrintWriter(client.getOutputStream(), true)
-        output.println(serializedMessage + "\n")
-        Thread.sleep(500)
+        protocol.sendMessage(GameFinishedMessage(results))
+        closeAfterAck()
+    }
+
+    /**
+     * Closes the connection once the agent closed its side, which acknowledges the last message (closing first could
+     * reset the connection before the agent reads it). The agents keeping their connection open are waited for at
+     * most CLOSE_TIMEOUT_MS.
+     */
+    private fun closeAfterAck() {
+        try {
+            client.shutdownOutput()
+            // in real-time mode, the command reader stops at the end of the stream
+            val reader = _commandReader ?: thread(isDaemon = true, name = "$username-close") { readUntilClosed() }
+            reader.join(CLOSE_TIMEOUT_MS)
+        } catch (exc: IOException) {
+            // the agent already closed the connection
+        }
         client.close()
+        protocol.close()
+    }
+
+    private fun readUntilClosed() {
+        val buffer = ByteArray(4096)
+        try {
+            while (client.inputStream.read(buffer) >= 0) {
+            }
+        } catch (exc: IOException) {
+            // reset by the agent
+        }
+    }
+
+    companion object {
+        const val CLOSE_TIMEOUT_MS = 2000L
     }
 }
 
@@ -329,7 +496,9 @@ class PythonAISystem : System() {
 
     private var _port = 0
 
-    private var _serverSocket: ServerSocket? = null
+    private var _socketPath: String? = null
+
+    private var _server: AIServer? = null
 
     private val _clients = HashMap<String, PythonClient>()
 
@@ -347,22 +516,35 @@ class PythonAISystem : System() {
 
     private var _aborted: Boolean = false
 
+    // per-tick deadline of the commands in milliseconds, the game waits for each command when it is 0
+    private var _tickDeadline = 0f
+
     // used to save the timestamps of the commands
     private var _timeCounter = 0f
 
+    val address: String
+        get() = _server!!.address
+
     fun addAgent(instance: Instance): AgentData {
         try {
-            println("Waiting for an agent to connect on port $_port.")
-            val client = _serverSocket!!.accept()
-            println("Client accepted with address: ${client.inetAddress}")
-            val inputStream = BufferedReader(InputStreamReader(client.getInputStream()))
+            println("Waiting for an agent to connect on ${_server!!.address}.")
+            val client = _server!!.accept()
+            println("Client accepted with address: ${client.description}")
+            val inputStream = BufferedReader(InputStreamReader(client.inputStream))
 
             // gets the username, this operation is blocking and waits for the python script to connect
             val username = inputStream.readLine()
-            val team = Integer.parseInt(inputStream.readLine())
+            // gets the team, or the handshake document of the agents negotiating the protocol
+            val handshake = AIProtocols.parseHandshake(inputStream.readLine())
+            val team = handshake.team
             if (username != null && username != "" && username != "\n") {
+                val protocol = AIProtocols.negotiate(client, inputStream, handshake)
+                println("Agent $username uses the ${protocol::class.simpleName} protocol.")
                 val entity = instance.createEntity()
-                _clients[username] = PythonClient(client, username, entity, team, _aiTime!!)
+                _clients[username] = PythonClient(
+                    client, username, entity, team, _aiTime!!, protocol,
+                    handshake.subscription ?: Subscription(), _tickDeadline
+                )
                 _usernameToEntity[username] = entity
                 println(
                     "Agent connected with username: $username and team: $team." +
@@ -389,8 +571,14 @@ class PythonAISystem : System() {
             _commandsPerSecond = arg[2] as Float
             _savePath = arg[3] as String
             _port = arg[4] as Int
+            // an empty socket path keeps the default TCP transport
+            _socketPath = if (arg.size > 5) arg[5] as String else null
+            _tickDeadline = if (arg.size > 6) arg[6] as Float else 0f
 
-            _serverSocket = ServerSocket(_port)
+            _server = AITransports.openServer(_port, _socketPath)
+            // the connections are queued by the server from now on, the agents can connect
+            println("AI server ready on ${_server!!.address}.")
+            System.out.flush()
 
             _commandSave.commandsPerSecond = _commandsPerSecond!!
             _commandSave.aiTime = _aiTime!!
@@ -402,16 +590,34 @@ class PythonAISystem : System() {
     }
 
     override fun updateLogic(instance: Instance, delta: Float) {
+        // in real-time mode, the snapshots are sent to every client before waiting for their commands until the deadline
+        val deadline = if (_tickDeadline > 0f) System.nanoTime() + (_tickDeadline * 1e6f).toLong() else null
+        if (deadline != null && !forEachClient(instance) { _, client -> client.sendSnapshot(instance) })
+            return
+
         // gives the game state and ask for each client the action to play (game state command)
+        val polled = forEachClient(instance) { username, client ->
+            val command = if (deadline != null) client.receiveCommand(deadline) else client.pollActions(instance)
+            _commandSave.addCommand(command, _timeCounter, client.entity)
+            val entity = _usernameToEntity[username]!!
+            val commandComponent = instance.getComponent<CommandComponent>(entity)
+            if (commandComponent.controllerType == ControllerType.AI) {
+                commandComponent.commands.add(command)
+            }
+        }
+        if (!polled)
+            return
+        // updates the time counter
+        _timeCounter += delta
+    }
+
+    /**
+     * Calls the action for each client, the game is aborted when the action fails.
+     */
+    private fun forEachClient(instance: Instance, action: (String, PythonClient) -> Unit): Boolean {
         _clients.forEach { (username, client) ->
             try {
-                val command = client.pollActions(instance)
-                _commandSave.addCommand(command, _timeCounter, client.entity)
-                val entity = _usernameToEntity[username]!!
-                val commandComponent = instance.getComponent<CommandComponent>(entity)
-                if (commandComponent.controllerType == ControllerType.AI) {
-                    commandComponent.commands.add(command)
-                }
+                action(username, client)
             } catch (exc: Exception) {
                 println("Exception occurred when parsing the action for user: $username")
                 exc.printStackTrace()
@@ -421,11 +627,10 @@ class PythonAISystem : System() {
                     "Exception occurred when parsing the action for user $username:\n${exc}",
                     username
                 )
-                return
+                return false
             }
         }
-        // updates the time counter
-        _timeCounter += delta
+        return true
     }
 
     override fun onEntityAdded(entity: Entity) {
@@ -454,6 +659,10 @@ class PythonAISystem : System() {
     fun saveToFile() {
         _commandSave.saveToFile(_savePath!!)
     }
+
+    fun close() {
+        _server?.close()
+    }
 }
 
 class ReplaySystem : System() {
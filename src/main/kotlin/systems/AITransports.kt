@@ -0,0 +1,164 @@
+package systems
+
+import java.io.Closeable
+import java.io.File
+import java.io.InputStream
+import java.io.OutputStream
+import java.net.InetSocketAddress
+import java.net.ProtocolFamily
+import java.net.ServerSocket
+import java.net.Socket
+import java.net.SocketAddress
+import java.net.StandardProtocolFamily
+import java.nio.channels.Channels
+import java.nio.channels.ServerSocketChannel
+import java.nio.channels.SocketChannel
+import java.nio.file.Files
+import java.nio.file.Path
+
+/**
+ * Connection with a python agent, independent of the transport used to reach it.
+ */
+interface AIConnection : Closeable {
+
+    val inputStream: InputStream
+
+    val outputStream: OutputStream
+
+    val description: String
+
+    /**
+     * Closes the sending side of the connection, the agent reads the end of the stream after the last message.
+     */
+    fun shutdownOutput()
+}
+
+/**
+ * Server accepting the connections of the python agents.
+ */
+interface AIServer : Closeable {
+
+    val address: String
+
+    fun accept(): AIConnection
+}
+
+class TcpAIConnection(private val socket: Socket) : AIConnection {
+
+    override val inputStream: InputStream = socket.getInputStream()
+
+    override val outputStream: OutputStream = socket.getOutputStream()
+
+    override val description: String
+        get() = socket.inetAddress.toString()
+
+    override fun shutdownOutput() {
+        socket.shutdownOutput()
+    }
+
+    override fun close() {
+        socket.close()
+    }
+}
+
+private fun unixProtocolFamily(): ProtocolFamily = StandardProtocolFamily.valueOf("UNIX")
+
+private fun unixSocketAddress(path: Path): SocketAddress =
+    Class.forName("java.net.UnixDomainSocketAddress").getMethod("of", Path::class.java).invoke(null, path) as SocketAddress
+
+class ChannelAIConnection(private val channel: SocketChannel, override val description: String) : AIConnection {
+
+    override val inputStream: InputStream = Channels.newInputStream(channel)
+
+    override val outputStream: OutputStream = Channels.newOutputStream(channel)
+
+    override fun shutdownOutput() {
+        channel.shutdownOutput()
+    }
+
+    override fun close() {
+        channel.close()
+    }
+}
+
+/**
+ * Default transport, the agents connect to the loopback TCP port. The system picks a free port when the port is 0,
+ * the address contains the bound port.
+ */
+class TcpAIServer(port: Int) : AIServer {
+
+    private val _serverSocket = ServerSocket()
+
+    init {
+        // the port of the previous match can be bound again while its connections are in TIME_WAIT
+        _serverSocket.reuseAddress = true
+        _serverSocket.bind(InetSocketAddress(port))
+    }
+
+    override val address: String = "port ${_serverSocket.localPort}"
+
+    override fun accept(): AIConnection = TcpAIConnection(_serverSocket.accept())
+
+    override fun close() {
+        _serverSocket.close()
+    }
+}
+
+/**
+ * Unix domain socket transport, for agents running on the same host as the server (requires Java 16+).
+ * A file left by a previous server at the same path is replaced, and the file is removed when the server exits.
+ * The jar targets Java 15, so the unix domain socket classes are loaded reflectively.
+ */
+class UnixAIServer(private val path: String) : AIServer {
+
+    private val _channel: ServerSocketChannel
+
+    init {
+        AITransports.requireUnixSockets()
+        val socketFile = File(path)
+        Files.deleteIfExists(socketFile.toPath())
+        _channel = ServerSocketChannel.open(unixProtocolFamily())
+        _channel.bind(unixSocketAddress(socketFile.toPath()))
+        socketFile.deleteOnExit()
+    }
+
+    override val address: String = "socket $path"
+
+    override fun accept(): AIConnection = ChannelAIConnection(_channel.accept(), path)
+
+    override fun close() {
+        _channel.close()
+        Files.deleteIfExists(File(path).toPath())
+    }
+}
+
+object AITransports {
+
+    /**
+     * First Java version providing the unix domain socket channels.
+     */
+    const val UNIX_SOCKETS_JAVA_VERSION = 16
+
+    /**
+     * Throws when the running JVM cannot open the unix domain socket transport.
+     */
+    @JvmStatic
+    fun requireUnixSockets() {
+        val version = Runtime.version().feature()
+        if (version < UNIX_SOCKETS_JAVA_VERSION)
+            throw UnsupportedOperationException(
+                "The unix domain socket transport (--socket) requires Java $UNIX_SOCKETS_JAVA_VERSION or later, " +
+                        "the server runs on Java $version. Use the TCP port instead."
+            )
+    }
+
+    /**
+     * Opens a unix domain socket server when a socket path is given, and a TCP server otherwise.
+     */
+    fun openServer(port: Int, socketPath: String?): AIServer {
+        return if (socketPath.isNullOrEmpty())
+            TcpAIServer(port)
+        else
+            UnixAIServer(socketPath)
+    }
+}
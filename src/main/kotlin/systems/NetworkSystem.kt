@@ -132,6 +132,15 @@ class ServerNetworkSystem : System() {
             _lastSentChanges[entity]!![componentType]!![valueName] = value
         }
 
+        /**
+         * Forgets the values sent for a removed entity, all its values will be sent again if it comes back.
+         */
+        fun removeEntity(entity: UUID) {
+            cleanCommit()
+            _lastSentChanges.remove(entity)
+            _committedChanges.remove(entity)
+        }
+
         /**
          * Checks wherever a change was already sent, and adds it to the committed changes if not.
          */